@@ -2,7 +2,7 @@
 
 python3 -m venv my-venv
 
-my-venv/bin/pip install chromadb sentence-transformers langchain python-dotenv requests fastapi uvicorn
+my-venv/bin/pip install chromadb "sentence-transformers[onnx]" langchain python-dotenv requests fastapi uvicorn gunicorn httpx prometheus-client pyarrow
 
 source my-venv/bin/activate
 
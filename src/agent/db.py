@@ -0,0 +1,331 @@
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+import mysql.connector
+from mysql.connector import FieldType
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = int(os.getenv("DB_PORT", 3306))
+DB_USER = os.getenv("DB_USER", "appuser")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "example")
+DB_NAME = os.getenv("DB_NAME", "appdb")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+# Idle connections older than this are pinged (and reconnected) before reuse
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", 60))
+# Seconds a connection waits for the server before giving up on a statement; this also
+# ends statements that MAX_EXECUTION_TIME does not cover (e.g. ones blocked on a lock)
+DB_READ_TIMEOUT = float(os.getenv("DB_READ_TIMEOUT", 60))
+DB_SCHEMA_TTL = float(os.getenv("DB_SCHEMA_TTL", 300))
+# Limits on the rows returned to the LLM by one tool call
+DB_RESULT_MAX_ROWS = int(os.getenv("DB_RESULT_MAX_ROWS", 100))
+DB_RESULT_MAX_BYTES = int(os.getenv("DB_RESULT_MAX_BYTES", 16000))
+DB_FETCH_SIZE = int(os.getenv("DB_FETCH_SIZE", 100))
+# Rows past the limits that are still counted for total_rows before giving up
+DB_COUNT_MAX_ROWS = int(os.getenv("DB_COUNT_MAX_ROWS", 10000))
+
+# Table and column names of the current database in one round trip
+SCHEMA_QUERY = ("SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, ORDINAL_POSITION")
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no pooled connection becomes free within the pool timeout.
+    """
+
+
+def connect_mysql():
+    # autocommit, so a reused connection never reads from a stale transaction snapshot
+    return mysql.connector.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        autocommit=True,
+        read_timeout=DB_READ_TIMEOUT
+    )
+
+
+class ConnectionPool:
+    """
+    Size-bounded pool of database connections shared by the agent's tools.
+    Connections are opened on demand, at most size of them, and reused; callers wait up
+    to timeout seconds when all are in use. A connection that failed with one of
+    broken_errors (lost connection, server gone away) is closed instead of reused.
+    """
+
+    def __init__(
+        self,
+        connect: Callable = connect_mysql,
+        size: int = DB_POOL_SIZE,
+        timeout: float = DB_POOL_TIMEOUT,
+        ping_after: float = DB_POOL_PING_AFTER,
+        broken_errors: tuple = (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+    ):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.broken_errors = broken_errors
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []  # [(connection, last used)], most recently used last
+        self._discarded = set()  # ids of checked-out connections to close on return
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _checkout(self):
+        with self._lock:
+            conn, last_used = self._idle.pop() if self._idle else (None, 0.0)
+        if conn is not None and time.monotonic() - last_used > self.ping_after and hasattr(conn, "ping"):
+            try:
+                conn.ping(reconnect=True, attempts=1)
+            except self.broken_errors:
+                # Replaced by a new connection below
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+        if conn is None:
+            conn = self._connect()
+            with self._lock:
+                self.created += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks a connection out for the duration of the with block.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"No database connection free after {self.timeout}s (pool size {self.size})")
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except self.broken_errors:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                with self._lock:
+                    discard = id(conn) in self._discarded
+                    self._discarded.discard(id(conn))
+                    if not discard:
+                        self._idle.append((conn, time.monotonic()))
+                if discard:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._slots.release()
+
+    def discard(self, conn):
+        """
+        Closes a checked-out connection when it is returned instead of reusing it,
+        e.g. one with a half-read result set.
+        """
+        with self._lock:
+            self._discarded.add(id(conn))
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "created": self.created, "idle": len(self._idle)}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the shared pool for the DB_* settings, creating it on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+class SchemaCache:
+    """
+    Table and column names of the database, read with one information_schema query and
+    kept for ttl seconds. Call invalidate() after DDL so the next lookup reloads them.
+    """
+
+    def __init__(self, pool: Optional[ConnectionPool] = None, ttl: float = DB_SCHEMA_TTL):
+        self.pool = pool
+        self.ttl = ttl
+        self._tables: Optional[Dict[str, List[str]]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def tables(self) -> Dict[str, List[str]]:
+        """
+        Returns {table: [column, ...]}, in table and column order.
+        """
+        with self._lock:
+            if self._tables is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._tables = self._load()
+                self._loaded_at = time.monotonic()
+                self.loads += 1
+            return self._tables
+
+    def _load(self) -> Dict[str, List[str]]:
+        tables = {}
+        with (self.pool or get_pool()).connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(SCHEMA_QUERY)
+                for table, column in cur.fetchall():
+                    tables.setdefault(table, []).append(column)
+        return tables
+
+    def table_names(self) -> List[str]:
+        return list(self.tables())
+
+    def describe(self) -> str:
+        """
+        Schema summary for the system prompt, one line per table.
+        """
+        return '\n'.join(f"表 {table} 字段: {', '.join(columns)}" for table, columns in self.tables().items())
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
+
+
+schema_cache = SchemaCache()
+
+
+def json_value(value: Any) -> Any:
+    """
+    Converts a column value to the closest JSON type: DECIMAL to a number (a string
+    when a float would lose digits), dates and times to ISO 8601, binary to text or hex.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Decimal):
+        if value == value.to_integral_value() and abs(value) < 2 ** 53:
+            return int(value)
+        return float(value) if len(value.as_tuple().digits) <= 15 else str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        # MySQL TIME columns
+        seconds = int(value.total_seconds())
+        sign = "-" if seconds < 0 else ""
+        hours, rest = divmod(abs(seconds), 3600)
+        return f"{sign}{hours:02d}:{rest // 60:02d}:{rest % 60:02d}"
+    if isinstance(value, (bytes, bytearray)):
+        try:
+            return bytes(value).decode("utf-8")
+        except UnicodeDecodeError:
+            return "0x" + bytes(value).hex()
+    if isinstance(value, (set, frozenset)):
+        # MySQL SET columns
+        return sorted(value)
+    return str(value)
+
+def with_max_execution_time(query: str, milliseconds: int) -> str:
+    """
+    Adds a MAX_EXECUTION_TIME optimizer hint to a SELECT, so MySQL aborts it after
+    milliseconds. Other databases read the hint as a comment.
+    """
+    if milliseconds <= 0 or "MAX_EXECUTION_TIME" in query.upper():
+        return query
+    return re.sub(r"^\s*select\b", lambda match: f"{match.group(0)} /*+ MAX_EXECUTION_TIME({milliseconds}) */",
+                  query, count=1, flags=re.IGNORECASE)
+
+def _column_types(description) -> Optional[List[str]]:
+    types = [FieldType.get_info(column[1]) if isinstance(column[1], int) else None for column in description]
+    return types if any(types) else None
+
+def _close_quietly(cursor):
+    try:
+        cursor.close()
+    except Exception:
+        pass
+
+def stream_select(
+    query: str,
+    offset: int = 0,
+    max_rows: int = DB_RESULT_MAX_ROWS,
+    max_bytes: int = DB_RESULT_MAX_BYTES,
+    pool: Optional[ConnectionPool] = None
+) -> dict:
+    """
+    Runs query on an unbuffered cursor, so rows are streamed from the server DB_FETCH_SIZE
+    at a time, and keeps rows offset+1 onwards until max_rows rows or max_bytes of row JSON
+    (the first row is always kept). Rows past the limits are counted, up to DB_COUNT_MAX_ROWS,
+    but not kept; if even more remain the connection is dropped instead of reading them.
+    Returns {"columns", "types", "rows", "truncated", "total_rows" or "total_rows_at_least"}.
+    """
+    pool = pool or get_pool()
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query)
+            columns = [column[0] for column in cursor.description]
+            types = _column_types(cursor.description)
+            rows, size, seen, truncated, complete = [], 0, 0, False, False
+            while True:
+                batch = cursor.fetchmany(DB_FETCH_SIZE)
+                if not batch:
+                    complete = True
+                    break
+                for row in batch:
+                    seen += 1
+                    if seen <= offset or truncated:
+                        continue
+                    values = [json_value(value) for value in row]
+                    cost = len(json.dumps(values, ensure_ascii=False).encode("utf-8"))
+                    if len(rows) >= max_rows or (rows and size + cost > max_bytes):
+                        truncated = True
+                        continue
+                    rows.append(values)
+                    size += cost
+                if truncated and seen - offset - len(rows) > DB_COUNT_MAX_ROWS:
+                    break
+        except Exception:
+            _close_quietly(cursor)
+            raise
+        if complete:
+            cursor.close()
+        else:
+            pool.discard(conn)
+
+    result = {"columns": columns, "rows": rows, "truncated": truncated}
+    if types:
+        result["types"] = types
+    if complete:
+        result["total_rows"] = seen
+    else:
+        result["total_rows_at_least"] = seen
+    return result
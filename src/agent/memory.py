@@ -0,0 +1,157 @@
+import os
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+# Reuse the token estimate of the RAG service (src/context.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from context import estimate_tokens
+
+# Tokens of history (system prompt included) sent with each model call
+AGENT_TOKEN_BUDGET = int(os.getenv("AGENT_TOKEN_BUDGET", 6000))
+# Tool results of earlier turns are cut to this many characters
+AGENT_OLD_TOOL_RESULT_CHARS = int(os.getenv("AGENT_OLD_TOOL_RESULT_CHARS", 300))
+# Characters kept of each question and answer in the summary of dropped turns
+AGENT_SUMMARY_CHARS = int(os.getenv("AGENT_SUMMARY_CHARS", 200))
+# Overhead of the role and separators of a message, in tokens
+MESSAGE_OVERHEAD = 4
+
+
+def as_dict(message: Any) -> Dict[str, Any]:
+    """
+    Turns an OpenAI ChatCompletionMessage into the plain dict sent back to the API,
+    keeping only the fields the API expects.
+    """
+    if isinstance(message, dict):
+        return message
+    result = {"role": message.role, "content": message.content}
+    if getattr(message, "tool_calls", None):
+        result["tool_calls"] = [{
+            "id": tool_call.id,
+            "type": "function",
+            "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}
+        } for tool_call in message.tool_calls]
+    return result
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    tokens = MESSAGE_OVERHEAD + estimate_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        tokens += estimate_tokens(tool_call["function"]["name"] + tool_call["function"]["arguments"])
+    return tokens
+
+def shorten(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...[{len(text) - limit} more characters dropped]"
+
+def shorten_to_tokens(text: str, limit: int) -> str:
+    """
+    shorten() with the limit in estimated tokens (a few more for the "dropped" marker).
+    """
+    if estimate_tokens(text) <= limit:
+        return text
+    # The estimate only grows with the prefix, so look for the longest prefix that fits
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    return shorten(text, low)
+
+def summarize_turns(turns: List[List[Dict[str, Any]]]) -> str:
+    """
+    Default summary of dropped turns: each question with its final answer, shortened.
+    """
+    lines = []
+    for turn in turns:
+        question = turn[0].get("content") or ""
+        answers = [m.get("content") for m in turn[1:] if m["role"] == "assistant" and m.get("content")]
+        line = f"Q: {shorten(question, AGENT_SUMMARY_CHARS)}"
+        if answers:
+            line += f" A: {shorten(answers[-1], AGENT_SUMMARY_CHARS)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """
+    Conversation history of one session, kept within a token budget.
+
+    The system prompt is always kept. When the history grows past the budget, tool
+    results of earlier turns are cut down first. If that is not enough, the oldest
+    turns are dropped whole (so tool calls stay paired with their results) and folded
+    into one summary message. The current turn is never compacted.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        token_budget: int = AGENT_TOKEN_BUDGET,
+        old_tool_result_chars: int = AGENT_OLD_TOOL_RESULT_CHARS,
+        summarize: Callable[[List[List[Dict[str, Any]]]], str] = summarize_turns
+    ):
+        """
+        Args:
+            system_prompt: Instructions sent first in every request
+            token_budget: Estimated tokens the history may use, system prompt included
+            old_tool_result_chars: Characters kept of tool results from earlier turns
+            summarize: Turns a list of dropped turns into summary text
+        """
+        self.system = {"role": "system", "content": system_prompt}
+        self.token_budget = token_budget
+        self.old_tool_result_chars = old_tool_result_chars
+        self.summarize = summarize
+        self.summary: Optional[str] = None
+        self.turns: List[List[Dict[str, Any]]] = []  # each starts with a user message
+
+    def add(self, message: Any):
+        """
+        Appends a message; a user message starts a new turn.
+        """
+        message = as_dict(message)
+        if message["role"] == "user" or not self.turns:
+            self.turns.append([message])
+        else:
+            self.turns[-1].append(message)
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        """
+        The history as it is sent to the model.
+        """
+        messages = [self.system]
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        for turn in self.turns:
+            messages.extend(turn)
+        return messages
+
+    def tokens(self) -> int:
+        return sum(message_tokens(message) for message in self.messages)
+
+    def window(self) -> List[Dict[str, Any]]:
+        """
+        Compacts the history to the token budget and returns the messages to send.
+        """
+        if self.tokens() > self.token_budget:
+            self._compact_tool_results()
+        while len(self.turns) > 1 and self.tokens() > self.token_budget:
+            summary = "\n".join(filter(None, [self.summary, self.summarize([self.turns.pop(0)])]))
+            # Keep the summary to a quarter of the budget, dropping its oldest lines first
+            limit = self.token_budget // 4
+            lines = summary.split("\n")
+            while len(lines) > 1 and estimate_tokens("\n".join(lines)) > limit:
+                lines.pop(0)
+            self.summary = shorten_to_tokens("\n".join(lines), limit)
+        return self.messages
+
+    def _compact_tool_results(self):
+        for turn in self.turns[:-1]:
+            for message in turn:
+                if message["role"] == "tool" and len(message.get("content") or "") > self.old_tool_result_chars:
+                    message["content"] = shorten(message["content"], self.old_tool_result_chars)
+
+    def clear(self):
+        self.summary = None
+        self.turns = []
@@ -1,21 +1,39 @@
 import json
 import mysql.connector
-import wikipedia
 from typing import Dict, List, Any, Optional
 import openai
 from dotenv import load_dotenv
 import os
 import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from db import get_pool, schema_cache, stream_select, with_max_execution_time
+
+# Reuse the TTL/LRU cache of the RAG service (src/cache.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import TTLCache
+from memory import ConversationMemory
+from wiki import get_wikipedia_tool
 
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_GPT_MODEL = os.getenv("OPENAI_GPT_MODEL", "gpt-4o")
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = int(os.getenv("DB_PORT", 3306))
-DB_USER = os.getenv("DB_USER", "appuser")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "example")
-DB_NAME = os.getenv("DB_NAME", "appdb")
+# MySQL error number for "Table doesn't exist": the cached schema may be out of date
+ER_NO_SUCH_TABLE = 1146
+# Truncated results that can be continued with fetch_more_rows
+RESULT_PAGE_HANDLES = int(os.getenv("RESULT_PAGE_HANDLES", 256))
+RESULT_PAGE_TTL = float(os.getenv("RESULT_PAGE_TTL", 900))
+# Tool calls of one model turn run concurrently on at most this many threads
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", 8))
+# Seconds a tool call may take; override per tool with e.g. SEARCH_WIKIPEDIA_TIMEOUT
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", 30))
+# Conversations kept in memory, and seconds an idle one is kept
+AGENT_MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", 1000))
+AGENT_SESSION_TTL = float(os.getenv("AGENT_SESSION_TTL", 3600))
 
 # First, we define how the LLM should understand our tools
 tools = [
@@ -25,7 +43,10 @@ tools = [
             "name": "query_database",
             "description": """Execute a MySQL SELECT query and return the results.
                             Only SELECT queries are allowed for security reasons.
-                            Returns data in JSON format.""",
+                            Returns JSON with "columns" and "rows" (one list of values per row).
+                            Large results are truncated: "truncated" is true, "total_rows"
+                            gives the full count and "next_page" can be passed to
+                            fetch_more_rows. Prefer aggregates or LIMIT over large scans.""",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -42,6 +63,26 @@ tools = [
             "strict": True
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "fetch_more_rows",
+            "description": """Fetch the next rows of a truncated query_database result.
+                            Only call this when the rows already returned are not enough.""",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "next_page": {
+                        "type": "string",
+                        "description": "The next_page value of the truncated result"
+                    }
+                },
+                "required": ["next_page"],
+                "additionalProperties": False
+            },
+            "strict": True
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -66,22 +107,36 @@ tools = [
 ]
 
 def get_table_schema():
-    conn = mysql.connector.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME
-    )
-    schema_info = []
-    with conn.cursor() as cur:
-        cur.execute("SHOW TABLES")
-        tables = [row[0] for row in cur.fetchall()]
-        for table in tables:
-            cur.execute(f"SHOW COLUMNS FROM {table}")
-            columns = [row[0] for row in cur.fetchall()]
-            schema_info.append(f"表 {table} 字段: {', '.join(columns)}")
-    return '\n'.join(schema_info)
+    """
+    Returns the schema summary used in the system prompt, from the schema cache.
+    """
+    return schema_cache.describe()
+
+# 简单模糊匹配：将 SQL 语句中的表名与实际表名做近似替换（如复数转单数）
+def match_table(word: str, table_names: List[str]) -> str:
+    # 完全匹配
+    if word in table_names:
+        return word
+    # 复数转单数（只允许 tasks->task，不允许 task->tasks）
+    if word.endswith('s') and word[:-1] in table_names:
+        return word[:-1]
+    # 忽略大小写匹配
+    for t in table_names:
+        if word.lower() == t.lower():
+            return t
+    return word  # 不变
+
+def resolve_table_names(query: str, table_names: List[str]) -> str:
+    """
+    Replaces table names after FROM/JOIN with the closest actual table name.
+    """
+    # 用正则查找 SQL 语句中的表名并替换
+    def table_replacer(match):
+        # 保证替换后有空格
+        return f"{match.group(1)} {match_table(match.group(2), table_names)}{match.group(3)}"
+
+    # 只替换 FROM/JOIN 后的表名，允许 FROMtasks/JOINtasks 也能被识别
+    return re.sub(r'(from|join)\s*([a-zA-Z0-9_]+)(\b)', table_replacer, query, flags=re.IGNORECASE)
 
 # Now implement the actual tool functions
 def query_database(query: str) -> str:
@@ -96,58 +151,16 @@ def query_database(query: str) -> str:
         })
 
     try:
-        # You should use environment variables for these in production
-        conn = mysql.connector.connect(
-            host="localhost",
-            port=3306,
-            user="appuser",
-            password="example",
-            database="appdb"
-        )
-
-        # 获取所有表名
-        with conn.cursor() as cur:
-            cur.execute("SHOW TABLES")
-            table_rows = cur.fetchall()
-            table_names = [row[0] for row in table_rows]
-
-        # 简单模糊匹配：将 SQL 语句中的表名与实际表名做近似替换（如复数转单数）
-        def match_table(word):
-            # 完全匹配
-            if word in table_names:
-                return word
-            # 复数转单数（只允许 tasks->task，不允许 task->tasks）
-            if word.endswith('s') and word[:-1] in table_names:
-                return word[:-1]
-            # 忽略大小写匹配
-            for t in table_names:
-                if word.lower() == t.lower():
-                    return t
-            return word  # 不变
-
-        # 用正则查找 SQL 语句中的表名并替换
-        def table_replacer(match):
-            # 保证替换后有空格
-            return f"{match.group(1)} {match_table(match.group(2))}{match.group(3)}"
-
-        # 只替换 FROM/JOIN 后的表名，允许 FROMtasks/JOINtasks 也能被识别
-        query = re.sub(r'(from|join)\s*([a-zA-Z0-9_]+)(\b)', table_replacer, query, flags=re.IGNORECASE)
+        # 表名来自缓存的 schema，不再每次执行 SHOW TABLES
+        query = resolve_table_names(query, schema_cache.table_names())
 
         print(f"Executing query: {query}")
 
-        with conn.cursor() as cur:
-            cur.execute(query)
-            columns = [desc[0] for desc in cur.description]
-            results = []
-            for row in cur.fetchall():
-                results.append(dict(zip(columns, row)))
-            return json.dumps({
-                "success": True,
-                "data": str(results),
-                "row_count": len(results)
-            })
+        return json.dumps(select_page(query), ensure_ascii=False)
 
     except mysql.connector.Error as e:
+        if e.errno == ER_NO_SUCH_TABLE:
+            schema_cache.invalidate()
         return json.dumps({
             "error": f"Database error: {str(e)}"
         })
@@ -155,63 +168,65 @@ def query_database(query: str) -> str:
         return json.dumps({
             "error": f"Unexpected error: {str(e)}"
         })
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
-def search_wikipedia(query: str) -> str:
-    """
-    Search Wikipedia and return a concise summary.
-    Handles disambiguation and missing pages gracefully.
-    """
-    try:
-        # Try to get the most relevant page summary
-        summary = wikipedia.summary(
-            query,
-            sentences=3,
-            auto_suggest=True,
-            redirect=True
-        )
+def tool_timeout(name: str) -> float:
+    return float(os.getenv(f"{name.upper()}_TIMEOUT", TOOL_TIMEOUT))
 
-        return json.dumps({
-            "success": True,
-            "summary": summary,
-            "url": wikipedia.page(query).url
-        })
+# Queries of truncated results, by page handle
+result_pages = TTLCache(max_size=RESULT_PAGE_HANDLES, ttl=RESULT_PAGE_TTL)
 
-    except wikipedia.DisambiguationError as e:
-        # Handle multiple matching pages
+def select_page(query: str, offset: int = 0) -> dict:
+    """
+    Runs a SELECT with bounded rows and bytes (see db.stream_select) and returns the tool
+    result. A truncated result gets a next_page handle for fetch_more_rows.
+    """
+    # The server stops the query when the tool call times out
+    timed_query = with_max_execution_time(query, int(tool_timeout("query_database") * 1000))
+    page = stream_select(timed_query, offset, pool=get_pool())
+    result = {"success": True, "offset": offset, "row_count": len(page["rows"]), **page}
+    if page["truncated"]:
+        handle = uuid.uuid4().hex[:12]
+        result_pages.set(handle, {"query": query, "offset": offset + len(page["rows"])})
+        result["next_page"] = handle
+    return result
+
+def fetch_more_rows(next_page: str) -> str:
+    """
+    Returns the next rows of a truncated query_database result as a JSON string.
+    The query is run again and the rows already returned are skipped.
+    """
+    page = result_pages.get(next_page)
+    if page is None:
         return json.dumps({
-            "error": "Disambiguation error",
-            "options": e.options[:5],  # List first 5 options
-            "message": "Topic is ambiguous. Please be more specific."
+            "error": f"Unknown or expired next_page: {next_page}. Run the query again."
         })
-    except wikipedia.PageError:
+    try:
+        return json.dumps(select_page(page["query"], page["offset"]), ensure_ascii=False)
+    except mysql.connector.Error as e:
         return json.dumps({
-            "error": "Page not found",
-            "message": f"No Wikipedia article found for: {query}"
+            "error": f"Database error: {str(e)}"
         })
     except Exception as e:
         return json.dumps({
-            "error": "Unexpected error",
-            "message": str(e)
+            "error": f"Unexpected error: {str(e)}"
         })
 
+def search_wikipedia(query: str) -> str:
+    """
+    Search Wikipedia and return a concise summary.
+    Handles disambiguation and missing pages gracefully; lookups are cached (see wiki.py).
+    """
+    return get_wikipedia_tool().search(query)
+
 def execute_sql(sql: str) -> str:
     """
     Execute an arbitrary SQL statement (for admin/debug use only).
     Returns a JSON string with success or error message.
     """
     try:
-        conn = mysql.connector.connect(
-            host="localhost",
-            port=3306,
-            user="appuser",
-            password="example",
-            database="appdb"
-        )
-        with conn.cursor() as cur:
-            cur.execute(sql)
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
             conn.commit()
         return json.dumps({
             "success": True,
@@ -226,26 +241,26 @@ def execute_sql(sql: str) -> str:
             "error": f"Unexpected error: {str(e)}"
         })
     finally:
-        if 'conn' in locals():
-            conn.close()
+        # The statement may have been DDL
+        schema_cache.invalidate()
 
-class Agent:
-    def __init__(self, system_prompt: Optional[str] = None):
-        """
-        Initialize an AI Agent with optional system prompt.
+_openai_client = None
+_openai_client_lock = threading.Lock()
 
-        Args:
-            system_prompt: Initial instructions for the AI
-        """
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url="https://api.chatanywhere.tech")
-
-        # Initialize conversation history
-        self.messages = []
-
-        # Set up system prompt if provided, otherwise use default
-        schema_info = get_table_schema()
-        print(f"\nsschema_info: {schema_info}")
-        default_prompt = f"""You are a helpful AI assistant with access to a database and Wikipedia. Follow these rules:
+def get_openai_client() -> openai.OpenAI:
+    """
+    Returns the OpenAI client shared by all sessions (and its connection pool).
+    """
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            _openai_client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url="https://api.chatanywhere.tech")
+    return _openai_client
+
+def default_system_prompt() -> str:
+    schema_info = get_table_schema()
+    print(f"\nsschema_info: {schema_info}")
+    return f"""You are a helpful AI assistant with access to a database and Wikipedia. Follow these rules:
         1. When asked about data, always check the database first. Database schema as followings
         {schema_info}
         2. For general knowledge questions, use Wikipedia
@@ -253,14 +268,29 @@ class Agent:
         4. Always mention your source of information
         5. If a tool returns an error, explain the error to the user clearly
         """
-        
-        self.messages.append({
-            "role": "system",
-            "content": system_prompt or default_prompt
-        })
+
+class Agent:
+    def __init__(self, system_prompt: Optional[str] = None, memory: Optional[ConversationMemory] = None):
+        """
+        Initialize an AI Agent with optional system prompt.
+
+        Args:
+            system_prompt: Initial instructions for the AI
+            memory: Conversation memory to use instead of a new one for the system prompt
+        """
+        self.client = get_openai_client()
+
+        # Conversation history, kept within AGENT_TOKEN_BUDGET
+        self.memory = memory or ConversationMemory(system_prompt or default_system_prompt())
+        # One question at a time per conversation
+        self.lock = threading.Lock()
 
         print(f"\nself.messages: {self.messages}")
 
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        return self.memory.messages
+
     def execute_tool(self, tool_call: Any) -> str:
         """
         Execute a tool based on the LLM's decision.
@@ -278,6 +308,8 @@ class Agent:
             # Execute the appropriate tool. Add more here as needed.
             if function_name == "query_database":
                 result = query_database(function_args["query"])
+            elif function_name == "fetch_more_rows":
+                result = fetch_more_rows(function_args["next_page"])
             elif function_name == "search_wikipedia":
                 result = search_wikipedia(function_args["query"])
             else:
@@ -296,6 +328,54 @@ class Agent:
                 "error": f"Tool execution failed: {str(e)}"
             })
 
+    def _timed_tool(self, tool_call: Any):
+        started_at = time.perf_counter()
+        result = self.execute_tool(tool_call)
+        return result, time.perf_counter() - started_at
+
+    def execute_tools(self, tool_calls: List[Any]) -> List[tuple]:
+        """
+        Execute the tool calls of one model turn concurrently.
+
+        Each call gets its own timeout (see tool_timeout), counted from when the turn's
+        calls were submitted. A call that times out is cancelled if it has not started
+        yet; otherwise its result is discarded. Every turn gets its own threads, so a
+        call that is still running after its timeout holds up no other turn or session;
+        the database read timeout (DB_READ_TIMEOUT) ends it eventually.
+
+        Args:
+            tool_calls: The tool_calls of the model's message
+
+        Returns:
+            List[tuple]: (tool_call, JSON result, seconds) in the order of tool_calls
+        """
+        submitted_at = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=min(len(tool_calls), TOOL_MAX_WORKERS) or 1,
+                                      thread_name_prefix="tool")
+        futures = [executor.submit(self._timed_tool, tool_call) for tool_call in tool_calls]
+        # Without waiting: threads of timed-out calls exit when their call returns
+        executor.shutdown(wait=False)
+        results = []
+        for tool_call, future in zip(tool_calls, futures):
+            print("Tool call:", tool_call)
+            timeout = tool_timeout(tool_call.function.name)
+            try:
+                result, seconds = future.result(timeout=max(0.0, submitted_at + timeout - time.perf_counter()))
+                print("Tool executed......")
+            except FutureTimeout:
+                future.cancel()
+                print("Execution timed out......")
+                result, seconds = json.dumps({
+                    "error": f"Tool {tool_call.function.name} timed out after {timeout:g}s"
+                }), time.perf_counter() - submitted_at
+            except Exception as e:
+                print("Execution failed......")
+                result, seconds = json.dumps({
+                    "error": f"Tool execution failed: {str(e)}"
+                }), time.perf_counter() - submitted_at
+            results.append((tool_call, result, seconds))
+        return results
+
     def process_query(self, user_input: str) -> str:
         """
         Process a user query through the AI agent.
@@ -306,8 +386,12 @@ class Agent:
         Returns:
             str: The agent's response
         """
+        with self.lock:
+            return self._process_query(user_input)
+
+    def _process_query(self, user_input: str) -> str:
         # Add user input to conversation history
-        self.messages.append({
+        self.memory.add({
             "role": "user",
             "content": user_input
         })
@@ -318,9 +402,10 @@ class Agent:
 
             while current_iteration < max_iterations:  # Limit to 5 iterations
                 current_iteration += 1
+                iteration_started_at = time.perf_counter()
                 completion = self.client.chat.completions.create(
                     model=OPENAI_GPT_MODEL,
-                    messages=self.messages,
+                    messages=self.memory.window(),
                     tools=tools,  # Global tools list from Step 1
                     tool_choice="auto"  # Let the model decide when to use tools
                 )
@@ -329,21 +414,20 @@ class Agent:
                 print(f"\n@@@@@response_message: {response_message}")
 
                 if not response_message.tool_calls:
-                    self.messages.append(response_message)
+                    self.memory.add(response_message)
                     return response_message.content
-                self.messages.append(response_message)
-                for tool_call in response_message.tool_calls:
-                    try:
-                        print("Tool call:", tool_call)
-                        result = self.execute_tool(tool_call)
-                        print("Tool executed......")
-                    except Exception as e:
-                        print("Execution failed......")
-                        result = json.dumps({
-                            "error": f"Tool execution failed: {str(e)}"
-                        })
+                self.memory.add(response_message)
+                llm_seconds = time.perf_counter() - iteration_started_at
+                tools_started_at = time.perf_counter()
+                results = self.execute_tools(response_message.tool_calls)
+                tools_seconds = time.perf_counter() - tools_started_at
+                print(f"Iteration {current_iteration}: model {llm_seconds:.2f}s, "
+                      f"{len(results)} tool calls {tools_seconds:.2f}s "
+                      f"({', '.join(f'{call.function.name} {seconds:.2f}s' for call, _, seconds in results)})")
+                # Same order as the tool_calls, so each result follows its call as before
+                for tool_call, result, _ in results:
                     print(f"Tool result custom: {result}")
-                    self.messages.append({
+                    self.memory.add({
                         "role": "tool",
                         "tool_call_id": tool_call.id,
                         "content": str(result)
@@ -355,12 +439,12 @@ class Agent:
                 "role": "assistant",
                 "content": "I've reached the maximum number of tool calls (5) without finding a complete answer. Here's what I know so far: " + response_message.content
             }
-            self.messages.append(max_iterations_message)
+            self.memory.add(max_iterations_message)
             return max_iterations_message["content"]
 
         except Exception as e:
             error_message = f"Error processing query: {str(e)}"
-            self.messages.append({
+            self.memory.add({
                 "role": "assistant",
                 "content": error_message
             })
@@ -375,12 +459,35 @@ class Agent:
         """
         return self.messages
 
-agent = Agent()
+# One Agent (and conversation) per session; idle sessions expire
+sessions = TTLCache(max_size=AGENT_MAX_SESSIONS, ttl=AGENT_SESSION_TTL)
+_sessions_lock = threading.Lock()
+
+def get_agent(session_id: str = "default") -> Agent:
+    """
+    Returns the Agent of a session, creating it (and reading the schema) on first use,
+    so importing this module needs no database.
+    """
+    with _sessions_lock:
+        agent = sessions.get(session_id)
+    if agent is None:
+        # Built outside the lock: reading the schema is a database round trip
+        agent = Agent()
+    with _sessions_lock:
+        # A concurrent request may have created the session meanwhile; keep its Agent
+        existing = sessions.get(session_id)
+        if existing is not None:
+            agent = existing
+        # Set again on every use, so the TTL counts from the last question
+        sessions.set(session_id, agent)
+    return agent
 
 # Simple question-answer interaction
-def chat_with_agent(question: str):
+def chat_with_agent(question: str, session_id: str = "default") -> str:
     print(f"\nUser: {question}")
-    print(f"Assistant: {agent.process_query(question)}")
+    answer = get_agent(session_id).process_query(question)
+    print(f"Assistant: {answer}")
+    return answer
 
 # Test MySQL connection
 if __name__ == "__main__":
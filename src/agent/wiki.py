@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import sys
+import threading
+import unicodedata
+from typing import Dict, Optional
+import wikipedia
+
+# Reuse the TTL/LRU cache of the RAG service (src/cache.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import TTLCache
+
+# "online" (the Wikipedia API) or "snapshot" (a local JSON Lines dump, no network)
+WIKIPEDIA_BACKEND = os.getenv("WIKIPEDIA_BACKEND", "online")
+WIKIPEDIA_SNAPSHOT = os.getenv("WIKIPEDIA_SNAPSHOT", "wikipedia_snapshot.jsonl")
+WIKIPEDIA_LANG = os.getenv("WIKIPEDIA_LANG", "en")
+WIKIPEDIA_SENTENCES = int(os.getenv("WIKIPEDIA_SENTENCES", 3))
+WIKIPEDIA_CACHE_SIZE = int(os.getenv("WIKIPEDIA_CACHE_SIZE", 2048))
+WIKIPEDIA_CACHE_TTL = float(os.getenv("WIKIPEDIA_CACHE_TTL", 7 * 24 * 3600))
+# SQLite file that keeps lookups across restarts; empty keeps them in memory only
+WIKIPEDIA_CACHE_PATH = os.getenv("WIKIPEDIA_CACHE_PATH", "wikipedia_cache.sqlite3")
+DISAMBIGUATION_OPTIONS = 5
+
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?。！？])\s+|(?<=[。！？])")
+
+
+def normalize_topic(topic: str) -> str:
+    """
+    Lookup key of a topic: NFKC, case-folded, underscores as spaces, whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKC", topic).replace("_", " ")
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+def first_sentences(text: str, count: int) -> str:
+    sentences = [s for s in SENTENCE_END_PATTERN.split(text.strip()) if s]
+    return " ".join(sentences[:count]) if count > 0 else text
+
+
+class OnlineBackend:
+    """
+    Looks topics up on the Wikipedia API. The page is resolved once (search, redirect)
+    and its summary and URL are both read from it.
+    """
+    name = "online"
+
+    def __init__(self, lang: str = WIKIPEDIA_LANG, sentences: int = WIKIPEDIA_SENTENCES):
+        self.lang = lang
+        self.sentences = sentences
+        wikipedia.set_lang(lang)
+
+    def lookup(self, topic: str) -> Dict:
+        """
+        Returns {"status": "found", "title", "summary", "url"}, {"status": "ambiguous",
+        "options"} or {"status": "missing"}. Network failures raise.
+        """
+        try:
+            page = wikipedia.page(topic, auto_suggest=True, redirect=True)
+        except wikipedia.DisambiguationError as e:
+            return {"status": "ambiguous", "options": e.options[:DISAMBIGUATION_OPTIONS]}
+        except wikipedia.PageError:
+            return {"status": "missing"}
+        return {"status": "found", "title": page.title, "url": page.url,
+                "summary": first_sentences(page.summary, self.sentences)}
+
+
+class SnapshotBackend:
+    """
+    Looks topics up in a local JSON Lines snapshot, one page per line:
+    {"title", "summary", "url", "aliases": [...]} or, for a disambiguation page,
+    {"title", "options": [...]}. Titles and aliases are matched after normalize_topic.
+    """
+    name = "snapshot"
+
+    def __init__(self, path: str = WIKIPEDIA_SNAPSHOT, sentences: int = WIKIPEDIA_SENTENCES):
+        self.path = path
+        self.sentences = sentences
+        self.pages = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    page = json.loads(line)
+                    for name in [page["title"]] + page.get("aliases", []):
+                        self.pages.setdefault(normalize_topic(name), page)
+
+    def lookup(self, topic: str) -> Dict:
+        page = self.pages.get(normalize_topic(topic))
+        if page is None:
+            return {"status": "missing"}
+        if page.get("options"):
+            return {"status": "ambiguous", "options": page["options"][:DISAMBIGUATION_OPTIONS]}
+        return {"status": "found", "title": page["title"], "url": page.get("url", ""),
+                "summary": first_sentences(page.get("summary", ""), self.sentences)}
+
+
+BACKENDS = {"online": OnlineBackend, "snapshot": SnapshotBackend}
+
+
+class WikipediaTool:
+    """
+    The search_wikipedia tool: one backend lookup per topic, with found pages,
+    disambiguations and misses all cached (TTL and LRU size eviction, optionally on disk).
+    """
+
+    def __init__(self, backend, cache: Optional[TTLCache] = None):
+        self.backend = backend
+        self.cache = cache if cache is not None else TTLCache(
+            max_size=WIKIPEDIA_CACHE_SIZE, ttl=WIKIPEDIA_CACHE_TTL,
+            sqlite_path=WIKIPEDIA_CACHE_PATH or None, table="wikipedia"
+        )
+        self.lookups = 0
+
+    def lookup(self, topic: str) -> Dict:
+        key = f"{self.backend.name}:{getattr(self.backend, 'lang', '')}:{normalize_topic(topic)}"
+        result = self.cache.get(key)
+        if result is None:
+            self.lookups += 1
+            result = self.backend.lookup(topic)
+            self.cache.set(key, result)
+        return result
+
+    def search(self, query: str) -> str:
+        """
+        Returns the tool result as a JSON string.
+        """
+        try:
+            result = self.lookup(query)
+        except Exception as e:
+            # Not cached, so the next call tries again
+            return json.dumps({
+                "error": "Unexpected error",
+                "message": str(e)
+            })
+        if result["status"] == "ambiguous":
+            return json.dumps({
+                "error": "Disambiguation error",
+                "options": result["options"],
+                "message": "Topic is ambiguous. Please be more specific."
+            }, ensure_ascii=False)
+        if result["status"] == "missing":
+            return json.dumps({
+                "error": "Page not found",
+                "message": f"No Wikipedia article found for: {query}"
+            }, ensure_ascii=False)
+        return json.dumps({
+            "success": True,
+            "summary": result["summary"],
+            "url": result["url"]
+        }, ensure_ascii=False)
+
+
+_tool = None
+_tool_lock = threading.Lock()
+
+def get_wikipedia_tool() -> WikipediaTool:
+    """
+    Returns the shared tool for WIKIPEDIA_BACKEND, creating it on first use.
+    """
+    global _tool
+    with _tool_lock:
+        if _tool is None:
+            _tool = WikipediaTool(BACKENDS[WIKIPEDIA_BACKEND]())
+    return _tool
@@ -0,0 +1,117 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, List
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-item encode requests and runs them as one batch.
+    A background thread waits for the first request, then keeps collecting for up to
+    max_wait_ms or until max_batch_size items are queued, calls encode_fn once on the
+    whole batch and hands each caller its own result.
+    The thread is started on first use, and started again in a forked child (e.g. a
+    gunicorn worker of a preloaded app), which does not inherit its parent's threads.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], list], max_batch_size: int = 32, max_wait_ms: float = 5):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = Counter()
+        self._max_queue_depth = 0
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, text: str) -> Future:
+        """
+        Queues one text and returns a Future resolving to its vector.
+        """
+        self._ensure_running()
+        future = Future()
+        self._queue.put((text, future))
+        depth = self._queue.qsize()
+        with self._lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+
+    def encode(self, text: str):
+        """
+        Encodes one text, blocking until its batch has run.
+        """
+        return self.submit(text).result()
+
+    def encode_many(self, texts: List[str]) -> list:
+        """
+        Encodes several texts, which may be spread across batches shared with other callers.
+        """
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        """
+        Queue depth and batch-size metrics.
+        """
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000
+            }
+
+    def _ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Requests queued in a parent process would never be answered here
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Skip requests whose caller already gave up
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                vectors = self.encode_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] += 1
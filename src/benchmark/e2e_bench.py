@@ -0,0 +1,355 @@
+"""
+Offline end-to-end benchmark of the query service.
+
+Builds a synthetic corpus of judgments, ingests it through embedding.py into a
+temporary ChromaDB, serves query.app in-process with uvicorn against a local stub
+of the Deepseek API, and drives concurrent /query load. Reports p50/p95/p99 latency
+per pipeline stage (from the `timings` of each response) and end to end, throughput,
+ingestion speed and memory.
+
+With a saved baseline (--baseline, default baselines/e2e.json next to this file) the
+run fails with exit code 1 when p95 latency, throughput or peak memory is worse than
+the baseline by more than --tolerance, and with exit code 2 when the baseline was
+recorded with other settings or when a --baseline given explicitly does not exist.
+Baselines are machine specific, so none is committed: record one with --save-baseline
+on the machine that runs the comparison.
+
+    python src/benchmark/e2e_bench.py --docs 200 --requests 400 --concurrency 16
+    python src/benchmark/e2e_bench.py --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(SRC_DIR)
+sys.path.insert(0, SRC_DIR)
+import numpy as np
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "e2e.json")
+PERCENTILES = (50, 95, 99)
+
+COURTS = ["中华人民共和国最高人民法院", "河南省高级人民法院", "北京市高级人民法院", "广东省高级人民法院",
+          "浙江省杭州市中级人民法院", "上海市第一中级人民法院", "四川省成都市中级人民法院"]
+COURT_CODES = ["最高法", "豫", "京", "粤", "浙01", "沪01", "川01"]
+CASE_TYPES = [("行政", "行终"), ("民事", "民终"), ("刑事", "刑终")]
+CAUSES = ["征地补偿款", "房屋拆迁安置", "商标权属", "建设工程施工合同", "借款合同", "劳动争议", "政府信息公开", "股权转让"]
+SURNAMES = "王李张刘陈杨赵黄周吴徐孙胡朱高林何郭马罗"
+COMPANY_WORDS = ["房地产开发", "建设工程", "贸易", "科技", "农业发展", "物流", "投资管理"]
+CITIES = ["南阳", "郑州", "杭州", "成都", "广州", "洛阳", "宁波"]
+FILLER = [
+    "经审理查明，双方当事人对上述事实均无异议，本院予以确认。",
+    "本院认为，行政机关作出的具体行政行为应当事实清楚、证据确凿、适用法律正确。",
+    "上诉人的上诉理由缺乏事实和法律依据，本院不予支持。",
+    "原审法院认定事实清楚，适用法律正确，审判程序合法。",
+    "根据《中华人民共和国行政诉讼法》第八十九条第一款第一项之规定，判决如下。",
+    "当事人对自己提出的主张，有责任提供证据。",
+    "被上诉人在法定期限内提交了作出被诉行为的证据和所依据的规范性文件。",
+    "案件受理费五十元，由上诉人负担。本判决为终审判决。"
+]
+QUESTION_TEMPLATES = [
+    "{court}审理的{plaintiff}诉{defendant}{cause}纠纷案的判决号是多少",
+    "{plaintiff}与{defendant}{cause}纠纷一案是哪个法院审理的",
+    "案号{case_number}的判决结果是什么",
+    "{defendant}在{cause}纠纷中的责任如何认定",
+    "{year}年{court}关于{cause}的判决要点"
+]
+CHINESE_DIGITS = "〇一二三四五六七八九"
+
+
+def chinese_year(year: int) -> str:
+    return "".join(CHINESE_DIGITS[int(d)] for d in str(year))
+
+def chinese_small_number(n: int) -> str:
+    if n < 10:
+        return CHINESE_DIGITS[n]
+    tens, units = divmod(n, 10)
+    return ("" if tens == 1 else CHINESE_DIGITS[tens]) + "十" + (CHINESE_DIGITS[units] if units else "")
+
+def make_judgment(rng: random.Random, i: int) -> dict:
+    """
+    Returns one synthetic judgment: its facts (used for questions) and text.
+    """
+    court_index = rng.randrange(len(COURTS))
+    case_type, case_code = rng.choice(CASE_TYPES)
+    year = rng.randint(2015, 2025)
+    case_number = f"（{year}）{COURT_CODES[court_index]}{case_code}{1000 + i}号"
+    plaintiff = f"{rng.choice(CITIES)}某某{rng.choice(COMPANY_WORDS)}有限公司"
+    defendant = f"{rng.choice(CITIES)}市人民政府" if case_type == "行政" else f"{rng.choice(SURNAMES)}某{i}"
+    cause = rng.choice(CAUSES)
+    facts = {"court": COURTS[court_index], "case_number": case_number, "plaintiff": plaintiff,
+             "defendant": defendant, "cause": cause, "year": year}
+    paragraphs = [
+        COURTS[court_index],
+        f"{case_type}判决书",
+        case_number,
+        f"上诉人（原审原告）：{plaintiff}。",
+        f"被上诉人（原审被告）：{defendant}。",
+        f"上诉人{plaintiff}因与被上诉人{defendant}{cause}纠纷一案，不服一审判决，向本院提起上诉。"
+    ]
+    for _ in range(rng.randint(12, 30)):
+        paragraphs.append("".join(rng.sample(FILLER, 3)) + f"{plaintiff}主张{cause}事项应予重新认定。")
+    paragraphs.append("驳回上诉，维持原判。")
+    paragraphs.append(f"{chinese_year(year)}年{chinese_small_number(rng.randint(1, 12))}月"
+                      f"{chinese_small_number(rng.randint(1, 28))}日")
+    facts["text"] = "\n".join(paragraphs)
+    facts["filename"] = f"{plaintiff}{defendant}{cause}{case_type}判决书{i}.txt"
+    return facts
+
+def build_corpus(doc_folder: str, docs: int, seed: int) -> list:
+    """
+    Writes docs synthetic judgments to doc_folder and returns the question pool.
+    """
+    rng = random.Random(seed)
+    os.makedirs(doc_folder, exist_ok=True)
+    questions = []
+    for i in range(docs):
+        judgment = make_judgment(rng, i)
+        with open(os.path.join(doc_folder, judgment["filename"]), "w", encoding="utf-8") as f:
+            f.write(judgment["text"])
+        questions.extend(template.format(**judgment) for template in QUESTION_TEMPLATES)
+    rng.shuffle(questions)
+    return questions
+
+
+class StubDeepseek(BaseHTTPRequestHandler):
+    """
+    Stand-in for the Deepseek chat completions API: answers every request after `delay` seconds.
+    """
+    delay = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.delay)
+        payload = json.dumps({"choices": [{"message": {"content": "stub answer"}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub_llm(delay: float):
+    handler = type("Stub", (StubDeepseek,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_app(app, port: int):
+    """
+    Serves app with uvicorn on a background thread of this process.
+    """
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    return server, thread
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def summarize(samples: list) -> dict:
+    values = np.asarray(samples, dtype=float)
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    summary["mean"] = round(float(values.mean()), 3)
+    summary["count"] = len(samples)
+    return summary
+
+async def wait_ready(client, base_url: str, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get(f"{base_url}/health/ready")
+            if response.status_code == 200:
+                return response.json()["startup"]
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"service not ready after {timeout}s")
+
+async def drive_load(base_url: str, questions: list, requests: int, concurrency: int, ready_timeout: float) -> dict:
+    """
+    Sends requests /query calls, concurrency at a time, cycling through questions.
+    """
+    import httpx
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        startup = await wait_ready(client, base_url, ready_timeout)
+        latencies, stages, errors = [], {}, 0
+        next_request = 0
+
+        async def worker():
+            nonlocal next_request, errors
+            while next_request < requests:
+                question = questions[next_request % len(questions)]
+                next_request += 1
+                started_at = time.perf_counter()
+                response = await client.post(f"{base_url}/query", json={"question": question})
+                latency = (time.perf_counter() - started_at) * 1000
+                body = response.json() if response.status_code == 200 else {}
+                if response.status_code != 200 or body.get("answer", "").startswith("Error"):
+                    errors += 1
+                    continue
+                latencies.append(latency)
+                for name, ms in body.get("timings", {}).items():
+                    stages.setdefault(name, []).append(ms)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+        cache = (await client.get(f"{base_url}/cache/stats")).json()
+        encoder = (await client.get(f"{base_url}/encoder/stats")).json()
+
+    if not latencies:
+        raise RuntimeError(f"all {requests} requests failed")
+    return {
+        "startup": startup,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "errors": errors,
+        "latency_ms": {"total": summarize(latencies), **{name.removesuffix("_ms"): summarize(ms) for name, ms in stages.items()}},
+        "cache": cache,
+        "encoder_avg_batch_size": encoder.get("avg_batch_size")
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns a description of every metric that regressed by more than tolerance against baseline.
+    """
+    regressions = []
+    for stage, summary in baseline["latency_ms"].items():
+        current = results["latency_ms"].get(stage)
+        # Sub-millisecond stages are too noisy to compare relatively
+        if current and current["p95"] > max(summary["p95"] * (1 + tolerance), summary["p95"] + 1.0):
+            regressions.append(f"{stage} p95 {current['p95']:.1f} ms > baseline {summary['p95']:.1f} ms")
+    if results["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput {results['throughput_rps']} req/s < baseline {baseline['throughput_rps']} req/s")
+    if results["ingest"]["chunks_per_s"] < baseline["ingest"]["chunks_per_s"] * (1 - tolerance):
+        regressions.append(f"ingestion {results['ingest']['chunks_per_s']} chunks/s < baseline {baseline['ingest']['chunks_per_s']} chunks/s")
+    if results["memory_mb"]["peak_rss"] > baseline["memory_mb"]["peak_rss"] * (1 + tolerance):
+        regressions.append(f"peak RSS {results['memory_mb']['peak_rss']} MB > baseline {baseline['memory_mb']['peak_rss']} MB")
+    return regressions
+
+def print_report(results: dict):
+    print(f"\n{results['config']['requests']} requests, concurrency {results['config']['concurrency']}: "
+          f"{results['throughput_rps']} req/s, {results['errors']} errors")
+    print(f"{'stage':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}")
+    for stage, summary in results["latency_ms"].items():
+        print(f"{stage:<16}{summary['p50']:>10.2f}{summary['p95']:>10.2f}{summary['p99']:>10.2f}{summary['mean']:>10.2f}")
+    print(f"ingestion: {results['ingest']['chunks']} chunks in {results['ingest']['seconds']} s "
+          f"({results['ingest']['chunks_per_s']} chunks/s)")
+    print(f"memory: {json.dumps(results['memory_mb'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end latency/throughput benchmark with a stub LLM.")
+    parser.add_argument("--docs", type=int, default=200, help="synthetic judgments in the corpus")
+    parser.add_argument("--requests", type=int, default=400, help="/query calls to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--llm-delay-ms", type=float, default=50, help="latency of the stub LLM")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where corpus and ChromaDB go (default: a temporary directory)")
+    parser.add_argument("--ready-timeout", type=float, default=300, help="seconds to wait for warm-up")
+    parser.add_argument("--baseline", help=f"baseline JSON to compare against or save to (default {DEFAULT_BASELINE}; "
+                                            "when given, it must exist unless --save-baseline is set)")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    # Checked before the run: a regression check must not pass because its baseline is missing
+    if args.baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f"no baseline at {args.baseline}; record one with --save-baseline")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="e2e_bench_")
+    doc_folder = os.path.join(workdir, "doc")
+    questions = build_corpus(doc_folder, args.docs, args.seed)
+    stub, stub_url = start_stub_llm(args.llm_delay_ms / 1000)
+
+    # Settings are read at import time, so they go into the environment before importing the service
+    os.environ.update({
+        "CHROMA_PATH": os.path.join(workdir, "chromadb_data"),
+        "PROMPT_TEMPLATE_PATH": os.path.join(REPO_DIR, "prompt_template"),
+        "DEEPSEEK_API_URL": stub_url,
+        "DEEPSEEK_API_KEY": "benchmark",
+        "LOG_LEVEL": "WARNING"
+    })
+    os.environ.pop("ANSWER_CACHE_PATH", None)
+    rss_start = rss_mb()
+    from embedding import embed_docs_incremental
+    started_at = time.perf_counter()
+    chunks = embed_docs_incremental(doc_folder=doc_folder, full=True)
+    ingest_s = time.perf_counter() - started_at
+    rss_ingested = rss_mb()
+
+    from query import app
+    port = free_port()
+    server, thread = start_app(app, port)
+    try:
+        results = asyncio.run(drive_load(f"http://127.0.0.1:{port}", questions, args.requests,
+                                         args.concurrency, args.ready_timeout))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        stub.shutdown()
+
+    results["config"] = {"docs": args.docs, "requests": args.requests, "concurrency": args.concurrency,
+                         "llm_delay_ms": args.llm_delay_ms, "questions": len(questions),
+                         "chunk_mode": os.getenv("CHUNK_MODE", "flat")}
+    results["ingest"] = {"chunks": chunks, "seconds": round(ingest_s, 3), "chunks_per_s": round(chunks / ingest_s, 1)}
+    results["memory_mb"] = {"start_rss": round(rss_start, 1), "after_ingest_rss": round(rss_ingested, 1),
+                            "end_rss": round(rss_mb(), 1), "peak_rss": round(peak_rss_mb(), 1)}
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    baseline_path = args.baseline or DEFAULT_BASELINE
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Saved baseline to {baseline_path}")
+        return
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; run with --save-baseline to record one")
+        return
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["config"] != results["config"]:
+        print(f"Baseline was recorded with {baseline['config']}, not comparable with {results['config']}")
+        sys.exit(2)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"No regressions against {baseline_path} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compares embedding backends on the doc/ corpus: encoding throughput and recall@10
+against the full-precision PyTorch baseline.
+
+Recall@10 is measured as the overlap between each backend's 10 nearest chunks and
+the baseline's 10 nearest chunks for the same query, using exact (brute-force)
+cosine search so that index approximation does not blur the comparison. Queries
+are the questions in --queries (one per line) or, by default, one sentence taken
+from every chunk.
+
+    python src/benchmark/encoder_bench.py --backends torch,torch-int8,onnx,onnx-int8
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from chunk import streamChunks
+from encoder import BACKENDS, load_encoder
+from store import EMBEDDING_MODEL
+
+
+def sample_queries(chunks, limit: int):
+    """
+    Takes the longest sentence of each chunk as a query, up to limit queries.
+    """
+    queries = []
+    for chunk in chunks:
+        sentences = [s for s in re.split(r"[。；！？\n]", chunk) if len(s) >= 8]
+        if sentences:
+            queries.append(max(sentences, key=len))
+        if len(queries) >= limit:
+            break
+    return queries
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def top_k(query_vectors, chunk_vectors, k: int):
+    scores = normalize(query_vectors) @ normalize(chunk_vectors).T
+    k = min(k, scores.shape[1])
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def run_backend(backend: str, chunks, queries, batch_size: int, repeat: int):
+    """
+    Returns (chunk vectors, query vectors, stats) for one backend.
+    """
+    started_at = time.perf_counter()
+    # No fallback: the numbers must belong to the backend they are reported for
+    model = load_encoder(EMBEDDING_MODEL, backend, fallback="")
+    load_s = time.perf_counter() - started_at
+    model.encode(chunks[:batch_size], batch_size=batch_size)  # warm-up
+
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        chunk_vectors = np.asarray(model.encode(chunks, batch_size=batch_size))
+        best = min(best, time.perf_counter() - started_at)
+    started_at = time.perf_counter()
+    query_vectors = np.asarray([model.encode(query) for query in queries])
+    query_s = time.perf_counter() - started_at
+    stats = {
+        "backend": backend,
+        "load_s": round(load_s, 3),
+        "chunks_per_s": round(len(chunks) / best, 1),
+        "single_query_ms": round(query_s / max(len(queries), 1) * 1000, 2)
+    }
+    return chunk_vectors, query_vectors, stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend throughput and recall@10 benchmark.")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help="comma-separated backends; the first one is the baseline (default: torch first)")
+    parser.add_argument("--doc-folder", default="doc")
+    parser.add_argument("--queries", help="file with one question per line (default: sampled from the corpus)")
+    parser.add_argument("--max-queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3, help="timed encoding passes; the best one is reported")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    backends = args.backends.split(",")
+    chunks = [chunk for _, _, chunk, _ in streamChunks(doc_folder=args.doc_folder)]
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()][:args.max_queries]
+    else:
+        queries = sample_queries(chunks, args.max_queries)
+    print(f"{len(chunks)} chunks, {len(queries)} queries, baseline: {backends[0]}")
+
+    results = []
+    baseline = None
+    for backend in backends:
+        try:
+            chunk_vectors, query_vectors, stats = run_backend(backend, chunks, queries, args.batch_size, args.repeat)
+        except Exception as e:
+            print(f"{backend}: skipped ({e})")
+            continue
+        neighbours = top_k(query_vectors, chunk_vectors, args.k)
+        if baseline is None:
+            baseline = (chunk_vectors, neighbours)
+            stats[f"recall@{args.k}"] = 1.0
+            stats["max_cosine_drift"] = 0.0
+        else:
+            overlaps = [len(set(a) & set(b)) / len(b) for a, b in zip(neighbours, baseline[1])]
+            stats[f"recall@{args.k}"] = round(float(np.mean(overlaps)), 4)
+            cosine = np.sum(normalize(chunk_vectors) * normalize(baseline[0]), axis=1)
+            stats["max_cosine_drift"] = round(float(1 - cosine.min()), 4)
+        stats["speedup"] = round(stats["chunks_per_s"] / results[0]["chunks_per_s"], 2) if results else 1.0
+        results.append(stats)
+        print(json.dumps(stats, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"chunks": len(chunks), "queries": len(queries), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Latency of the lexical index (lexical.py) on a synthetic corpus of judgment chunks.
+Every chunk starts with a court and a case number such as （2020）豫行终3143号 and
+continues with legal boilerplate and Zipf-distributed characters, so common bigrams
+("法院", "人民") occur in nearly every chunk, as they do in doc/.
+
+Two kinds of queries are timed on a read-only connection, as the API opens it:
+case-number lookups and 30-character free-text questions cut from the chunks. top1
+is the share of queries whose chunk (or a chunk with the same case number) ranks first.
+
+    python src/benchmark/lexical_bench.py --chunks 20000 --index /tmp/lexical_bench.sqlite3
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from lexical import LexicalIndex
+
+COURTS = ["河南省高级人民法院", "郑州市中级人民法院", "南阳市中级人民法院", "洛阳市中级人民法院"]
+PHRASES = ["本院认为", "上诉人", "被上诉人", "原审原告", "判决如下", "驳回上诉，维持原判", "人民政府",
+           "征地补偿", "事实清楚", "证据充分", "适用法律正确", "本判决为终审判决"]
+
+
+def case_number(rng: random.Random) -> str:
+    return (f"（{rng.randint(2015, 2023)}）豫{rng.randint(1, 17):02d}{rng.choice('行民刑')}"
+            f"{rng.choice(['初', '终'])}{rng.randint(1, 9999)}号")
+
+def make_chunks(count: int, length: int, seed: int):
+    """
+    Returns (case numbers, texts) of count synthetic chunks of about length characters.
+    """
+    rng = random.Random(seed)
+    chars = [chr(code) for code in range(0x4e00, 0x4e00 + 3000)]
+    weights = [1 / (rank + 1) for rank in range(len(chars))]
+    numbers, texts = [], []
+    for _ in range(count):
+        number = case_number(rng)
+        parts = [rng.choice(COURTS), number]
+        while sum(map(len, parts)) < length:
+            parts.append(rng.choice(PHRASES) if rng.random() < 0.3 else "".join(rng.choices(chars, weights, k=20)))
+        numbers.append(number)
+        texts.append("".join(parts)[:length])
+    return numbers, texts
+
+def percentiles(latencies) -> dict:
+    return {"p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "max_ms": round(float(np.max(latencies)), 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Lexical index search latency on a synthetic corpus.")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--length", type=int, default=1000, help="characters per chunk")
+    parser.add_argument("--queries", type=int, default=200, help="queries of each kind")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index", default="lexical_bench.sqlite3",
+                        help="index file; reused if it already holds --chunks chunks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    numbers, texts = make_chunks(args.chunks, args.length, args.seed)
+    ids = [f"chunk-{i}" for i in range(args.chunks)]
+    index = LexicalIndex(args.index)
+    if index.count() != args.chunks:
+        index.clear()
+        started_at = time.perf_counter()
+        for start in range(0, args.chunks, 500):
+            index.add(ids[start:start + 500], texts[start:start + 500], [f"{start // 500}.txt"] * len(ids[start:start + 500]))
+        print(f"Indexed {args.chunks} chunks in {time.perf_counter() - started_at:.1f}s")
+    print(f"Index file: {os.path.getsize(args.index) / 2 ** 20:.0f} MB")
+
+    reader = LexicalIndex(args.index, read_only=True)
+    rng = random.Random(args.seed + 1)
+    rows = rng.sample(range(args.chunks), min(args.queries, args.chunks))
+    # Warm the page cache, as a serving process would be
+    for row in rows[:10]:
+        reader.search(numbers[row], args.k)
+
+    latencies, first = [], 0
+    for row in rows:
+        started_at = time.perf_counter()
+        hits = reader.search(numbers[row], args.k)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        # Case numbers can repeat in a synthetic corpus: any chunk with the same number counts
+        first += bool(hits) and numbers[int(hits[0][0].split("-")[1])] == numbers[row]
+    results = [{"queries": "case_number", "top1": round(first / len(rows), 4), **percentiles(latencies)}]
+
+    latencies, first = [], 0
+    for row in rows:
+        start = rng.randint(0, args.length - 30)
+        started_at = time.perf_counter()
+        hits = reader.search(texts[row][start:start + 30], args.k)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        first += bool(hits) and hits[0][0] == ids[row]
+    results.append({"queries": "free_text", "top1": round(first / len(rows), 4), **percentiles(latencies)})
+    for stats in results:
+        print(json.dumps(stats, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"chunks": args.chunks, "length": args.length, "k": args.k, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
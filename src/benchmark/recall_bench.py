@@ -0,0 +1,106 @@
+"""
+Recall@k of the Chroma HNSW index against an exact search over a snapshot of the
+same collection (python src/embedding.py --export DIR), plus the search latency of
+each. The collection is opened as configured (CHROMA_PATH, COLLECTION_NAME,
+PARTITION_BY); the snapshot's brute-force NumPy search (snapshot.py) is the ground
+truth. --compare adds other snapshots of the collection, e.g. a float16 export, to
+check what the smaller matrix costs in recall before serving it.
+
+Queries are the questions in --queries (one per line, encoded with EMBEDDING_MODEL)
+or, by default, embeddings sampled from the snapshot with a little noise added, so
+that no model has to be loaded.
+
+    python src/embedding.py --export snapshot
+    python src/embedding.py --export snapshot-f16 --dtype float16
+    python src/benchmark/recall_bench.py --snapshot snapshot --compare snapshot-f16
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from snapshot import VECTOR_SEARCH, Snapshot
+from store import get_collection, get_model
+
+
+def sample_queries(snapshot: Snapshot, count: int, noise: float, seed: int) -> np.ndarray:
+    """
+    Stored embeddings of count random rows, each moved by Gaussian noise of noise times its norm.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(snapshot.count(), size=min(count, snapshot.count()), replace=False))
+    vectors = np.asarray(snapshot.embeddings[rows], dtype=np.float32)
+    scale = noise * np.linalg.norm(vectors, axis=1, keepdims=True) / np.sqrt(vectors.shape[1])
+    return vectors + rng.normal(size=vectors.shape).astype(np.float32) * scale
+
+def run_searches(index, queries: np.ndarray, k: int, batch_size: int, where=None):
+    """
+    Returns (ids per query, milliseconds per batch) for one index.
+    """
+    ids, latencies = [], []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size].tolist()
+        started_at = time.perf_counter()
+        result = index.query(query_embeddings=batch, n_results=k, where=where, include=[])
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        ids.extend(result["ids"])
+    return ids, latencies
+
+def summarize(name: str, ids, latencies, exact_ids, k: int) -> dict:
+    overlaps = [len(set(found) & set(expected)) / len(expected) for found, expected in zip(ids, exact_ids) if expected]
+    return {
+        "index": name,
+        f"recall@{k}": round(float(np.mean(overlaps)), 4) if overlaps else None,
+        "min_recall": round(float(np.min(overlaps)), 4) if overlaps else None,
+        "batch_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "batch_p95_ms": round(float(np.percentile(latencies, 95)), 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="HNSW recall@k against an exact snapshot search.")
+    parser.add_argument("--snapshot", required=True, help="snapshot directory written by embedding.py --export")
+    parser.add_argument("--compare", default="", help="comma-separated snapshot directories to score as well")
+    parser.add_argument("--queries", help="file with one question per line (default: sampled from the snapshot)")
+    parser.add_argument("--max-queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.1, help="relative noise added to sampled queries")
+    parser.add_argument("--where", help="Chroma where clause as JSON, e.g. '{\"year\": 2020}'")
+    parser.add_argument("--batch-size", type=int, default=16, help="queries per search call")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    if VECTOR_SEARCH == "snapshot":
+        raise SystemExit("Unset VECTOR_SEARCH: the HNSW index is what this benchmark measures.")
+
+    started_at = time.perf_counter()
+    snapshot = Snapshot(args.snapshot)
+    print(f"Opened snapshot of {snapshot.count()} chunks ({snapshot.info['dtype']}) "
+          f"in {time.perf_counter() - started_at:.2f}s")
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()][:args.max_queries]
+        queries = np.asarray(get_model().encode(questions), dtype=np.float32)
+    else:
+        queries = sample_queries(snapshot, args.max_queries, args.noise, args.seed)
+    where = json.loads(args.where) if args.where else None
+    print(f"{len(queries)} queries, k={args.k}, where={where}")
+
+    exact_ids, latencies = run_searches(snapshot, queries, args.k, args.batch_size, where)
+    results = [summarize("exact", exact_ids, latencies, exact_ids, args.k)]
+    indexes = [("hnsw", get_collection())]
+    indexes += [(path, Snapshot(path)) for path in args.compare.split(",") if path]
+    for name, index in indexes:
+        ids, latencies = run_searches(index, queries, args.k, args.batch_size, where)
+        results.append(summarize(name, ids, latencies, exact_ids, args.k))
+    for stats in results:
+        print(json.dumps(stats, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"chunks": snapshot.count(), "queries": len(queries), "k": args.k, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
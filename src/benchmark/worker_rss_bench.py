@@ -0,0 +1,151 @@
+"""
+Per-worker memory of the multi-process query service (gunicorn_conf.py).
+
+Builds the synthetic corpus of e2e_bench.py, ingests it with embedding.py, then for
+each mode starts gunicorn with --workers processes, sends /query load against the
+stub LLM and reads every process's memory from /proc/<pid>/smaps_rollup:
+
+- preload     PRELOAD_MODEL=1: weights are loaded in the master and shared copy-on-write
+- per-worker  PRELOAD_MODEL=0: every worker loads its own copy
+
+RSS counts shared pages in full for every process, so it overstates the total; PSS
+splits shared pages between the processes that map them (the sum is the real
+footprint) and USS is the memory only that process uses.
+
+    python src/benchmark/worker_rss_bench.py --workers 4 --docs 100 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from e2e_bench import REPO_DIR, SRC_DIR, build_corpus, drive_load, free_port, start_stub_llm
+
+MODES = {"preload": "1", "per-worker": "0"}
+
+
+def process_memory_mb(pid: int) -> dict:
+    """
+    RSS, PSS and USS of one process in MB.
+    """
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {"rss": round(fields["Rss"], 1), "pss": round(fields["Pss"], 1),
+            "uss": round(fields["Private_Clean"] + fields["Private_Dirty"], 1)}
+
+def child_pids(pid: int) -> list:
+    children = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces, so split after its closing parenthesis
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    return sorted(children)
+
+def wait_all_ready(base_url: str, workers: int, timeout: float):
+    """
+    Waits until enough consecutive readiness checks, each on a new connection and so
+    likely to reach a different worker, have succeeded.
+    """
+    deadline = time.perf_counter() + timeout
+    streak = 0
+    while streak < workers * 5:
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"workers not ready after {timeout}s")
+        try:
+            ready = httpx.get(f"{base_url}/health/ready", timeout=5).status_code == 200
+        except httpx.HTTPError:
+            ready = False
+        streak = streak + 1 if ready else 0
+        if not ready:
+            time.sleep(0.2)
+
+def run_mode(mode: str, args, env: dict, workdir: str, questions: list) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    log_path = os.path.join(workdir, f"gunicorn_{mode}.log")
+    command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(SRC_DIR, "gunicorn_conf.py"),
+               "--workers", str(args.workers), "--bind", f"127.0.0.1:{port}", "--pythonpath", SRC_DIR, "query:app"]
+    with open(log_path, "w") as log:
+        master = subprocess.Popen(command, cwd=workdir, env={**env, "PRELOAD_MODEL": MODES[mode]},
+                                  stdout=log, stderr=subprocess.STDOUT)
+    try:
+        load = asyncio.run(drive_load(base_url, questions, args.requests, args.concurrency, args.ready_timeout))
+        wait_all_ready(base_url, args.workers, args.ready_timeout)
+        workers = [process_memory_mb(pid) for pid in child_pids(master.pid)]
+        if len(workers) != args.workers:
+            raise RuntimeError(f"expected {args.workers} workers, found {len(workers)}; see {log_path}")
+        master_memory = process_memory_mb(master.pid)
+    finally:
+        master.terminate()
+        master.wait(timeout=60)
+    return {
+        "throughput_rps": load["throughput_rps"],
+        "errors": load["errors"],
+        "master_mb": master_memory,
+        "worker_mb": {key: round(sum(w[key] for w in workers) / len(workers), 1) for key in ("rss", "pss", "uss")},
+        "workers_mb": workers,
+        "total_pss_mb": round(master_memory["pss"] + sum(w["pss"] for w in workers), 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker RSS/PSS/USS of gunicorn serving with and without a preloaded model.")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated subset of {', '.join(MODES)}")
+    parser.add_argument("--docs", type=int, default=100, help="synthetic judgments in the corpus")
+    parser.add_argument("--requests", type=int, default=200, help="/query calls sent before measuring")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--llm-delay-ms", type=float, default=50, help="latency of the stub LLM")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where corpus, ChromaDB and logs go (default: a temporary directory)")
+    parser.add_argument("--ready-timeout", type=float, default=300, help="seconds to wait for warm-up")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="worker_rss_bench_")
+    questions = build_corpus(os.path.join(workdir, "doc"), args.docs, args.seed)
+    stub, stub_url = start_stub_llm(args.llm_delay_ms / 1000)
+    env = {**os.environ,
+           "CHROMA_PATH": os.path.join(workdir, "chromadb_data"),
+           "PROMPT_TEMPLATE_PATH": os.path.join(REPO_DIR, "prompt_template"),
+           "DEEPSEEK_API_URL": stub_url,
+           "DEEPSEEK_API_KEY": "benchmark",
+           "LOG_LEVEL": "WARNING"}
+    env.pop("ANSWER_CACHE_PATH", None)
+    # Ingestion is a separate, writing process; the workers only read what it stored
+    subprocess.run([sys.executable, os.path.join(SRC_DIR, "embedding.py"), "--full"],
+                   cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    results = {"config": {"workers": args.workers, "docs": args.docs, "requests": args.requests,
+                          "concurrency": args.concurrency, "embedding_backend": env.get("EMBEDDING_BACKEND", "torch")}}
+    try:
+        for mode in args.modes.split(","):
+            results[mode] = run_mode(mode, args, env, workdir, questions)
+    finally:
+        stub.shutdown()
+
+    print(f"\n{args.workers} workers, {args.requests} requests")
+    print(f"{'mode':<12}{'worker RSS':>12}{'worker PSS':>12}{'worker USS':>12}{'master PSS':>12}{'total PSS':>12}{'req/s':>8}")
+    for mode in args.modes.split(","):
+        r = results[mode]
+        print(f"{mode:<12}{r['worker_mb']['rss']:>12.1f}{r['worker_mb']['pss']:>12.1f}{r['worker_mb']['uss']:>12.1f}"
+              f"{r['master_mb']['pss']:>12.1f}{r['total_pss_mb']:>12.1f}{r['throughput_rps']:>8.1f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
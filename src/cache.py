@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory cache with a time-to-live and LRU size eviction.
+    When sqlite_path is given, entries are also written to an on-disk SQLite table
+    so they survive restarts; a memory miss falls back to the disk copy.
+    Values must be JSON-serialisable when a sqlite_path is used. A forked child (e.g. a
+    gunicorn worker of a preloaded app) opens its own SQLite connection.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600, sqlite_path: Optional[str] = None, table: str = "cache"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._table = table
+        self._sqlite_path = sqlite_path
+        self._db = None
+        self._pid = None
+        self._writes = 0
+        if sqlite_path:
+            self._open_disk()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached value for key, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            if self._sqlite_path:
+                row = self._disk().execute(
+                    f"SELECT value, expires_at FROM {self._table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any):
+        """
+        Stores value under key, evicting the least recently used entries beyond max_size.
+        """
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._sqlite_path:
+                self._disk().execute(
+                    f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at)
+                )
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._prune_disk()
+                self._db.commit()
+
+    def clear(self):
+        """
+        Drops every entry from memory and disk.
+        """
+        with self._lock:
+            self._entries.clear()
+            if self._sqlite_path:
+                self._disk().execute(f"DELETE FROM {self._table}")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the current number of in-memory entries.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size
+            }
+
+    def _open_disk(self):
+        self._db = sqlite3.connect(self._sqlite_path, check_same_thread=False)
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self._table} (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+        )
+        self._db.commit()
+        self._pid = os.getpid()
+
+    def _disk(self) -> sqlite3.Connection:
+        # A SQLite connection must not be used across fork
+        if self._pid != os.getpid():
+            self._open_disk()
+        return self._db
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _prune_disk(self):
+        # Drop expired rows, then cap the table at max_size rows keeping the freshest
+        self._db.execute(f"DELETE FROM {self._table} WHERE expires_at <= ?", (time.time(),))
+        self._db.execute(
+            f"DELETE FROM {self._table} WHERE key NOT IN "
+            f"(SELECT key FROM {self._table} ORDER BY expires_at DESC LIMIT ?)",
+            (self.max_size,)
+        )
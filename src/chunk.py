@@ -1,40 +1,284 @@
+import hashlib
 import os
-from typing import List
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import re
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
 
+# Streaming chunker settings
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", os.cpu_count() or 1))
+CHUNK_MAX_IN_FLIGHT = int(os.getenv("CHUNK_MAX_IN_FLIGHT", 2 * CHUNK_WORKERS))
 
-def readDoc(doc_folder: str = "doc") -> List[str]:
+# How documents are split:
+#   flat          overlapping 1000-character chunks, embedded and sent to the LLM as they are
+#   hierarchical  small sentence units (children) are embedded for matching; each points
+#                 at the section of the judgment (parent) it came from, which is stored once
+#                 and sent to the LLM instead of the child
+CHUNK_MODE = os.getenv("CHUNK_MODE", "flat")
+CHUNK_MODES = ("flat", "hierarchical")
+# all-MiniLM-L6-v2 reads at most 256 tokens (about one per Chinese character), so a child is encoded whole
+CHILD_MAX_CHARS = int(os.getenv("CHILD_MAX_CHARS", 250))
+PARENT_MAX_CHARS = int(os.getenv("PARENT_MAX_CHARS", 2000))
+# Carried by the first child of each parent only; ingestion moves it to the parent store
+PARENT_TEXT_KEY = "parent_text"
+
+# Sections of a judgment in order; text before the first marker is the header (首部).
+# A section starts at a paragraph matching its pattern, except 判决主文, which starts
+# after the paragraph ending in 判决如下 (the last one of 本院认为).
+SECTIONS = ["首部", "事实", "本院认为", "判决主文", "尾部"]
+SECTION_MARKERS = {
+    "事实": re.compile(r"^(本院)?(经审理|二审|一审法院|原审法院|原审)?(查明|认定)"),
+    "本院认为": re.compile(r"^本院认为"),
+    "尾部": re.compile(r"^(审\s*判\s*长|审\s*判\s*员|人民陪审员|如不服本判决)"),
+}
+MAIN_TEXT_PATTERN = re.compile(r"(判决|裁定|决定)如下[：:]?$")
+SENTENCE_PATTERN = re.compile(r"[^。；！？]+[。；！？]?")
+
+# Judgment metadata patterns
+CASE_NUMBER_PATTERN = re.compile(r"[（(]\d{4}[）)][^\s，。；、（()）]{1,30}?号")
+COURT_PATTERN = re.compile(r"^\S*法院$")
+CHINESE_DATE_PATTERN = re.compile(r"([〇○零一二三四五六七八九]{4})年([一二三四五六七八九十]{1,3})月([一二三四五六七八九十]{1,3})日")
+ARABIC_DATE_PATTERN = re.compile(r"(\d{4})年(\d{1,2})月(\d{1,2})日")
+CASE_TYPES = ["行政", "民事", "刑事", "执行", "赔偿"]
+CHINESE_DIGITS = {"〇": 0, "○": 0, "零": 0, "一": 1, "二": 2, "三": 3, "四": 4,
+                  "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+
+def listDocs(doc_folder: str = "doc") -> List[str]:
     """
-    Loops through all .txt files in the doc folder and returns their text as a list of strings.
+    Returns the names of all .txt files in the doc folder, skipping hidden and temp files.
     """
-    texts = []
-    for filename in os.listdir(doc_folder):
+    filenames = []
+    for filename in sorted(os.listdir(doc_folder)):
         if filename.startswith('.') or filename.startswith('~'):
             continue
         file_path = os.path.join(doc_folder, filename)
         if os.path.isfile(file_path) and filename.lower().endswith('.txt'):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    texts.append(f.read())
-            except Exception as e:
-                print(f"Error reading {filename}: {e}")
-    return texts
+            filenames.append(filename)
+    return filenames
+
+_text_splitter = None
+
+def chunkText(text: str) -> List[str]:
+    """
+    Splits a single document into chunks using RecursiveCharacterTextSplitter.
+    """
+    global _text_splitter
+    if _text_splitter is None:
+        # Imported here: langchain is slow to import and only needed once chunking starts
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        _text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200,
+            length_function=len
+        )
+    return _text_splitter.split_text(text)
+
+def splitSections(text: str) -> List[Tuple[str, str]]:
+    """
+    Splits a judgment into (section name, text) pairs: 首部 (header and parties), 事实,
+    本院认为, 判决主文 and 尾部. Sections only move forward, so a later paragraph that
+    looks like an earlier marker stays where it is. Paragraphs are kept on separate
+    lines; empty sections are left out.
+    """
+    sections, position, paragraphs = [], 0, []
+
+    def start(next_position: int):
+        nonlocal position, paragraphs
+        if paragraphs:
+            sections.append((SECTIONS[position], "\n".join(paragraphs)))
+        position, paragraphs = next_position, []
+
+    for line in text.splitlines():
+        paragraph = line.strip()
+        if not paragraph:
+            continue
+        for next_position in range(len(SECTIONS) - 1, position, -1):
+            pattern = SECTION_MARKERS.get(SECTIONS[next_position])
+            if pattern is not None and pattern.search(paragraph):
+                start(next_position)
+                break
+        paragraphs.append(paragraph)
+        if SECTIONS[position] in ("事实", "本院认为") and MAIN_TEXT_PATTERN.search(paragraph):
+            start(SECTIONS.index("判决主文"))
+    start(position)
+    return sections
+
+def _pack(pieces: List[str], max_chars: int, separator: str = "") -> List[str]:
+    """
+    Joins consecutive pieces into units of at most max_chars; longer pieces are cut.
+    """
+    units, current = [], ""
+    for piece in pieces:
+        while len(piece) > max_chars:
+            if current:
+                units.append(current)
+                current = ""
+            units.append(piece[:max_chars])
+            piece = piece[max_chars:]
+        if current and len(current) + len(separator) + len(piece) > max_chars:
+            units.append(current)
+            current = ""
+        current = current + separator + piece if current else piece
+    if current:
+        units.append(current)
+    return units
+
+def chunkHierarchical(text: str, source: str = "") -> Tuple[List[str], List[dict]]:
+    """
+    Splits a judgment into parents (its sections, cut at paragraph boundaries to at most
+    PARENT_MAX_CHARS) and children (consecutive sentences of a parent packed into
+    non-overlapping units of at most CHILD_MAX_CHARS). Returns (children, child metadata):
+    each child's metadata holds its section, parent_id and parent_index, and the first
+    child of each parent also carries the parent's text under PARENT_TEXT_KEY.
+    A child repeating an earlier child of the same document is left out.
+    """
+    children, metadatas, seen = [], [], set()
+    parent_index = 0
+    for section, section_text in splitSections(text):
+        for parent in _pack(section_text.split("\n"), PARENT_MAX_CHARS, "\n"):
+            parent_id = hashlib.sha256(f"{source}\0{parent_index}\0{parent}".encode("utf-8")).hexdigest()
+            sentences = [sentence.strip() for line in parent.split("\n") for sentence in SENTENCE_PATTERN.findall(line)]
+            first = True
+            for child in _pack([sentence for sentence in sentences if sentence], CHILD_MAX_CHARS):
+                if child in seen:
+                    continue
+                seen.add(child)
+                metadata = {"section": section, "parent_id": parent_id, "parent_index": parent_index}
+                if first:
+                    metadata[PARENT_TEXT_KEY] = parent
+                    first = False
+                children.append(child)
+                metadatas.append(metadata)
+            parent_index += 1
+    return children, metadatas
+
+def _chineseNumber(text: str) -> int:
+    """
+    Converts a Chinese numeral up to 99 (e.g. 五, 十二, 二十八) to an int.
+    """
+    if "十" not in text:
+        return CHINESE_DIGITS[text]
+    tens, _, ones = text.partition("十")
+    return (CHINESE_DIGITS[tens] if tens else 1) * 10 + (CHINESE_DIGITS[ones] if ones else 0)
+
+def _judgmentDate(text: str) -> Optional[str]:
+    """
+    Returns the judgment date as YYYY-MM-DD. The date written in Chinese numerals above
+    the clerk's signature (the last one in the text) is preferred; Arabic dates are a fallback.
+    """
+    matches = CHINESE_DATE_PATTERN.findall(text)
+    if matches:
+        year, month, day = matches[-1]
+        year = "".join(str(CHINESE_DIGITS[c]) for c in year)
+        return f"{year}-{_chineseNumber(month):02d}-{_chineseNumber(day):02d}"
+    matches = ARABIC_DATE_PATTERN.findall(text)
+    if matches:
+        year, month, day = matches[-1]
+        return f"{year}-{int(month):02d}-{int(day):02d}"
+    return None
+
+def extractMetadata(text: str, filename: str) -> Dict[str, Union[str, int]]:
+    """
+    Extracts case number, court, judgment date, year and case type (行政/民事/...) from a
+    judgment, plus its source filename. Fields that cannot be found are left out, since
+    Chroma metadata values cannot be None.
+    """
+    metadata = {"source": filename}
+    header_lines = [re.sub(r"\s+", "", line) for line in text.splitlines()[:10] if line.strip()]
+    for line in header_lines:
+        if COURT_PATTERN.match(line):
+            metadata["court"] = line
+            break
+    case_number = CASE_NUMBER_PATTERN.search(text[:2000])
+    if case_number:
+        metadata["case_number"] = unicodedata.normalize("NFKC", case_number.group(0))
+    date = _judgmentDate(text)
+    if date:
+        metadata["judgment_date"] = date
+        metadata["year"] = int(date[:4])
+    elif case_number:
+        metadata["year"] = int(re.search(r"\d{4}", case_number.group(0)).group(0))
+    title = "".join(header_lines[:3]) + filename
+    for case_type in CASE_TYPES:
+        if case_type in title:
+            metadata["case_type"] = case_type
+            break
+    return metadata
+
+def _chunkFileTask(doc_folder: str, filename: str, mode: str = CHUNK_MODE) -> Tuple[str, List[str], Optional[dict], Optional[List[dict]]]:
+    """
+    Process-pool task: reads and splits one file, returning (filename, chunks, metadata,
+    per-chunk metadata or None). metadata is None if the file cannot be read.
+    """
+    try:
+        with open(os.path.join(doc_folder, filename), 'r', encoding='utf-8') as f:
+            text = f.read()
+    except Exception as e:
+        print(f"Error reading {filename}: {e}")
+        return filename, [], None, None
+    if mode == "flat":
+        return filename, chunkText(text), extractMetadata(text, filename), None
+    chunks, chunk_metadatas = chunkHierarchical(text, filename)
+    return filename, chunks, extractMetadata(text, filename), chunk_metadatas
+
+def _records(filename: str, chunks: List[str], metadata: Optional[dict],
+             chunk_metadatas: Optional[List[dict]] = None,
+             failed: Optional[Set[str]] = None) -> Iterator[Tuple[str, int, str, dict]]:
+    if metadata is None:
+        if failed is not None:
+            failed.add(filename)
+        return
+    for index, chunk in enumerate(chunks):
+        yield filename, index, chunk, dict(metadata, chunk_index=index, **(chunk_metadatas[index] if chunk_metadatas else {}))
+
+def streamChunks(
+    filenames: Optional[List[str]] = None,
+    doc_folder: str = "doc",
+    workers: int = CHUNK_WORKERS,
+    max_in_flight: int = CHUNK_MAX_IN_FLIGHT,
+    mode: str = CHUNK_MODE,
+    failed: Optional[Set[str]] = None
+) -> Iterator[Tuple[str, int, str, dict]]:
+    """
+    Yields (source_file, chunk_index, chunk, metadata) records for the given files (all of doc_folder
+    by default). metadata holds the judgment fields from extractMetadata plus chunk_index,
+    and in hierarchical mode the fields added by chunkHierarchical.
+    Files are read and split in a process pool, but at most max_in_flight files are being
+    processed or waiting to be consumed at any time, so memory stays bounded regardless of
+    corpus size. Records are yielded in file order, with each file's chunks contiguous.
+    Files that cannot be read yield nothing and are added to failed, if given, before
+    any record of a later file is yielded.
+    """
+    if mode not in CHUNK_MODES:
+        raise ValueError(f"Unknown CHUNK_MODE '{mode}'. Choose one of: {', '.join(CHUNK_MODES)}.")
+    if filenames is None:
+        filenames = listDocs(doc_folder)
+    if workers <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            yield from _records(*_chunkFileTask(doc_folder, filename, mode), failed=failed)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        remaining = iter(filenames)
+        for filename in remaining:
+            in_flight.append(pool.submit(_chunkFileTask, doc_folder, filename, mode))
+            if len(in_flight) >= max(1, max_in_flight):
+                break
+        while in_flight:
+            filename, chunks, metadata, chunk_metadatas = in_flight.popleft().result()
+            next_filename = next(remaining, None)
+            if next_filename is not None:
+                in_flight.append(pool.submit(_chunkFileTask, doc_folder, next_filename, mode))
+            yield from _records(filename, chunks, metadata, chunk_metadatas, failed)
 
 def chunkDoc() -> List[str]:
     """
-    Reads documents and splits them into chunks using RecursiveCharacterTextSplitter.
-    """
-    docs = readDoc()
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    all_splits = []
-    for doc in docs:
-        splits = text_splitter.split_text(doc)
-        all_splits.extend(splits)
-    return all_splits
+    Reads documents and splits them into chunks (see CHUNK_MODE).
+    """
+    return [chunk for _, _, chunk, _ in streamChunks()]
 
 def main():
     chunks = chunkDoc()
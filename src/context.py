@@ -0,0 +1,149 @@
+import os
+import re
+from typing import List, Optional
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 4000))
+# Longest overlap looked for between neighbouring chunks (chunk.py uses 200 characters)
+MAX_OVERLAP = 400
+MIN_OVERLAP = 20
+# Sentences shorter than this are never treated as duplicates (e.g. "判决如下：")
+MIN_DUPLICATE_SENTENCE = 10
+
+CJK_PATTERN = re.compile(r"[　-〿㐀-鿿＀-￯]")
+SENTENCE_PATTERN = re.compile(r"[^。；！？\n]+[。；！？\n]?")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer: one token per CJK character or
+    full-width punctuation mark, one per four other characters.
+    """
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def overlap_length(left: str, right: str) -> int:
+    """
+    Length of the longest suffix of left that is also a prefix of right (0 if shorter than MIN_OVERLAP).
+    """
+    if len(left) < MIN_OVERLAP or len(right) < MIN_OVERLAP:
+        return 0
+    probe = right[:MIN_OVERLAP]
+    start = max(0, len(left) - min(MAX_OVERLAP, len(right)))
+    position = left.find(probe, start)
+    while position != -1:
+        if right.startswith(left[position:]):
+            return len(left) - position
+        position = left.find(probe, position + 1)
+    return 0
+
+def merge_chunks(hits: List[dict]) -> List[dict]:
+    """
+    Merges hits that are consecutive chunks of the same judgment into one block,
+    dropping the text they overlap on. Each hit is {"text", "rank", "source", "chunk_index"};
+    hits without a chunk_index are kept as they are. A block is {"rank", "parts"}: its
+    best (lowest) hit rank and its [(rank, text)] pieces in document order.
+    """
+    by_source = {}
+    blocks = []
+    for hit in hits:
+        if hit.get("source") and hit.get("chunk_index") is not None:
+            by_source.setdefault(hit["source"], []).append(hit)
+        else:
+            blocks.append({"rank": hit["rank"], "parts": [(hit["rank"], hit["text"])]})
+    for source_hits in by_source.values():
+        source_hits.sort(key=lambda hit: hit["chunk_index"])
+        current, last_index, last_text = None, None, None
+        for hit in source_hits:
+            if current is not None and hit["chunk_index"] == last_index:
+                continue  # same chunk retrieved twice
+            if current is not None and hit["chunk_index"] == last_index + 1:
+                overlap = overlap_length(last_text, hit["text"])
+                current["parts"].append((hit["rank"], hit["text"][overlap:]))
+                current["rank"] = min(current["rank"], hit["rank"])
+            else:
+                current = {"rank": hit["rank"], "parts": [(hit["rank"], hit["text"])]}
+                blocks.append(current)
+            last_index, last_text = hit["chunk_index"], hit["text"]
+    return blocks
+
+def drop_duplicate_spans(text: str, seen: set) -> str:
+    """
+    Removes sentences already present in an earlier context; seen is updated in place.
+    """
+    kept = []
+    for sentence in SENTENCE_PATTERN.findall(text):
+        key = sentence.strip()
+        if len(key) >= MIN_DUPLICATE_SENTENCE:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(sentence)
+    return "".join(kept).strip()
+
+def truncate_to_budget(text: str, budget: int) -> str:
+    """
+    Cuts text at a sentence boundary so that it fits within budget tokens.
+    """
+    kept, used = [], 0
+    for sentence in SENTENCE_PATTERN.findall(text):
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    return "".join(kept).strip()
+
+def pack_contexts(texts: List[str], metadatas: Optional[List[dict]] = None, budget: int = CONTEXT_TOKEN_BUDGET) -> List[str]:
+    """
+    Turns ranked retrieval hits into the contexts sent to the LLM: overlapping or adjacent
+    chunks of the same judgment are merged, sentences repeated across contexts are
+    removed, and the best-ranked contexts are packed until budget tokens are used.
+    """
+    metadatas = metadatas or [{} for _ in texts]
+    hits = [{"text": text, "rank": rank, "source": (metadata or {}).get("source"),
+             "chunk_index": (metadata or {}).get("chunk_index")}
+            for rank, (text, metadata) in enumerate(zip(texts, metadatas))]
+    blocks = sorted(merge_chunks(hits), key=lambda block: block["rank"])
+
+    packed, seen, used = [], set(), 0
+    for block in blocks:
+        parts = [(rank, position, drop_duplicate_spans(text, seen))
+                 for position, (rank, text) in enumerate(block["parts"])]
+        parts = [part for part in parts if part[2]]
+        if not parts or used >= budget:
+            continue
+        # When the whole block does not fit, keep its best-ranked pieces (in document order)
+        kept = []
+        for rank, position, text in sorted(parts):
+            cost = estimate_tokens(text)
+            if used + cost > budget:
+                text = truncate_to_budget(text, budget - used)
+                cost = estimate_tokens(text)
+            if text:
+                kept.append((position, text))
+                used += cost
+        if kept:
+            kept.sort()
+            text = kept[0][1]
+            for (previous, _), (position, part) in zip(kept, kept[1:]):
+                # Pieces that were not neighbours in the judgment are kept on separate lines
+                text += part if position == previous + 1 else "\n" + part
+            packed.append(text)
+    return packed
+
+
+class PromptTemplate:
+    """
+    Prompt template split once into literal segments and {contexts}/{query} slots,
+    so rendering is a single join and placeholder-like text inside contexts is never substituted.
+    """
+
+    PLACEHOLDER_PATTERN = re.compile(r"\{(contexts|query)\}")
+
+    def __init__(self, text: str):
+        self.segments = self.PLACEHOLDER_PATTERN.split(text)
+
+    def render(self, contexts: List[str], query: str) -> str:
+        values = {"contexts": "\n\n".join(contexts), "query": query}
+        # re.split puts captured placeholder names at the odd positions
+        return "".join(values[segment] if i % 2 else segment for i, segment in enumerate(self.segments))
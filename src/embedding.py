@@ -1,42 +1,429 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
-from typing import List
-from chunk import chunkDoc
-
-# Initialize ChromaDB persistent client and collection
-chroma_client = chromadb.PersistentClient(path="chromadb_data")
-collection = chroma_client.get_or_create_collection("law_texts")
-
-# Load embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
-def embedding(text: str):
-    """
-    Generate embedding for the input text and save it to ChromaDB.
-    Returns the embedding vector.
-    """
-    vector = model.encode(text)
-    # Save to ChromaDB (using text as the document id for simplicity)
-    collection.upsert(
-        documents=[text],
-        embeddings=[vector.tolist()],
-        ids=[str(hash(text))]
-    )
-    return vector
-
-def embed_chunks_from_chunkpy() -> List:
-    """
-    Reads chunks from chunkDoc in chunk.py and embeds each chunk one by one.
-    Returns a list of embedding vectors.
-    """
-    chunks = chunkDoc()
-    vectors = []
-    for i, chunk in enumerate(chunks):
-        vector = embedding(chunk)
-        vectors.append(vector)
-        print(f"Embedded chunk {i+1}/{len(chunks)}")
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from chunk import CHUNK_MAX_IN_FLIGHT, CHUNK_MODE, CHUNK_WORKERS, PARENT_TEXT_KEY, listDocs, streamChunks
+from metrics import COLLECTION_CHUNKS, INGESTED_CHUNKS
+from partition import PARTITION_BY, PartitionedCollection
+from snapshot import DTYPES, Snapshot, SnapshotWriter
+from store import (CHROMA_PATH, COLLECTION_NAME, EMBEDDING_MODEL, get_client, get_collection, get_lexical_index,
+                   get_model, get_parent_store)
+from timing import stage, timed_iter
+
+# The Chroma collection, the lexical (BM25) index kept in step with it and the
+# embedding model are opened lazily by store.py on first use.
+
+# Batched ingestion settings
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+MANIFEST_PATH = os.path.join(CHROMA_PATH, "manifest.json")
+# Rows per bulk upsert when importing a snapshot (capped by Chroma's maximum batch size)
+SNAPSHOT_IMPORT_BATCH_SIZE = int(os.getenv("SNAPSHOT_IMPORT_BATCH_SIZE", 5000))
+# Held by the running ingestion; query workers only read the store (SERVING_READ_ONLY)
+INGEST_LOCK_PATH = os.path.join(CHROMA_PATH, "ingest.lock")
+
+@contextmanager
+def ingestion_lock(path: str = INGEST_LOCK_PATH):
+    """
+    Holds an exclusive lock on path for the duration of the block, so that only one
+    ingestion writes to the store at a time. Raises RuntimeError if another process holds it.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise RuntimeError(f"Another ingestion is running (lock held on {path})")
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def chunk_id(text: str, source: str = "") -> str:
+    """
+    Returns a deterministic, content-addressed ChromaDB id for a chunk.
+    The source filename is part of the digest so identical passages in
+    different judgments stay separate and can be deleted per file.
+    """
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+def file_digest(file_path: str) -> str:
+    """
+    Returns the sha256 hex digest of a file's bytes, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest() -> Dict[str, dict]:
+    """
+    Returns the persisted {filename: {mtime, size, sha256, chunks}} manifest, or {} if none exists.
+    """
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {MANIFEST_PATH}: {e}")
+        return {}
+
+def save_manifest(manifest: Dict[str, dict]):
+    """
+    Persists the manifest. Written to a temp file first so a crash never leaves it half-written.
+    """
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def delete_source(source: str):
+    """
+    Removes every chunk that was ingested from the given doc/ file.
+    """
+    with stage("ingest_delete"):
+        get_collection().delete(where={"source": source})
+        get_lexical_index().delete_source(source)
+        get_parent_store().delete_source(source)
+
+def reset_collection():
+    """
+    Removes every chunk from the collection, e.g. entries written before ids were content-addressed.
+    """
+    collection = get_collection()
+    if isinstance(collection, PartitionedCollection):
+        for key in collection.partitions():
+            collection.drop(key)
+    while True:
+        ids = get_collection().get(limit=1000, include=[])["ids"]
+        if not ids:
+            break
+        get_collection().delete(ids=ids)
+    get_lexical_index().clear()
+    get_parent_store().clear()
+
+def rebuild_lexical_index(page_size: int = 1000) -> int:
+    """
+    Rebuilds the lexical index from the documents already stored in the collection,
+    without re-embedding anything. Returns the number of indexed chunks.
+    """
+    get_lexical_index().clear()
+    indexed = 0
+    while True:
+        page = get_collection().get(limit=page_size, offset=indexed, include=["documents", "metadatas"])
+        if not page["ids"]:
+            break
+        metadatas = [metadata or {} for metadata in page["metadatas"]]
+        sources = [metadata.get("source", "") for metadata in metadatas]
+        get_lexical_index().add(page["ids"], page["documents"], sources, metadatas)
+        indexed += len(page["ids"])
+    print(f"Lexical index rebuilt with {indexed} chunks")
+    return indexed
+
+def drop_partition(name: str) -> int:
+    """
+    Drops one partition (see PARTITION_BY), given by its key or by its court, year or
+    source file: its collection, its chunks in the lexical index and the manifest
+    entries of its files. Other partitions are not touched. Files that are still in
+    doc/ are embedded again by the next run. Returns the number of files dropped.
+    """
+    collection = get_collection()
+    if not isinstance(collection, PartitionedCollection):
+        raise ValueError("The collection is not partitioned; set PARTITION_BY to use partitions.")
+    partitions = collection.partitions()
+    key = name if name in partitions else collection.key_of({collection.field: name})
+    if key not in partitions:
+        raise ValueError(f"No partition '{name}'. Existing partitions: {', '.join(sorted(partitions)) or 'none'}.")
+    # Every chunk of a file carries the same metadata, so a file lives in exactly one partition
+    sources, offset = set(), 0
+    while True:
+        page = partitions[key].get(limit=1000, offset=offset, include=["metadatas"])
+        if not page["ids"]:
+            break
+        sources.update((metadata or {}).get("source", "") for metadata in page["metadatas"])
+        offset += len(page["ids"])
+    for source in sources:
+        get_lexical_index().delete_source(source)
+        get_parent_store().delete_source(source)
+    collection.drop(key)
+    manifest = load_manifest()
+    for source in sources:
+        manifest.pop(source, None)
+    save_manifest(manifest)
+    COLLECTION_CHUNKS.set(collection.count())
+    print(f"Dropped partition {key} ({offset} chunks from {len(sources)} files)")
+    return len(sources)
+
+def export_snapshot(path: str, dtype: str = "float32", page_size: int = 1000) -> int:
+    """
+    Writes every chunk of the collection (ids, documents, metadata and the stored
+    embeddings), the parent store and the manifest to a snapshot directory (see
+    snapshot.py), with the embeddings as a float32 or float16 .npy matrix.
+    Returns the number of chunks exported.
+    """
+    collection = get_collection()
+    writer = SnapshotWriter(path, collection.count(), dtype)
+    while True:
+        page = collection.get(limit=page_size, offset=writer.rows, include=["documents", "metadatas", "embeddings"])
+        if not page["ids"]:
+            break
+        writer.add(page["ids"], page["documents"], page["metadatas"], page["embeddings"])
+    parents = get_parent_store().rows()
+    if parents:
+        writer.add_parents(parents)
+    writer.close({
+        "model": EMBEDDING_MODEL,
+        "collection": COLLECTION_NAME,
+        "partition_by": PARTITION_BY,
+        "space": (getattr(collection, "metadata", None) or {}).get("hnsw:space", "l2"),
+        "chunk_mode": CHUNK_MODE,
+        "exported_at": time.time(),
+        "manifest": load_manifest()
+    })
+    print(f"Exported {writer.rows} chunks and {len(parents)} parents to {path} ({dtype})")
+    return writer.rows
+
+def import_snapshot(path: str, batch_size: int = SNAPSHOT_IMPORT_BATCH_SIZE) -> int:
+    """
+    Replaces the collection, lexical index and parent store with the contents of a
+    snapshot written by export_snapshot, in bulk upserts of the stored embeddings, so
+    nothing is re-embedded. The snapshot's manifest becomes the ingestion manifest, so
+    the next ingestion run only embeds files changed since the export. Chunks are routed
+    by the current PARTITION_BY, whatever the exporting store used.
+    Raises ValueError if the snapshot was made with another embedding model.
+    Returns the number of chunks imported.
+    """
+    snapshot = Snapshot(path)
+    if snapshot.info.get("model") != EMBEDDING_MODEL:
+        raise ValueError(f"Snapshot {path} holds {snapshot.info.get('model')} embeddings, "
+                         f"but EMBEDDING_MODEL is {EMBEDDING_MODEL}.")
+    reset_collection()
+    batch_size = min(batch_size, get_client().get_max_batch_size())
+    imported = 0
+    started_at = time.perf_counter()
+    for ids, documents, metadatas, embeddings in snapshot.batches(batch_size):
+        with stage("ingest_upsert"):
+            get_collection().upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        with stage("ingest_lexical"):
+            get_lexical_index().add(ids, documents, [metadata.get("source", "") for metadata in metadatas], metadatas)
+        imported += len(ids)
+        print(f"Imported {imported}/{snapshot.count()} chunks")
+    parents = snapshot.parents()
+    if parents:
+        with stage("ingest_parents"):
+            get_parent_store().add(parents)
+    save_manifest(snapshot.info.get("manifest") or {})
+    COLLECTION_CHUNKS.set(get_collection().count())
+    elapsed = time.perf_counter() - started_at
+    print(f"Imported {imported} chunks and {len(parents)} parents in {elapsed:.1f}s")
+    return imported
+
+def embed_batch(texts: List[str], metadatas: Optional[List[dict]] = None):
+    """
+    Encodes a batch of chunks in one forward pass and writes them with one bulk upsert.
+    Each metadata dict carries at least the chunk's "source" filename. Parent texts of
+    hierarchical chunks (chunk.PARENT_TEXT_KEY) go to the parent store, not into Chroma.
+    Returns the embedding matrix.
+    """
+    metadatas = metadatas or [{"source": ""} for _ in texts]
+    sources = [metadata["source"] for metadata in metadatas]
+    parents = [(metadata["parent_id"], metadata["source"], metadata["section"], metadata["parent_index"],
+                metadata.pop(PARENT_TEXT_KEY)) for metadata in metadatas if PARENT_TEXT_KEY in metadata]
+    if parents:
+        with stage("ingest_parents"):
+            get_parent_store().add(parents)
+    ids = [chunk_id(text, source) for text, source in zip(texts, sources)]
+    with stage("ingest_encode"):
+        vectors = get_model().encode(texts, batch_size=len(texts))
+    with stage("ingest_upsert"):
+        get_collection().upsert(
+            documents=texts,
+            embeddings=vectors.tolist(),
+            metadatas=metadatas,
+            ids=ids
+        )
+    with stage("ingest_lexical"):
+        get_lexical_index().add(ids, texts, sources, metadatas)
+    INGESTED_CHUNKS.inc(len(texts))
     return vectors
 
+def plan_ingestion(doc_folder: str, manifest: Dict[str, dict]):
+    """
+    Compares doc_folder against the manifest.
+    Returns (changed, removed): changed is a list of (filename, manifest entry) for new
+    or modified files, removed lists manifest filenames no longer on disk. Files whose
+    mtime and size are unchanged are not re-hashed; files that were only touched get
+    their manifest entry refreshed in place. Files chunked under another CHUNK_MODE count as changed.
+    """
+    current = listDocs(doc_folder)
+    removed = [filename for filename in manifest if filename not in current]
+    changed = []
+    for filename in current:
+        file_path = os.path.join(doc_folder, filename)
+        stat = os.stat(file_path)
+        old = manifest.get(filename)
+        if old and old.get("chunk_mode", "flat") != CHUNK_MODE:
+            old = None
+        if old and old.get("mtime") == stat.st_mtime and old.get("size") == stat.st_size:
+            continue
+        digest = file_digest(file_path)
+        entry = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": digest, "chunk_mode": CHUNK_MODE}
+        if old and old.get("sha256") == digest:
+            old.update(entry)
+            continue
+        changed.append((filename, entry))
+    return changed, removed
+
+def embed_docs_incremental(
+    doc_folder: str = "doc",
+    batch_size: int = EMBED_BATCH_SIZE,
+    full: bool = False,
+    workers: int = CHUNK_WORKERS,
+    max_in_flight: int = CHUNK_MAX_IN_FLIGHT
+) -> int:
+    """
+    Chunks and embeds only the doc/ files that are new or changed since the last run,
+    and deletes the chunks of files that were removed. Chunks are consumed straight from
+    chunk.streamChunks and encoded and upserted in batches of batch_size, together with
+    the judgment metadata (court, case number, date, case type, source) extracted for them. A file is
+    recorded in the manifest only once all of its chunks are stored, so an interrupted
+    run simply redoes the unfinished files. Files that cannot be read are left out of the
+    manifest and retried by the next run.
+    With full=True, or when no manifest exists yet, the collection is rebuilt from scratch.
+    Returns the number of chunks embedded by this call.
+    """
+    manifest = {} if full else load_manifest()
+    if not manifest and get_collection().count():
+        print("No manifest found, rebuilding collection from scratch")
+        reset_collection()
+    elif manifest and not get_collection().count():
+        # e.g. PARTITION_BY changed: the manifest describes collections that are not in use
+        print("Collection is empty, re-embedding every document")
+        manifest = {}
+    elif get_collection().count() and not get_lexical_index().count():
+        # Collection predates the lexical index
+        rebuild_lexical_index()
+
+    with stage("ingest_plan"):
+        changed, removed = plan_ingestion(doc_folder, manifest)
+    for filename in removed:
+        delete_source(filename)
+        del manifest[filename]
+        print(f"Removed chunks of deleted file {filename}")
+    save_manifest(manifest)
+    print(f"{len(changed)} new or changed files, {len(removed)} removed")
+    # Drop whatever an earlier version (or an interrupted run) stored for these files
+    for filename, _ in changed:
+        delete_source(filename)
+
+    started_at = time.perf_counter()
+    embedded = 0
+    queued = 0
+    texts, metadatas = [], []
+    pending = []  # (filename, entry, chunks queued once the file was fully chunked)
+    # Files are streamed in the order of `changed`, so reaching file k means all earlier ones are fully chunked
+    order = [filename for filename, _ in changed]
+    entries = dict(changed)
+    next_file = 0
+    seen = set()
+    failed = set()  # files chunk.streamChunks could not read
+
+    def flush():
+        nonlocal embedded, texts, metadatas
+        if texts:
+            embed_batch(texts, metadatas)
+            embedded += len(texts)
+            texts, metadatas = [], []
+            elapsed = time.perf_counter() - started_at
+            rate = embedded / elapsed if elapsed > 0 else 0.0
+            print(f"Embedded {embedded} chunks ({rate:.1f} chunks/sec)")
+        while pending and pending[0][2] <= embedded:
+            filename, entry, _ = pending.pop(0)
+            manifest[filename] = entry
+            save_manifest(manifest)
+
+    def finish_files_before(position: int):
+        nonlocal next_file, seen
+        while next_file < position:
+            filename = order[next_file]
+            if filename in failed:
+                # Left out of the manifest (its old chunks are gone), so the next run retries it
+                manifest.pop(filename, None)
+            else:
+                entries[filename]["chunks"] = len(seen)
+                pending.append((filename, entries[filename], queued))
+            seen = set()
+            next_file += 1
+
+    records = streamChunks(order, doc_folder, workers, max_in_flight, failed=failed)
+    for source, _, chunk, metadata in timed_iter("ingest_chunk", records):
+        if source != order[next_file]:
+            finish_files_before(order.index(source, next_file))
+        if chunk in seen:
+            continue
+        seen.add(chunk)
+        texts.append(chunk)
+        metadatas.append(metadata)
+        queued += 1
+        if len(texts) >= batch_size:
+            flush()
+    finish_files_before(len(order))
+    flush()
+    save_manifest(manifest)
+    if failed:
+        print(f"{len(failed)} files could not be read and will be retried: {', '.join(sorted(failed))}")
+
+    COLLECTION_CHUNKS.set(get_collection().count())
+    elapsed = time.perf_counter() - started_at
+    if embedded:
+        print(f"Embedded {embedded} chunks in {elapsed:.1f}s ({embedded / elapsed:.1f} chunks/sec)")
+    return embedded
+
 if __name__ == "__main__":
-    embed_chunks_from_chunkpy()
-    print(chroma_client.list_collections())
+    parser = argparse.ArgumentParser(description="Chunk, embed and store documents in ChromaDB.")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="number of chunks encoded and upserted together")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the manifest and re-embed every document")
+    parser.add_argument("--workers", type=int, default=CHUNK_WORKERS,
+                        help="processes used to read and split documents")
+    parser.add_argument("--max-in-flight", type=int, default=CHUNK_MAX_IN_FLIGHT,
+                        help="maximum number of documents being chunked or buffered at once")
+    parser.add_argument("--rebuild-lexical", action="store_true",
+                        help="only rebuild the lexical index from the stored chunks")
+    parser.add_argument("--partitions", action="store_true",
+                        help="list the partitions (PARTITION_BY) and their sizes")
+    parser.add_argument("--drop-partition", metavar="KEY",
+                        help="drop one partition, given by its key, court, year or source file")
+    parser.add_argument("--export", metavar="DIR",
+                        help="write the collection to a snapshot directory (no re-embedding needed to restore it)")
+    parser.add_argument("--import", dest="import_path", metavar="DIR",
+                        help="replace the collection with the contents of a snapshot directory")
+    parser.add_argument("--dtype", choices=DTYPES, default="float32",
+                        help="precision of the exported embedding matrix")
+    args = parser.parse_args()
+    if args.partitions:
+        collection = get_collection()
+        if not isinstance(collection, PartitionedCollection):
+            raise SystemExit("The collection is not partitioned; set PARTITION_BY to use partitions.")
+        for row in collection.describe():
+            print(f"{row['partition']:<16}{row['chunks']:>10}  {row['collection']}  {row['value']}")
+        raise SystemExit(0)
+    with ingestion_lock():
+        if args.drop_partition:
+            drop_partition(args.drop_partition)
+        elif args.export:
+            export_snapshot(args.export, args.dtype)
+        elif args.import_path:
+            import_snapshot(args.import_path)
+        elif args.rebuild_lexical:
+            rebuild_lexical_index()
+        else:
+            embed_docs_incremental(batch_size=args.batch_size, full=args.full,
+                                   workers=args.workers, max_in_flight=args.max_in_flight)
+    print(get_client().list_collections())
@@ -0,0 +1,84 @@
+import importlib.util
+import logging
+import os
+from typing import List
+
+# Embedding backend used by both ingestion and serving:
+#   torch       full-precision PyTorch (the original setup)
+#   torch-int8  PyTorch with dynamic int8 quantization of the Linear layers
+#   onnx        ONNX Runtime with the model's exported fp32 graph
+#   onnx-int8   ONNX Runtime with a pre-quantized int8 graph (ONNX_INT8_FILE)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+# Backend loaded instead when the configured one's packages are missing (e.g. torch);
+# empty makes loading fail instead
+EMBEDDING_BACKEND_FALLBACK = os.getenv("EMBEDDING_BACKEND_FALLBACK", "")
+# Modules a backend needs beyond sentence-transformers and torch, and how to install them
+BACKEND_MODULES = {
+    "onnx": ("onnxruntime", "optimum.onnxruntime"),
+    "onnx-int8": ("onnxruntime", "optimum.onnxruntime"),
+}
+BACKEND_INSTALL = {
+    "onnx": 'pip install "sentence-transformers[onnx]"',
+    "onnx-int8": 'pip install "sentence-transformers[onnx]"',
+}
+# all-MiniLM-L6-v2 ships several int8 graphs; pick the one matching the CPU (e.g. onnx/model_quint8_avx2.onnx)
+ONNX_INT8_FILE = os.getenv("ONNX_INT8_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+TORCH_NUM_THREADS = os.getenv("TORCH_NUM_THREADS")
+
+
+def missing_modules(backend: str) -> List[str]:
+    missing = []
+    for name in BACKEND_MODULES.get(backend, ()):
+        try:
+            found = importlib.util.find_spec(name) is not None
+        except ModuleNotFoundError:
+            # The parent package of a dotted name is missing
+            found = False
+        if not found:
+            missing.append(name)
+    return missing
+
+def select_backend(backend: str = EMBEDDING_BACKEND, fallback: str = EMBEDDING_BACKEND_FALLBACK) -> str:
+    """
+    Returns the backend to load: backend itself, or fallback if backend's packages are
+    not installed. Raises ValueError for an unknown backend and ImportError, naming the
+    packages to install, when backend cannot be loaded and there is no fallback.
+    """
+    for name in (backend, fallback):
+        if name and name not in BACKENDS:
+            raise ValueError(f"Unknown EMBEDDING_BACKEND '{name}'. Choose one of: {', '.join(BACKENDS)}.")
+    missing = missing_modules(backend)
+    if not missing:
+        return backend
+    if fallback and fallback != backend and not missing_modules(fallback):
+        logging.warning(f"EMBEDDING_BACKEND={backend} needs {', '.join(missing)}; using {fallback} instead")
+        return fallback
+    raise ImportError(f"EMBEDDING_BACKEND={backend} needs {', '.join(missing)}, which is not installed. "
+                      f"Run {BACKEND_INSTALL[backend]} or choose another backend.")
+
+def load_encoder(model_name: str, backend: str = EMBEDDING_BACKEND, fallback: str = EMBEDDING_BACKEND_FALLBACK):
+    """
+    Loads model_name with the requested backend (see select_backend) and returns a
+    SentenceTransformer, so callers keep using .encode() regardless of the backend.
+    Vectors from every backend live in the same space, but quantized backends are
+    approximations: use src/benchmark/encoder_bench.py to check their recall first.
+    """
+    backend = select_backend(backend, fallback)
+    # Imported here: sentence_transformers pulls in torch
+    from sentence_transformers import SentenceTransformer
+    if TORCH_NUM_THREADS:
+        import torch
+        torch.set_num_threads(int(TORCH_NUM_THREADS))
+
+    if backend == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+    if backend == "torch-int8":
+        import torch
+        model = SentenceTransformer(model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx",
+                                   model_kwargs={"file_name": ONNX_INT8_FILE})
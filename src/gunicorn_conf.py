@@ -0,0 +1,58 @@
+"""
+Gunicorn settings for serving query.py with several worker processes:
+
+    gunicorn -c src/gunicorn_conf.py src.query:app
+
+The app is imported once in the master (preload_app) with PRELOAD_MODEL=1, so the
+embedding model's weights are loaded before fork and shared copy-on-write by all
+workers. Each worker then opens its own Chroma client and lexical index, read-only
+(SERVING_READ_ONLY=1), and warms up before it reports ready.
+
+Ingestion (python src/embedding.py) runs as a separate process that holds
+chromadb_data/ingest.lock. When it has finished, send the master SIGHUP so the
+workers are replaced and reopen the store.
+"""
+import gc
+import os
+import sys
+
+# Read when the app is imported, which happens right after this file is loaded
+os.environ.setdefault("PRELOAD_MODEL", "1")
+os.environ.setdefault("SERVING_READ_ONLY", "1")
+# The tokenizers thread pool does not survive fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Workers load the Chroma index and run a first inference while starting up
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+
+def on_starting(server):
+    # Metrics files of earlier runs would otherwise be merged into /metrics; the
+    # preloaded app has already created this process's own
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        for filename in os.listdir(directory):
+            if filename.endswith(".db") and not filename.endswith(f"_{os.getpid()}.db"):
+                os.remove(os.path.join(directory, filename))
+
+def pre_fork(server, worker):
+    # Move everything allocated so far (model included) out of the collector's reach, so
+    # garbage collection in a worker does not write to, and so copy, the shared pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # Split the cores between the workers instead of each using all of them
+    if "torch" in sys.modules and not os.getenv("TORCH_NUM_THREADS"):
+        import torch
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // server.cfg.workers))
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,236 @@
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from cache import TTLCache
+from chunk import CASE_NUMBER_PATTERN
+from store import CHROMA_PATH
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(CHROMA_PATH, "lexical.sqlite3"))
+NGRAM_SIZE = 2
+# A search uses at most this many of the question's n-grams, rarest first, and adds
+# rarer ones only while the chunks containing them total at most LEXICAL_MAX_CANDIDATES
+LEXICAL_MAX_TERMS = int(os.getenv("LEXICAL_MAX_TERMS", 8))
+LEXICAL_MAX_CANDIDATES = int(os.getenv("LEXICAL_MAX_CANDIDATES", 2000))
+# Seconds the document frequency of an n-gram is cached
+LEXICAL_DF_TTL = float(os.getenv("LEXICAL_DF_TTL", 300))
+
+
+def normalize_text(text: str) -> str:
+    """
+    NFKC (full-width to half-width), lower-cased, with all whitespace removed,
+    so "（2020）豫行终 3143 号" and "(2020)豫行终3143号" index the same way.
+    """
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text)).lower()
+
+def ngrams(text: str, n: int = NGRAM_SIZE) -> List[str]:
+    """
+    Character n-grams of the normalized text. Chinese has no word boundaries, so
+    overlapping bigrams are used as terms; texts shorter than n yield themselves.
+    """
+    text = normalize_text(text)
+    if len(text) <= n:
+        return [text] if text else []
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+def term_tokens(text: str) -> List[str]:
+    """
+    The n-grams of text spelled as ASCII tokens (code points in hex joined by "x"), so
+    that FTS5's default tokenizer keeps every n-gram whole, punctuation included.
+    """
+    return ["x".join(f"{ord(char):x}" for char in term) for term in ngrams(text)]
+
+def identifiers(text: str) -> List[str]:
+    """
+    The case numbers in text, normalized, e.g. "(2020)豫行终3143号".
+    """
+    return list(dict.fromkeys(CASE_NUMBER_PATTERN.findall(normalize_text(text))))
+
+
+class LexicalIndex:
+    """
+    Persistent character n-gram index with BM25 scoring, kept in SQLite next to the
+    Chroma store. Chunks are stored in a docs table and their n-grams in a contentless
+    FTS5 table sharing its rowids, so a search only reads the postings of the query's
+    terms from disk and lets SQLite rank them with bm25() (k1=1.2, b=0.75); nothing is
+    held in memory, and every search sees what other connections have committed.
+    Case numbers are also kept whole in an identifiers table, so looking one up is a
+    single B-tree search however common its n-grams are.
+    With read_only=True the database is opened with mode=ro: it must already exist,
+    and add/delete_source/clear raise sqlite3.OperationalError. An index written by an
+    earlier version is converted on a writable open; read-only it raises ValueError.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._document_frequencies = TTLCache(max_size=100000, ttl=LEXICAL_DF_TTL)
+        if read_only:
+            uri = pathlib.Path(path).absolute().as_uri() + "?mode=ro"
+            self._db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            tables = self._tables()
+            if not {"docs", "ngram_index", "identifiers"} <= tables:
+                self._db.close()
+                raise ValueError(f"Lexical index {path} was written by an earlier version and cannot be read. "
+                                 f"Run python src/embedding.py --rebuild-lexical, or set HYBRID_SEARCH=0.")
+        else:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            tables = self._tables()
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS docs (
+                    id TEXT PRIMARY KEY, source TEXT, text TEXT, metadata TEXT, length INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS docs_source ON docs (source);
+                CREATE VIRTUAL TABLE IF NOT EXISTS ngram_index USING fts5(terms, content='');
+                CREATE TABLE IF NOT EXISTS identifiers (identifier TEXT, doc INTEGER);
+                CREATE INDEX IF NOT EXISTS identifiers_identifier ON identifiers (identifier);
+                CREATE INDEX IF NOT EXISTS identifiers_doc ON identifiers (doc);
+            """)
+            # Indexes written by earlier versions kept their postings in a plain table, or had no identifiers
+            rows = self._db.execute("SELECT rowid, text FROM docs").fetchall() \
+                if "postings" in tables or "identifiers" not in tables else []
+            if "postings" in tables:
+                self._db.execute("DROP TABLE postings")
+                self._db.executemany("INSERT INTO ngram_index (rowid, terms) VALUES (?, ?)",
+                                     ((rowid, " ".join(term_tokens(text))) for rowid, text in rows))
+            self._db.executemany("INSERT INTO identifiers (identifier, doc) VALUES (?, ?)",
+                                 ((identifier, rowid) for rowid, text in rows for identifier in identifiers(text)))
+            self._db.commit()
+        # Document frequencies of the n-grams, read from the FTS5 index; temp, so read-only works too
+        self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.ngram_vocab USING fts5vocab(main, ngram_index, row)")
+
+    def _tables(self) -> set:
+        return {row[0] for row in self._db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def add(self, ids: List[str], texts: List[str], sources: List[str], metadatas: Optional[List[dict]] = None):
+        """
+        Indexes (or re-indexes) documents under the given ids.
+        """
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            for doc_id, text, source, metadata in zip(ids, texts, sources, metadatas):
+                self._delete("id = ?", (doc_id,))
+                tokens = term_tokens(text)
+                rowid = self._db.execute(
+                    "INSERT INTO docs (id, source, text, metadata, length) VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, source, text, json.dumps(metadata, ensure_ascii=False), len(tokens))
+                ).lastrowid
+                self._db.execute("INSERT INTO ngram_index (rowid, terms) VALUES (?, ?)", (rowid, " ".join(tokens)))
+                self._db.executemany("INSERT INTO identifiers (identifier, doc) VALUES (?, ?)",
+                                     ((identifier, rowid) for identifier in identifiers(text)))
+            self._db.commit()
+        self._document_frequencies.clear()
+
+    def delete_source(self, source: str):
+        """
+        Removes every document that came from the given doc/ file.
+        """
+        with self._lock:
+            self._delete("source = ?", (source,))
+            self._db.commit()
+        self._document_frequencies.clear()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("INSERT INTO ngram_index (ngram_index) VALUES ('delete-all')")
+            self._db.execute("DELETE FROM identifiers")
+            self._db.execute("DELETE FROM docs")
+            self._db.commit()
+        self._document_frequencies.clear()
+
+    def get(self, ids: List[str]) -> Dict[str, dict]:
+        """
+        Returns {id: {"text", "source", "metadata"}} for the ids that are indexed.
+        """
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, text, source, metadata FROM docs WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        return {row[0]: {"text": row[1], "source": row[2], "metadata": json.loads(row[3] or "{}")} for row in rows}
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (id, score) pairs, best first. Chunks containing a case number
+        named in the query come first, with an infinite score. The rest are ranked by
+        bm25 over the query's rarest n-grams (see LEXICAL_MAX_TERMS), so n-grams found in
+        almost every chunk, such as "法院", do not make every chunk a candidate.
+        """
+        if k <= 0:
+            return []
+        text = normalize_text(query)
+        wanted = identifiers(text)
+        with self._lock:
+            hits = []
+            if wanted:
+                rows = self._db.execute(
+                    "SELECT DISTINCT docs.id FROM identifiers JOIN docs ON docs.rowid = identifiers.doc "
+                    f"WHERE identifier IN ({','.join('?' * len(wanted))}) LIMIT ?", (*wanted, k)
+                ).fetchall()
+                hits = [(doc_id, float("inf")) for doc_id, in rows]
+            if len(hits) >= k:
+                return hits
+            # A case number that was found needs no n-gram search; one that was not may be misspelt
+            pieces = CASE_NUMBER_PATTERN.split(text) if hits else [text]
+            tokens = list(dict.fromkeys(token for piece in pieces for token in term_tokens(piece)))
+            terms = self._rare_terms(tokens)
+            if not terms:
+                return hits
+            found = {doc_id for doc_id, _ in hits}
+            rows = self._db.execute(
+                "SELECT docs.id, ngram_index.rank FROM ngram_index JOIN docs ON docs.rowid = ngram_index.rowid "
+                "WHERE ngram_index MATCH ? ORDER BY ngram_index.rank LIMIT ?",
+                (" OR ".join(f'"{token}"' for token in terms), k)
+            ).fetchall()
+        # bm25() is negated so that better matches sort first in SQL
+        return (hits + [(doc_id, -rank) for doc_id, rank in rows if doc_id not in found])[:k]
+
+    def _rare_terms(self, tokens: List[str]) -> List[str]:
+        frequencies = {token: self._document_frequencies.get(token) for token in tokens}
+        missing = [token for token, frequency in frequencies.items() if frequency is None]
+        if missing:
+            counted = dict(self._db.execute(
+                f"SELECT term, doc FROM temp.ngram_vocab WHERE term IN ({','.join('?' * len(missing))})", missing
+            ).fetchall())
+            for token in missing:
+                frequencies[token] = counted.get(token, 0)
+                self._document_frequencies.set(token, frequencies[token])
+        terms, candidates = [], 0
+        for token in sorted((token for token in tokens if frequencies[token]), key=frequencies.get):
+            # The rarest n-gram is always used, even when it is common
+            if terms and (len(terms) == LEXICAL_MAX_TERMS or candidates + frequencies[token] > LEXICAL_MAX_CANDIDATES):
+                break
+            terms.append(token)
+            candidates += frequencies[token]
+        return terms
+
+    def _delete(self, condition: str, parameters: tuple):
+        # A contentless FTS5 row is deleted by passing back the terms it was indexed with
+        rows = self._db.execute(f"SELECT rowid, text FROM docs WHERE {condition}", parameters).fetchall()
+        self._db.executemany("INSERT INTO ngram_index (ngram_index, rowid, terms) VALUES ('delete', ?, ?)",
+                             ((rowid, " ".join(term_tokens(text))) for rowid, text in rows))
+        self._db.executemany("DELETE FROM identifiers WHERE doc = ?", ((rowid,) for rowid, _ in rows))
+        self._db.execute(f"DELETE FROM docs WHERE {condition}", parameters)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Fuses several ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
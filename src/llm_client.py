@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Optional
+import httpx
+from metrics import LLM_RETRIES
+
+DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 10))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", 0.5))
+
+# Status codes worth retrying: rate limiting and transient server-side failures
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    Raised when the LLM call fails after all retries.
+    """
+
+
+class DeepseekClient:
+    """
+    Async, connection-pooled client for the Deepseek chat completions API.
+    Keeps one httpx.AsyncClient (and its TLS connections) per event loop, bounds the
+    number of in-flight requests with a semaphore, applies per-request timeouts and
+    retries transient failures with exponential backoff and jitter.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        api_url: str = DEEPSEEK_API_URL,
+        model: str = DEEPSEEK_MODEL,
+        timeout: float = LLM_TIMEOUT,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff: float = LLM_BACKOFF
+    ):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.model = model
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    async def _ensure_client(self):
+        # httpx clients and asyncio semaphores are bound to the loop they were created on
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                await self._close_stale(self._client, self._loop)
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    @staticmethod
+    async def _close_stale(client: httpx.AsyncClient, loop):
+        # The client of a loop that is still running elsewhere is closed on that loop;
+        # otherwise (e.g. after asyncio.run returned) its connections are closed from here
+        try:
+            if loop is not None and loop.is_running() and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            else:
+                await client.aclose()
+        except RuntimeError as e:
+            logging.warning(f"Could not close the LLM client of a previous event loop: {e}")
+
+    async def chat(self, prompt: str) -> str:
+        """
+        Sends a single user message and returns the assistant's reply.
+        Raises LLMError once retries are exhausted, on a non-retryable error response or
+        when a 200 response does not hold a reply.
+        """
+        client = await self._ensure_client()
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ]
+        }
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = self.backoff * (2 ** (attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay))
+            try:
+                async with self._semaphore:
+                    response = await client.post(self.api_url, headers=headers, json=data)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                last_error = f"{type(e).__name__}: {e}"
+                LLM_RETRIES.labels(type(e).__name__).inc()
+                logging.warning(f"LLM request failed (attempt {attempt + 1}): {last_error}")
+                continue
+            if response.status_code == 200:
+                try:
+                    content = response.json()['choices'][0]['message']['content']
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    raise LLMError(f"Malformed LLM response ({type(e).__name__}: {e}): {response.text[:200]}")
+                if not isinstance(content, str):
+                    raise LLMError(f"Malformed LLM response (content is {type(content).__name__}): {response.text[:200]}")
+                return content
+            last_error = f"{response.status_code} {response.text}"
+            LLM_RETRIES.labels(str(response.status_code)).inc()
+            if response.status_code not in RETRYABLE_STATUS:
+                break
+            logging.warning(f"LLM request failed (attempt {attempt + 1}): {last_error}")
+        raise LLMError(last_error)
+
+    async def aclose(self):
+        """
+        Closes the pooled connections.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
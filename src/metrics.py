@@ -0,0 +1,37 @@
+import os
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Prometheus metrics of the RAG pipeline, served by query.py on GET /metrics.
+# With several worker processes (gunicorn_conf.py), set PROMETHEUS_MULTIPROC_DIR to an
+# empty directory: every process writes its metrics there and render() merges them.
+
+# Pipeline stages timed by timing.stage(): encode, vector_search, lexical_search, rerank,
+# expand, assemble, prompt, llm, and the ingest_* stages of embedding.py
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Time spent in each pipeline stage", ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+REQUEST_SECONDS = Histogram(
+    "rag_request_seconds", "End-to-end latency of query requests", ["endpoint"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+REQUESTS = Counter("rag_requests_total", "Query requests by endpoint and HTTP status", ["endpoint", "status"])
+PROMPT_TOKENS = Histogram(
+    "rag_prompt_tokens", "Estimated tokens in each prompt sent to the LLM",
+    buckets=(250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000, 32000)
+)
+LLM_REQUESTS = Counter("rag_llm_requests_total", "LLM calls by outcome (ok, error)", ["outcome"])
+LLM_RETRIES = Counter("rag_llm_retries_total", "Failed LLM attempts that were retried or gave up, by reason", ["reason"])
+COLLECTION_CHUNKS = Gauge("rag_collection_chunks", "Chunks stored in the ChromaDB collection", multiprocess_mode="livemax")
+INGESTED_CHUNKS = Counter("rag_ingested_chunks_total", "Chunks embedded and stored by ingestion")
+
+
+def render():
+    """
+    Returns (body, content type) of the current metrics in the Prometheus text format.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,76 @@
+import os
+import pathlib
+import sqlite3
+import threading
+from typing import Dict, List, Tuple
+from store import CHROMA_PATH
+
+PARENT_STORE_PATH = os.getenv("PARENT_STORE_PATH", os.path.join(CHROMA_PATH, "parents.sqlite3"))
+
+
+class ParentStore:
+    """
+    Parent sections of hierarchically chunked judgments (chunk.CHUNK_MODE=hierarchical).
+    Only the small children are embedded; each parent is stored here once, in SQLite
+    next to the Chroma store, and read back by id when the contexts of an answer are assembled.
+    With read_only=True the database is opened with mode=ro and must already exist.
+    """
+
+    def __init__(self, path: str = PARENT_STORE_PATH, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        if read_only:
+            uri = pathlib.Path(path).absolute().as_uri() + "?mode=ro"
+            self._db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS parents (
+                id TEXT PRIMARY KEY, source TEXT, section TEXT, parent_index INTEGER, text TEXT
+            );
+            CREATE INDEX IF NOT EXISTS parents_source ON parents (source);
+        """)
+        self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM parents").fetchone()[0]
+
+    def add(self, parents: List[Tuple[str, str, str, int, str]]):
+        """
+        Stores (id, source, section, parent_index, text) rows, replacing rows with the same id.
+        """
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO parents VALUES (?, ?, ?, ?, ?)", parents)
+            self._db.commit()
+
+    def get(self, ids: List[str]) -> Dict[str, dict]:
+        """
+        Returns {id: {"text", "source", "section", "parent_index"}} for the ids that are stored.
+        """
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, text, source, section, parent_index FROM parents WHERE id IN ({','.join('?' * len(ids))})",
+                ids
+            ).fetchall()
+        return {row[0]: {"text": row[1], "source": row[2], "section": row[3], "parent_index": row[4]} for row in rows}
+
+    def rows(self) -> List[Tuple[str, str, str, int, str]]:
+        """
+        Returns every parent as an (id, source, section, parent_index, text) row, as add() takes them.
+        """
+        with self._lock:
+            return self._db.execute("SELECT id, source, section, parent_index, text FROM parents ORDER BY rowid").fetchall()
+
+    def delete_source(self, source: str):
+        with self._lock:
+            self._db.execute("DELETE FROM parents WHERE source = ?", (source,))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM parents")
+            self._db.commit()
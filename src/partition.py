@@ -0,0 +1,254 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# How chunks are spread over collections:
+#   none     one collection (COLLECTION_NAME), the original setup
+#   court    one collection per court
+#   year     one collection per judgment year
+#   shard:N  N collections, chunks assigned by a hash of their source file
+PARTITION_BY = os.getenv("PARTITION_BY", "none")
+# Threads searching partitions at the same time
+PARTITION_SEARCH_WORKERS = int(os.getenv("PARTITION_SEARCH_WORKERS", 8))
+# Metadata field each scheme partitions on; filters on it limit the partitions searched
+PARTITION_FIELDS = {"court": "court", "year": "year", "shard": "source"}
+SEPARATOR = "__"
+UNKNOWN = "unknown"
+
+_executor = ThreadPoolExecutor(max_workers=PARTITION_SEARCH_WORKERS, thread_name_prefix="partition-search")
+
+
+def parse_scheme(scheme: str) -> Tuple[str, int]:
+    """
+    Returns (kind, shard count) for a PARTITION_BY value; the shard count is 0 unless kind is "shard".
+    """
+    if scheme in ("none", "court", "year"):
+        return scheme, 0
+    if scheme.startswith("shard:") and scheme[len("shard:"):].isdigit() and int(scheme[len("shard:"):]) > 0:
+        return "shard", int(scheme[len("shard:"):])
+    raise ValueError(f"Unknown PARTITION_BY '{scheme}'. Choose one of: none, court, year, shard:N.")
+
+def partition_key(kind: str, shards: int, value) -> str:
+    """
+    Partition of a chunk whose PARTITION_FIELDS[kind] metadata is value. Keys are valid
+    in collection names: years as they are, courts and shards from a sha256 of the value.
+    """
+    if value is None or value == "":
+        return UNKNOWN
+    digest = hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+    if kind == "shard":
+        return str(int(digest, 16) % shards)
+    if kind == "year":
+        return str(value)
+    return digest[:12]
+
+def where_values(where: Optional[dict], field: str) -> Optional[set]:
+    """
+    Values a query.build_where clause allows for field, or None when it does not restrict it.
+    """
+    if not where:
+        return None
+    if "$and" in where:
+        for clause in where["$and"]:
+            values = where_values(clause, field)
+            if values is not None:
+                return values
+        return None
+    condition = where.get(field)
+    if condition is None:
+        return None
+    if isinstance(condition, dict):
+        if "$in" in condition:
+            return set(condition["$in"])
+        if "$eq" in condition:
+            return {condition["$eq"]}
+        return None
+    return {condition}
+
+def _values(result: dict, field: str) -> list:
+    # Chroma returns embeddings as a NumPy array, whose truth value is ambiguous
+    values = result.get(field)
+    return [] if values is None else list(values)
+
+
+class PartitionedCollection:
+    """
+    Spreads chunks over one Chroma collection per partition (named
+    <base_name>__<kind>_<key>) behind the subset of the collection API that
+    ingestion and query use, so each partition has its own, smaller HNSW index.
+
+    upsert routes every chunk to its partition, creating it on first use. query
+    searches the partitions the where clause allows at the same time and merges
+    the hits by distance. Partitions are independent: adding a year creates a new
+    collection without touching the others, and drop() removes one.
+    """
+
+    def __init__(self, client, base_name: str, scheme: str, wrap=None, create: bool = True):
+        """
+        Args:
+            client: Chroma client holding the partitions
+            base_name: Prefix of the partition collection names (COLLECTION_NAME)
+            scheme: A PARTITION_BY value other than "none"
+            wrap: Applied to each opened collection (e.g. store.ReadOnlyCollection)
+            create: Whether upsert may create missing partitions
+        """
+        self.kind, self.shards = parse_scheme(scheme)
+        if self.kind == "none":
+            raise ValueError("PartitionedCollection needs a PARTITION_BY other than 'none'.")
+        self.field = PARTITION_FIELDS[self.kind]
+        self.client = client
+        self.prefix = f"{base_name}{SEPARATOR}{self.kind}_"
+        self.wrap = wrap or (lambda collection: collection)
+        self.create = create
+        self._partitions = {}  # key -> collection
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Opens every partition of this scheme that exists in the store.
+        """
+        with self._lock:
+            for collection in self.client.list_collections():
+                name = getattr(collection, "name", collection)
+                key = name[len(self.prefix):]
+                if name.startswith(self.prefix) and key not in self._partitions:
+                    self._partitions[key] = self.wrap(self.client.get_collection(name))
+
+    def partitions(self) -> Dict[str, object]:
+        with self._lock:
+            return dict(self._partitions)
+
+    def partition(self, key: str):
+        """
+        Returns the collection of a partition, creating it when allowed.
+        """
+        with self._lock:
+            if key not in self._partitions:
+                if not self.create:
+                    raise PermissionError(f"Partition '{key}' does not exist and this process may not create it.")
+                self._partitions[key] = self.wrap(self.client.get_or_create_collection(
+                    self.prefix + key, metadata={"partition_by": self.kind}
+                ))
+            return self._partitions[key]
+
+    def key_of(self, metadata: dict) -> str:
+        return partition_key(self.kind, self.shards, (metadata or {}).get(self.field))
+
+    def describe(self) -> List[dict]:
+        """
+        Returns [{"partition", "collection", "chunks", "value"}] sorted by partition key,
+        where value is the court, year or a source file of the partition.
+        """
+        rows = []
+        for key, collection in sorted(self.partitions().items()):
+            sample = collection.get(limit=1, include=["metadatas"])["metadatas"]
+            rows.append({"partition": key, "collection": self.prefix + key, "chunks": collection.count(),
+                         "value": (sample[0] or {}).get(self.field) if sample else None})
+        return rows
+
+    def drop(self, key: str) -> bool:
+        """
+        Deletes the collection of one partition. Returns False if it did not exist.
+        """
+        if not self.create:
+            raise PermissionError("Partitions can only be dropped by ingestion.")
+        with self._lock:
+            if key not in self._partitions:
+                return False
+            del self._partitions[key]
+            self.client.delete_collection(self.prefix + key)
+            return True
+
+    def count(self) -> int:
+        return sum(collection.count() for collection in self.partitions().values())
+
+    def upsert(self, ids: List[str], embeddings: list, documents: List[str], metadatas: List[dict]):
+        groups = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(self.key_of(metadata), []).append(i)
+        for key, rows in groups.items():
+            self.partition(key).upsert(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                documents=[documents[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows]
+            )
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None):
+        for collection in self._searched(where).values():
+            collection.delete(ids=ids, where=where)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: List[str] = ("metadatas", "documents")) -> dict:
+        """
+        Like Collection.get over all partitions, which are read in partition key order,
+        so limit/offset page through them consistently.
+        """
+        result = {"ids": [], **{field: [] for field in include}}
+        skip, remaining = offset or 0, limit
+        for key, collection in sorted(self._searched(where).items()):
+            if remaining is not None and remaining <= 0:
+                break
+            if ids is None and where is None:
+                # Skip whole partitions without reading them
+                size = collection.count()
+                if skip >= size:
+                    skip -= size
+                    continue
+                page = collection.get(limit=remaining, offset=skip, include=list(include))
+                skip = 0
+            else:
+                page = collection.get(ids=ids, where=where, include=list(include))
+                rows = len(page["ids"])
+                page = {field: _values(page, field)[min(skip, rows):] for field in ["ids", *include]}
+                skip = max(0, skip - rows)
+                if remaining is not None:
+                    page = {field: values[:remaining] for field, values in page.items()}
+            for field in result:
+                result[field].extend(_values(page, field))
+            if remaining is not None:
+                remaining -= len(page["ids"])
+        return result
+
+    def query(self, query_embeddings: list, n_results: int = 10, where: Optional[dict] = None,
+              include: List[str] = ("metadatas", "documents")) -> dict:
+        """
+        Searches the partitions allowed by where concurrently and keeps, for each query,
+        the n_results hits with the smallest distance across all of them.
+        """
+        fields = [field for field in include if field != "distances"]
+        partitions = list(self._searched(where).values())
+
+        def search(collection):
+            return collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where,
+                                    include=[*fields, "distances"])
+
+        if len(partitions) > 1:
+            results = list(_executor.map(search, partitions))
+        else:
+            results = [search(collection) for collection in partitions]
+        merged = {"ids": [], "distances": [], **{field: [] for field in fields}}
+        for q in range(len(query_embeddings)):
+            hits = []
+            for result in results:
+                for i, distance in enumerate((result.get("distances") or [[]] * len(query_embeddings))[q]):
+                    hits.append((distance, result, i))
+            hits.sort(key=lambda hit: hit[0])
+            hits = hits[:n_results]
+            merged["ids"].append([result["ids"][q][i] for _, result, i in hits])
+            merged["distances"].append([distance for distance, _, _ in hits])
+            for field in fields:
+                merged[field].append([result[field][q][i] for _, result, i in hits])
+        return merged
+
+    def _searched(self, where: Optional[dict]) -> Dict[str, object]:
+        # Partitions that can hold chunks matching where
+        partitions = self.partitions()
+        values = where_values(where, self.field)
+        if values is None:
+            return partitions
+        keys = {partition_key(self.kind, self.shards, value) for value in values}
+        return {key: collection for key, collection in partitions.items() if key in keys}
@@ -1,68 +1,389 @@
+import time
+_import_started_at = time.perf_counter()
+
 from dotenv import load_dotenv
+import asyncio
 import os
-import chromadb
-from sentence_transformers import SentenceTransformer
-import requests
+import sys
+import hashlib
+import re
+import threading
+import unicodedata
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
-import uvicorn
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 import logging
 
+# Allow sibling modules to be imported when served as `uvicorn src.query:app`
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from batcher import MicroBatcher
+from cache import TTLCache
+from chunk import CHUNK_MODE
+from context import CONTEXT_TOKEN_BUDGET, estimate_tokens, pack_contexts
+from encoder import select_backend
+from lexical import reciprocal_rank_fusion
+from llm_client import DeepseekClient, LLMError
+import metrics
+from rerank import RERANK_CANDIDATES, RERANK_ENABLED, RERANK_TOP_K
+from store import (collection_loaded, get_collection, get_lexical_index, get_model, get_parent_store,
+                   get_prompt_template, get_reranker, load_timings)
+from timing import current_timings, server_timing, stage, start_request
+
 load_dotenv()
 API_KEY = os.getenv("DEEPSEEK_API_KEY")
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", 1024))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 1024))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH")  # optional SQLite file backing the answer cache
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", 1000))
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+N_RESULTS = 10
+ENCODER_MAX_BATCH_SIZE = int(os.getenv("ENCODER_MAX_BATCH_SIZE", 32))
+ENCODER_MAX_WAIT_MS = float(os.getenv("ENCODER_MAX_WAIT_MS", 5))
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+# Adds a Server-Timing header with the stage timings to /query and /query/batch responses
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "0") == "1"
+# Loads the model weights at import, so a pre-forking server (gunicorn_conf.py) loads them
+# once and its workers share them copy-on-write
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "0") == "1"
+
+# The model, Chroma client, lexical index and prompt template are loaded lazily by
+# store.py (or up front by warmup()), so importing this module stays cheap; only
+# PRELOAD_MODEL=1 loads the model at import.
+
+# Groups concurrent single-question encodes into one forward pass
+encoder_batcher = MicroBatcher(
+    lambda texts: get_model().encode(texts, batch_size=len(texts)).tolist(),
+    max_batch_size=ENCODER_MAX_BATCH_SIZE,
+    max_wait_ms=ENCODER_MAX_WAIT_MS
+)
+
+# LRU of question embeddings (no expiry: the model is fixed for the life of the process)
+embedding_cache = TTLCache(max_size=QUERY_EMBED_CACHE_SIZE, ttl=float("inf"))
+# Answers keyed on the normalized question plus the ids of the retrieved contexts
+answer_cache = TTLCache(max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, sqlite_path=ANSWER_CACHE_PATH, table="answers")
+
+def normalize_question(question: str) -> str:
+    """
+    Canonical form of a question used for cache keys: NFKC (full-width to half-width,
+    so （2020） and (2020) match), lower-cased, with whitespace collapsed.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", question)).strip().lower()
+
+def encode_questions(questions: list) -> list:
+    """
+    Returns one embedding per question. Cached embeddings are reused. Remaining questions
+    go through the micro-batcher, so they share a forward pass with concurrent requests;
+    a set at least as large as a micro-batch is encoded directly in one pass.
+    """
+    keys = [question.strip() for question in questions]
+    vectors = [embedding_cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+    if missing:
+        with stage("encode"):
+            if len(missing) >= ENCODER_MAX_BATCH_SIZE:
+                encoded = dict(zip(missing, get_model().encode(missing, batch_size=len(missing)).tolist()))
+            else:
+                encoded = dict(zip(missing, encoder_batcher.encode_many(missing)))
+        for key, vector in encoded.items():
+            embedding_cache.set(key, vector)
+        vectors = [vector if vector is not None else encoded[key] for key, vector in zip(keys, vectors)]
+    return vectors
+
+def encode_question(question: str) -> list:
+    """
+    Returns the embedding of a question, memoised in an LRU cache.
+    """
+    return encode_questions([question])[0]
+
+# Chunk metadata fields that can be used as query filters
+FILTER_FIELDS = {"source", "court", "case_number", "judgment_date", "year", "case_type"}
+
+def filter_values(field: str, value) -> list:
+    """
+    The values a filter accepts for one field: a scalar or a non-empty list of scalars
+    (years as ints). Raises ValueError for unknown fields, empty lists and anything else,
+    such as operator objects, which the lexical side could not apply the same way.
+    """
+    if field not in FILTER_FIELDS:
+        raise ValueError(f"Unknown filter '{field}'. Allowed: {', '.join(sorted(FILTER_FIELDS))}.")
+    values = value if isinstance(value, list) else [value]
+    if not values:
+        raise ValueError(f"Filter '{field}' must not be an empty list.")
+    for item in values:
+        if not isinstance(item, (str, int, float)) or isinstance(item, bool):
+            raise ValueError(f"Filter '{field}' must be a string or number, or a list of them.")
+    if field == "year":
+        values = [int(v) for v in values]
+    return values
+
+def build_where(filters: dict = None):
+    """
+    Turns {"court": ..., "year": ..., "case_type": ..., "source": ...} into a Chroma where clause.
+    A list value matches any of its items. Raises ValueError for invalid filters (see filter_values).
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("'filters' must be an object.")
+    clauses = []
+    for field, value in filters.items():
+        values = filter_values(field, value)
+        clauses.append({field: {"$in": values}} if len(values) > 1 else {field: values[0]})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def matches_filters(metadata: dict, filters: dict = None) -> bool:
+    """
+    Python-side equivalent of build_where, used for lexical hits.
+    """
+    for field, value in (filters or {}).items():
+        if metadata.get(field) not in filter_values(field, value):
+            return False
+    return True
+
+def fuse_with_lexical(question: str, vector_ids: list, vector_docs: list, vector_metas: list,
+                      n_results: int = N_RESULTS, filters: dict = None):
+    """
+    Merges the vector hits with BM25 hits from the lexical index using reciprocal rank fusion,
+    so exact identifiers such as case numbers or party names are found even when the
+    dense vectors miss them. Lexical hits are held to the same filters as the vector query.
+    Returns the fused (ids, contexts, metadatas).
+    """
+    if filters:
+        # Over-fetch, since some lexical hits will be filtered out
+        hits = get_lexical_index().search(question, n_results * 5)
+        found = get_lexical_index().get([doc_id for doc_id, _ in hits])
+        lexical_ids = [doc_id for doc_id, _ in hits
+                       if doc_id in found and matches_filters(found[doc_id]["metadata"], filters)][:n_results]
+    else:
+        lexical_ids = [doc_id for doc_id, _ in get_lexical_index().search(question, n_results)]
+    if not lexical_ids:
+        return vector_ids, vector_docs, vector_metas
+    fused = reciprocal_rank_fusion([vector_ids, lexical_ids])[:n_results]
+    docs = {doc_id: (text, metadata) for doc_id, text, metadata in zip(vector_ids, vector_docs, vector_metas)}
+    missing = [doc_id for doc_id in fused if doc_id not in docs]
+    for doc_id, doc in get_lexical_index().get(missing).items():
+        docs[doc_id] = (doc["text"], doc["metadata"])
+    ids = [doc_id for doc_id in fused if doc_id in docs]
+    return ids, [docs[doc_id][0] for doc_id in ids], [docs[doc_id][1] for doc_id in ids]
 
-# Initialize ChromaDB persistent client and collection
-chroma_client = chromadb.PersistentClient(path="chromadb_data")
-collection = chroma_client.get_or_create_collection("law_texts")
+def retrieve_batch(questions: list, filters: dict = None) -> list:
+    """
+    Embeds all questions in one pass and queries ChromaDB once with every embedding.
+    Optional metadata filters (see build_where) restrict the search to matching chunks.
+    With HYBRID_SEARCH enabled each question is also looked up in the lexical index
+    and the two rankings are fused. With RERANK_ENABLED, RERANK_CANDIDATES candidates
+    are pulled instead and cut to the RERANK_TOP_K best by the cross-encoder.
+    Each stage is timed into the current request's timings (see timing.py).
+    Returns one (ids, contexts, metadatas) triple per question, in input order.
+    """
+    if not questions:
+        return []
+    n_results = RERANK_CANDIDATES if RERANK_ENABLED else N_RESULTS
+    embeddings = encode_questions(questions)
+    with stage("vector_search"):
+        results = get_collection().query(
+            query_embeddings=embeddings,
+            n_results=n_results,
+            where=build_where(filters),
+            include=["documents", "metadatas"]
+        )
+    ids = results.get('ids') or [[] for _ in questions]
+    documents = results.get('documents') or [[] for _ in questions]
+    metadatas = [[metadata or {} for metadata in metas] for metas in (results.get('metadatas') or [[] for _ in questions])]
+    if HYBRID_SEARCH:
+        with stage("lexical_search"):
+            retrieved = [fuse_with_lexical(question, vector_ids, vector_docs, vector_metas, n_results, filters)
+                         for question, vector_ids, vector_docs, vector_metas in zip(questions, ids, documents, metadatas)]
+    else:
+        retrieved = list(zip(ids, documents, metadatas))
+    if RERANK_ENABLED:
+        with stage("rerank"):
+            retrieved, rerank_ms = get_reranker().rerank_batch(questions, retrieved, RERANK_TOP_K)
+        logging.debug(f"Reranked {len(questions)} questions in {rerank_ms:.1f} ms")
+    return retrieved
 
-# Load embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+def retrieve(question: str, filters: dict = None):
+    """
+    Embeds the question and queries ChromaDB.
+    Returns (ids, contexts, metadatas) for the top 10 related documents
+    (the top RERANK_TOP_K after reranking, when enabled).
+    """
+    return retrieve_batch([question], filters)[0]
 
-def query_db(question: str):
+def query_db(question: str, filters: dict = None):
     """
-    Embeds the question, queries ChromaDB, and returns the top 5 related contexts (documents).
+    Embeds the question, queries ChromaDB, and returns the top 10 related contexts (documents),
+    or the top RERANK_TOP_K when reranking is enabled.
+    filters, e.g. {"court": "中华人民共和国最高人民法院", "year": 2025, "case_type": "行政"},
+    limit the search to chunks with matching metadata.
     """
-    query_vector = model.encode(question).tolist()
-    results = collection.query(
-        query_embeddings=[query_vector],
-        n_results=10
-    )
-    # Extract the top 10 related documents (contexts)
-    contexts = results.get('documents', [[]])[0]
+    _, contexts, _ = retrieve(question, filters)
     return contexts
 
-def ask_deepseek(question: str, contexts: list) -> str:
+def query_db_batch(questions: list, filters: dict = None) -> list:
     """
-    Sends the question and contexts to Deepseek LLM API and returns the answer, using the prompt template.
+    Batch version of query_db: returns the related contexts for each question, in input
+    order, from one batched encode and a single ChromaDB query.
+    """
+    return [contexts for _, contexts, _ in retrieve_batch(questions, filters)]
+
+def expand_parents(contexts: list, metadatas: list):
+    """
+    Replaces hierarchical children (chunk.CHUNK_MODE=hierarchical) with the judgment
+    sections they came from: each parent appears once, at the rank of its best child,
+    with its parent_index as chunk_index so neighbouring sections are joined by
+    pack_contexts. Flat chunks, and children whose parent is missing, are kept as they are.
+    Returns (contexts, metadatas).
+    """
+    wanted = list(dict.fromkeys(metadata.get("parent_id") for metadata in metadatas if metadata.get("parent_id")))
+    if not wanted:
+        return contexts, metadatas
+    parents = get_parent_store().get(wanted)
+    expanded, expanded_metadatas, seen = [], [], set()
+    for text, metadata in zip(contexts, metadatas):
+        parent = parents.get(metadata.get("parent_id"))
+        if parent is None:
+            expanded.append(text)
+            expanded_metadatas.append(metadata)
+        elif metadata["parent_id"] not in seen:
+            seen.add(metadata["parent_id"])
+            expanded.append(parent["text"])
+            expanded_metadatas.append(dict(metadata, chunk_index=parent["parent_index"]))
+    return expanded, expanded_metadatas
+
+def assemble_contexts(contexts: list, metadatas: list) -> list:
+    """
+    Context-assembly stage between retrieval and the LLM: expands hierarchical children
+    to their parent sections, merges overlapping chunks of the same judgment, drops
+    repeated sentences and packs the best contexts into CONTEXT_TOKEN_BUDGET.
+    """
+    with stage("expand"):
+        contexts, metadatas = expand_parents(contexts, metadatas)
+    with stage("assemble"):
+        return pack_contexts(contexts, metadatas, CONTEXT_TOKEN_BUDGET)
+
+def prepare_contexts_batch(questions: list, filters: dict = None) -> list:
+    """
+    Retrieves and assembles the LLM contexts for each question.
+    Returns one (retrieved ids, assembled contexts) pair per question, in input order.
+    """
+    return [(ids, assemble_contexts(contexts, metadatas))
+            for ids, contexts, metadatas in retrieve_batch(questions, filters)]
+
+def prepare_contexts(question: str, filters: dict = None):
+    """
+    Single-question version of prepare_contexts_batch.
+    """
+    return prepare_contexts_batch([question], filters)[0]
+
+def answer_cache_key(question: str, context_ids: list) -> str:
+    """
+    Cache key for an answer: the normalized question plus the retrieved context ids.
+    """
+    raw = normalize_question(question) + "\0" + ",".join(context_ids)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def cache_stats() -> dict:
+    """
+    Hit/miss counters for the question-embedding and answer caches.
+    """
+    return {
+        "embedding": embedding_cache.stats(),
+        "answer": answer_cache.stats()
+    }
+
+# Shared, connection-pooled Deepseek client
+llm_client = DeepseekClient(api_key=API_KEY)
+
+def build_prompt(question: str, contexts: list) -> str:
+    """
+    Fills the prompt template with the question and contexts.
+    """
+    return get_prompt_template().render(contexts, question)
+
+async def ask_deepseek_async(question: str, contexts: list) -> str:
+    """
+    Sends the question and contexts to Deepseek LLM API without blocking the event loop
+    and returns the answer, using the prompt template.
     """
-    DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"  # Example endpoint
     if not API_KEY:
         return "Error: DEEPSEEK_API_KEY not set in environment."
+    with stage("prompt"):
+        prompt = build_prompt(question, contexts)
+    metrics.PROMPT_TOKENS.observe(estimate_tokens(prompt))
+    try:
+        with stage("llm"):
+            answer = await llm_client.chat(prompt)
+    except LLMError as e:
+        metrics.LLM_REQUESTS.labels("error").inc()
+        return f"Error: {e}"
+    metrics.LLM_REQUESTS.labels("ok").inc()
+    return answer
 
-    # Load prompt template
-    with open("prompt_template", "r", encoding="utf-8") as f:
-        template = f.read()
+def ask_deepseek(question: str, contexts: list) -> str:
+    """
+    Sends the question and contexts to Deepseek LLM API and returns the answer, using the prompt template.
+    Blocking wrapper around ask_deepseek_async for scripts; do not call it from the event loop.
+    """
+    async def ask_once():
+        try:
+            return await ask_deepseek_async(question, contexts)
+        finally:
+            await llm_client.aclose()
+    return asyncio.run(ask_once())
 
-    context_str = "\n\n".join(contexts)
-    prompt = template.replace("{contexts}", context_str).replace("{query}", question)
+async def answer_question(question: str, context_ids: list, contexts: list) -> str:
+    """
+    Returns the cached answer for the question and retrieved contexts, asking Deepseek on a miss.
+    """
+    key = answer_cache_key(question, context_ids)
+    # With ANSWER_CACHE_PATH a lookup can read SQLite, so keep it off the event loop
+    answer = await run_in_threadpool(answer_cache.get, key) if ANSWER_CACHE_PATH else answer_cache.get(key)
+    if answer is not None:
+        logging.debug("Answer cache hit")
+        return answer
+    answer = await ask_deepseek_async(question, contexts)
+    # Never cache failures, so a transient API error is retried on the next request
+    if not answer.startswith("Error"):
+        if ANSWER_CACHE_PATH:
+            await run_in_threadpool(answer_cache.set, key, answer)
+        else:
+            answer_cache.set(key, answer)
+    return answer
 
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "deepseek-chat",  # Replace with your model name if needed
-        "messages": [
-            {"role": "user", "content": prompt}
-        ]
-    }
-    response = requests.post(DEEPSEEK_API_URL, headers=headers, json=data)
-    if response.status_code == 200:
-        result = response.json()
-        # Adjust this depending on Deepseek's response format
-        return result['choices'][0]['message']['content']
-    else:
-        return f"Error: {response.status_code} {response.text}"
+# Startup-time breakdown, filled in at the end of the import and by warmup()
+startup_timings = {}
+_ready = threading.Event()
+_warmup_lock = threading.Lock()
+
+def warmup() -> dict:
+    """
+    Loads the model, opens the Chroma collection and lexical index, reads the prompt
+    template and runs one inference and one search, so the first real request does not pay for them.
+    Safe to call more than once. Returns the startup-time breakdown in seconds.
+    """
+    with _warmup_lock:
+        if not _ready.is_set():
+            get_model()
+            get_collection()
+            get_lexical_index()
+            if CHUNK_MODE == "hierarchical":
+                get_parent_store()
+            get_prompt_template()
+            if RERANK_ENABLED:
+                get_reranker()
+            started_at = time.perf_counter()
+            vectors = get_model().encode(["warmup"])
+            startup_timings["first_inference_s"] = time.perf_counter() - started_at
+            # The first search loads the HNSW index (or, with VECTOR_SEARCH=snapshot, pages in the matrix)
+            started_at = time.perf_counter()
+            get_collection().query(query_embeddings=vectors.tolist(), n_results=1, include=[])
+            startup_timings["first_search_s"] = time.perf_counter() - started_at
+            startup_timings.update({f"{name}_load_s": seconds for name, seconds in load_timings.items()})
+            _ready.set()
+            logging.info(f"Warm-up finished: {startup_timings}")
+    return startup_timings
 
 app = FastAPI()
 
@@ -70,29 +391,141 @@ app = FastAPI()
 log_level = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(level=getattr(logging, log_level, logging.INFO), format='%(asctime)s %(levelname)s %(message)s')
 
+# Endpoints whose latency and status are exported on /metrics
+INSTRUMENTED_PATHS = {"/query", "/query/batch"}
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    if request.url.path not in INSTRUMENTED_PATHS:
+        return await call_next(request)
+    # The endpoint runs in a copy of this context, so its stages are timed into this dict
+    timings = start_request()
+    started_at = time.perf_counter()
+    response = await call_next(request)
+    metrics.REQUEST_SECONDS.labels(request.url.path).observe(time.perf_counter() - started_at)
+    metrics.REQUESTS.labels(request.url.path, str(response.status_code)).inc()
+    if SERVER_TIMING_HEADER and timings:
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response
+
+async def read_json_object(request: Request):
+    """
+    Returns the request body as a dict, or None if it is not a JSON object.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
 @app.post("/query")
 async def query_endpoint(request: Request):
-    data = await request.json()
+    data = await read_json_object(request)
+    if data is None:
+        return JSONResponse(status_code=400, content={"error": "Request body must be a JSON object."})
     question = data.get("question")
     if not question:
         return JSONResponse(status_code=400, content={"error": "Missing 'question' in request body."})
+    if not isinstance(question, str) or not question.strip():
+        return JSONResponse(status_code=400, content={"error": "'question' must be a non-empty string."})
+    filters = data.get("filters")
+    try:
+        build_where(filters)
+    except (ValueError, TypeError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     logging.debug(f"Received question: {question}")
-    contexts = query_db(question)
+    # Encoder, Chroma and context assembly are blocking, so run them in the threadpool
+    timings = current_timings()  # started by instrument_request
+    context_ids, contexts = await run_in_threadpool(prepare_contexts, question, filters)
     logging.debug(f"Retrieved {len(contexts)} contexts. First context: {contexts[0][:100] if contexts else 'None'}")
-    answer = ask_deepseek(question, contexts)
+    answer = await answer_question(question, context_ids, contexts)
     logging.debug(f"Answer: {answer[:200]}")
-    print("\nDeepseek Answer:")
-    return {"question": question, "contexts": contexts, "answer": answer}
+    return {"question": question, "contexts": contexts, "answer": answer, "timings": timings}
+
+@app.post("/query/batch")
+async def query_batch_endpoint(request: Request):
+    data = await read_json_object(request)
+    if data is None:
+        return JSONResponse(status_code=400, content={"error": "Request body must be a JSON object."})
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        return JSONResponse(status_code=400, content={"error": "'questions' must be a non-empty list of non-empty strings."})
+    if len(questions) > QUERY_BATCH_MAX_SIZE:
+        return JSONResponse(status_code=400, content={"error": f"At most {QUERY_BATCH_MAX_SIZE} questions per batch."})
+    filters = data.get("filters")
+    try:
+        build_where(filters)
+    except (ValueError, TypeError) as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    logging.debug(f"Received batch of {len(questions)} questions")
+    timings = current_timings()  # started by instrument_request
+    retrieved = await run_in_threadpool(prepare_contexts_batch, questions, filters)
+    # Identical questions with identical contexts share one LLM call; concurrency is bounded by llm_client
+    tasks = {}
+    for question, (context_ids, contexts) in zip(questions, retrieved):
+        key = answer_cache_key(question, context_ids)
+        if key not in tasks:
+            tasks[key] = asyncio.ensure_future(answer_question(question, context_ids, contexts))
+    results = []
+    for question, (context_ids, contexts) in zip(questions, retrieved):
+        answer = await tasks[answer_cache_key(question, context_ids)]
+        results.append({"question": question, "contexts": contexts, "answer": answer})
+    return {"results": results, "timings": timings}
+
+@app.on_event("startup")
+async def start_warmup():
+    # Warm up in the background: liveness answers at once, readiness flips when done
+    if WARMUP_ON_STARTUP:
+        asyncio.get_running_loop().run_in_executor(None, warmup)
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm_client.aclose()
+
+@app.get("/cache/stats")
+def cache_stats_endpoint():
+    return cache_stats()
+
+@app.get("/encoder/stats")
+def encoder_stats_endpoint():
+    return encoder_batcher.stats()
+
+@app.get("/metrics")
+def metrics_endpoint():
+    if collection_loaded():
+        metrics.COLLECTION_CHUNKS.set(get_collection().count())
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/health")
+@app.get("/health/live")
 def health_check():
     return {"status": "ok"}
 
+@app.get("/health/ready")
+def readiness_check():
+    if not _ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming up", "startup": startup_timings})
+    return {"status": "ready", "startup": startup_timings}
+
+# Checked at import, so a backend whose packages are missing stops the server from starting
+EMBEDDING_BACKEND = select_backend()
+
+if PRELOAD_MODEL:
+    if EMBEDDING_BACKEND.startswith("torch"):
+        # Weights only: running an inference here would start thread pools the workers do not inherit
+        get_model()
+    else:
+        # ONNX Runtime creates its thread pools with the session, so each worker loads its own
+        logging.warning(f"PRELOAD_MODEL is ignored for EMBEDDING_BACKEND={EMBEDDING_BACKEND}")
+
+startup_timings["import_s"] = time.perf_counter() - _import_started_at
+
 if __name__ == "__main__":
     # question = input("请输入您的法律问题: ")
     question = "河南省高级人民法院审理的南阳某某房地产开发有限公司状告河南省南阳市人民政府征地补偿款纠纷案的判决号是多少"
-    contexts = query_db(question)
-    print("Top 5 related contexts:")
+    _, contexts = prepare_contexts(question)
+    print("Related contexts:")
     for i, ctx in enumerate(contexts, 1):
         print(f"{i}. {ctx[:200]}...")
     print("\nSending to Deepseek...")
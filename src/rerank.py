@@ -0,0 +1,58 @@
+import hashlib
+import os
+import time
+from typing import List, Tuple
+from cache import TTLCache
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+# Multilingual (incl. Chinese) MiniLM cross-encoder trained on mMARCO
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 50))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", 4))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 64))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", 50000))
+
+
+class Reranker:
+    """
+    Scores (question, chunk) pairs with a cross-encoder on CPU.
+    Pairs of every question in a call are scored in one batched predict; scores are
+    cached per (question, chunk id), so repeated questions only score new candidates.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 cache_size: int = RERANK_CACHE_SIZE):
+        # Imported here: sentence_transformers pulls in torch
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+        self.scores = TTLCache(max_size=cache_size, ttl=float("inf"))
+
+    def _key(self, question: str, doc_id: str) -> str:
+        return hashlib.sha256(f"{question}\0{doc_id}".encode("utf-8")).hexdigest()
+
+    def rerank_batch(self, questions: List[str], candidates: List[tuple], top_k: int = RERANK_TOP_K) -> Tuple[list, float]:
+        """
+        candidates holds one (ids, texts, metadatas) triple per question.
+        Returns (one reordered triple cut to top_k per question, elapsed milliseconds).
+        """
+        started_at = time.perf_counter()
+        keys = [[self._key(question, doc_id) for doc_id in ids] for question, (ids, _, _) in zip(questions, candidates)]
+        scores = [[self.scores.get(key) for key in question_keys] for question_keys in keys]
+        pairs, slots = [], []
+        for q, (question, (_, texts, _)) in enumerate(zip(questions, candidates)):
+            for c, text in enumerate(texts):
+                if scores[q][c] is None:
+                    pairs.append((question, text))
+                    slots.append((q, c))
+        if pairs:
+            predicted = self.model.predict(pairs, batch_size=self.batch_size)
+            for (q, c), score in zip(slots, predicted):
+                scores[q][c] = float(score)
+                self.scores.set(keys[q][c], float(score))
+
+        reranked = []
+        for (ids, texts, metadatas), question_scores in zip(candidates, scores):
+            order = sorted(range(len(ids)), key=lambda i: question_scores[i], reverse=True)[:top_k]
+            reranked.append(([ids[i] for i in order], [texts[i] for i in order], [metadatas[i] for i in order]))
+        return reranked, (time.perf_counter() - started_at) * 1000
@@ -0,0 +1,277 @@
+import json
+import os
+import shutil
+import threading
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+
+# Where query workers search vectors:
+#   chroma    the Chroma HNSW index in CHROMA_PATH, the original setup
+#   snapshot  an exact (brute-force) NumPy search over the snapshot in SNAPSHOT_PATH,
+#             without opening Chroma
+VECTOR_SEARCH = os.getenv("VECTOR_SEARCH", "chroma")
+VECTOR_SEARCH_MODES = ("chroma", "snapshot")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshot")
+# Snapshot rows scored per matrix product, bounding the float32 copy of a float16 matrix
+SNAPSHOT_SEARCH_BLOCK = int(os.getenv("SNAPSHOT_SEARCH_BLOCK", 65536))
+DTYPES = ("float32", "float16")
+# Files of a snapshot directory
+CHUNKS_FILE = "chunks.parquet"        # id, document and metadata (JSON) of each row
+EMBEDDINGS_FILE = "embeddings.npy"    # (rows, dimension) matrix, row i belongs to chunk i
+PARENTS_FILE = "parents.parquet"      # parents.ParentStore rows, for hierarchical chunks
+INFO_FILE = "snapshot.json"           # model, distance space, ingestion manifest, ...
+
+
+def _arrow():
+    # Imported here: only export, import and snapshot search need pyarrow
+    import pyarrow
+    import pyarrow.parquet
+    return pyarrow, pyarrow.parquet
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """
+    Evaluates a Chroma where clause ({field: value}, $eq, $ne, $in, $nin, $and, $or)
+    against one metadata dict. Raises ValueError for other operators.
+    """
+    if not where:
+        return True
+    for field, condition in where.items():
+        if field == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        if field == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+            continue
+        value = metadata.get(field)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                matched = value == operand
+            elif operator == "$ne":
+                matched = value != operand
+            elif operator == "$in":
+                matched = value in operand
+            elif operator == "$nin":
+                matched = value not in operand
+            else:
+                raise ValueError(f"Snapshot search does not support the '{operator}' filter.")
+            if not matched:
+                return False
+    return True
+
+
+class SnapshotWriter:
+    """
+    Writes a snapshot directory page by page: ids, documents and metadata go to a
+    Parquet file and the embeddings into a memory-mapped .npy matrix of count rows,
+    stored as float32 or float16. Everything is written to path + ".tmp" and moved
+    into place by close(), so an interrupted export never leaves a partial snapshot.
+    """
+
+    def __init__(self, path: str, count: int, dtype: str = "float32"):
+        """
+        Args:
+            path: Snapshot directory, replaced by close() if it exists
+            count: Number of rows that will be added
+            dtype: "float32" or "float16" for the embedding matrix
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown snapshot dtype '{dtype}'. Choose one of: {', '.join(DTYPES)}.")
+        self.path = path
+        self.count = count
+        self.dtype = dtype
+        self.rows = 0
+        self._tmp_path = path.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+        os.makedirs(self._tmp_path)
+        self._embeddings = None  # created on the first page, once the dimension is known
+        pa, pq = _arrow()
+        self._schema = pa.schema([("id", pa.string()), ("document", pa.string()), ("metadata", pa.string())])
+        self._chunks = pq.ParquetWriter(os.path.join(self._tmp_path, CHUNKS_FILE), self._schema, compression="zstd")
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings):
+        pa, _ = _arrow()
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self.rows + len(ids) > self.count:
+            raise ValueError(f"Snapshot was sized for {self.count} rows; the collection changed during the export.")
+        if self._embeddings is None:
+            self._embeddings = np.lib.format.open_memmap(os.path.join(self._tmp_path, EMBEDDINGS_FILE), mode="w+",
+                                                         dtype=self.dtype, shape=(self.count, vectors.shape[1]))
+        self._embeddings[self.rows:self.rows + len(ids)] = vectors
+        self._chunks.write_table(pa.table({
+            "id": ids,
+            "document": documents,
+            "metadata": [json.dumps(metadata or {}, ensure_ascii=False) for metadata in metadatas]
+        }, schema=self._schema))
+        self.rows += len(ids)
+
+    def add_parents(self, parents: List[Tuple[str, str, str, int, str]]):
+        """
+        Stores parents.ParentStore rows alongside the chunks.
+        """
+        pa, pq = _arrow()
+        columns = ["id", "source", "section", "parent_index", "text"]
+        pq.write_table(pa.table({column: [row[i] for row in parents] for i, column in enumerate(columns)}),
+                       os.path.join(self._tmp_path, PARENTS_FILE), compression="zstd")
+
+    def close(self, info: dict):
+        """
+        Finishes the files, writes info to snapshot.json and moves the snapshot into place.
+        """
+        self._chunks.close()
+        if self.rows != self.count:
+            raise ValueError(f"Snapshot was sized for {self.count} rows but {self.rows} were written.")
+        if self._embeddings is None:
+            np.save(os.path.join(self._tmp_path, EMBEDDINGS_FILE), np.zeros((0, 0), dtype=self.dtype))
+        else:
+            self._embeddings.flush()
+            del self._embeddings
+        with open(os.path.join(self._tmp_path, INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump(dict(info, rows=self.rows, dtype=self.dtype), f, ensure_ascii=False, indent=2)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._tmp_path, self.path)
+
+
+class Snapshot:
+    """
+    A snapshot opened for reading. The embedding matrix is memory-mapped, so opening
+    it reads no vectors and every process serving the same snapshot shares its pages
+    through the page cache; ids, documents and metadata are loaded from Parquet.
+
+    count, get and query follow the Chroma collection API used by query.py, so with
+    VECTOR_SEARCH=snapshot store.get_collection() returns a Snapshot. query is an
+    exact search: it scores every row with NumPy and returns the same distances as
+    Chroma for the collection's space (squared L2 by default), which makes it the
+    ground truth for checking the recall of the HNSW index.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        _, pq = _arrow()
+        self.path = path
+        with open(os.path.join(path, INFO_FILE), "r", encoding="utf-8") as f:
+            self.info = json.load(f)
+        self.space = self.info.get("space", "l2")
+        if self.space not in ("l2", "cosine", "ip"):
+            raise ValueError(f"Unknown distance space '{self.space}' in snapshot {path}.")
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        table = pq.read_table(os.path.join(path, CHUNKS_FILE))
+        self.ids = table.column("id").to_pylist()
+        self.documents = table.column("document").to_pylist()
+        self.metadatas = [json.loads(metadata) for metadata in table.column("metadata").to_pylist()]
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._norms = None
+        self._lock = threading.Lock()
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def batches(self, batch_size: int) -> Iterator[Tuple[List[str], List[str], List[dict], np.ndarray]]:
+        """
+        Yields (ids, documents, metadatas, float32 embeddings) in row order, batch_size rows at a time.
+        """
+        for start in range(0, self.count(), batch_size):
+            end = start + batch_size
+            yield (self.ids[start:end], self.documents[start:end], self.metadatas[start:end],
+                   np.asarray(self.embeddings[start:end], dtype=np.float32))
+
+    def parents(self) -> List[Tuple[str, str, str, int, str]]:
+        """
+        Returns the parents.ParentStore rows saved with the snapshot (none for flat chunks).
+        """
+        path = os.path.join(self.path, PARENTS_FILE)
+        if not os.path.exists(path):
+            return []
+        _, pq = _arrow()
+        columns = pq.read_table(path).to_pydict()
+        return list(zip(columns["id"], columns["source"], columns["section"], columns["parent_index"], columns["text"]))
+
+    def upsert(self, **kwargs):
+        raise PermissionError("VECTOR_SEARCH=snapshot is read-only; unset it to ingest into Chroma.")
+
+    delete = upsert
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None, include: List[str] = ("metadatas", "documents")) -> dict:
+        if ids is None:
+            rows = range(self.count())
+        else:
+            rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        if where:
+            rows = [row for row in rows if matches_where(self.metadatas[row], where)]
+        rows = list(rows)[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        return {"ids": [self.ids[row] for row in rows], **{field: self._field(field, rows) for field in include}}
+
+    def query(self, query_embeddings: list, n_results: int = 10, where: Optional[dict] = None,
+              include: List[str] = ("metadatas", "documents")) -> dict:
+        """
+        Scores every row (or every row matching where) against each query, SNAPSHOT_SEARCH_BLOCK
+        rows at a time, and keeps the n_results smallest distances per query.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        allowed = None
+        if where:
+            allowed = np.fromiter((matches_where(metadata, where) for metadata in self.metadatas),
+                                  dtype=bool, count=self.count())
+        norms = self._row_norms()
+        if self.space == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+
+        best_distances = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.count(), SNAPSHOT_SEARCH_BLOCK):
+            block = np.asarray(self.embeddings[start:start + SNAPSHOT_SEARCH_BLOCK], dtype=np.float32)
+            products = queries @ block.T
+            block_norms = norms[start:start + len(block)]
+            if self.space == "l2":
+                distances = np.maximum(query_norms[:, None] - 2 * products + block_norms[None, :], 0)
+            elif self.space == "cosine":
+                distances = 1 - products / np.maximum(np.sqrt(block_norms), 1e-12)[None, :]
+            else:
+                distances = 1 - products
+            if allowed is not None:
+                distances[:, ~allowed[start:start + len(block)]] = np.inf
+            best_distances = np.concatenate([best_distances, distances], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(block)),
+                                                                   distances.shape)], axis=1)
+            if best_distances.shape[1] > n_results:
+                keep = np.argpartition(best_distances, n_results - 1, axis=1)[:, :n_results]
+                best_distances = np.take_along_axis(best_distances, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        fields = [field for field in include if field != "distances"]
+        result = {"ids": [], "distances": [], **{field: [] for field in fields}}
+        for distances, rows in zip(best_distances, best_rows):
+            order = np.argsort(distances, kind="stable")
+            order = order[np.isfinite(distances[order])]  # rows filtered out by where
+            hits = rows[order].tolist()
+            result["ids"].append([self.ids[row] for row in hits])
+            result["distances"].append(distances[order].tolist())
+            for field in fields:
+                result[field].append(self._field(field, hits))
+        return result
+
+    def _field(self, field: str, rows: List[int]):
+        if field == "documents":
+            return [self.documents[row] for row in rows]
+        if field == "metadatas":
+            return [self.metadatas[row] for row in rows]
+        if field == "embeddings":
+            return np.asarray(self.embeddings[rows], dtype=np.float32)
+        raise ValueError(f"Snapshot has no field '{field}'.")
+
+    def _row_norms(self) -> np.ndarray:
+        # Squared norms of every row, computed once (this is the pass that pages the matrix in)
+        with self._lock:
+            if self._norms is None:
+                norms = np.empty(self.count(), dtype=np.float32)
+                for start in range(0, self.count(), SNAPSHOT_SEARCH_BLOCK):
+                    block = np.asarray(self.embeddings[start:start + SNAPSHOT_SEARCH_BLOCK], dtype=np.float32)
+                    norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+                self._norms = norms
+            return self._norms
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from typing import Callable, Dict
+from partition import PARTITION_BY
+from snapshot import SNAPSHOT_PATH, VECTOR_SEARCH, VECTOR_SEARCH_MODES
+
+# Shared locations and model settings for ingestion (embedding.py) and serving (query.py)
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chromadb_data")
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "law_texts")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+PROMPT_TEMPLATE_PATH = os.getenv("PROMPT_TEMPLATE_PATH", "prompt_template")
+# Set for query workers (see gunicorn_conf.py): the collection and lexical index are
+# opened for reading only, and only ingestion (embedding.py) writes to them
+SERVING_READ_ONLY = os.getenv("SERVING_READ_ONLY", "0") == "1"
+
+# Seconds spent creating each lazily loaded resource, by name
+load_timings: Dict[str, float] = {}
+
+
+class Lazy:
+    """
+    Thread-safe lazily created resource: factory runs once, on first get(),
+    even when several threads ask for it at the same time.
+    """
+
+    def __init__(self, name: str, factory: Callable):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    started_at = time.perf_counter()
+                    self._value = self._factory()
+                    load_timings[self.name] = time.perf_counter() - started_at
+                    self._loaded = True
+        return self._value
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+
+class ReadOnlyCollection:
+    """
+    Wraps a Chroma collection for query workers: reads pass through, writes raise
+    PermissionError, so a serving process can never modify the store.
+    """
+    READS = {"query", "get", "count", "peek", "name", "id", "metadata"}
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name: str):
+        if name not in self.READS:
+            raise PermissionError(f"Collection is read-only in this process (SERVING_READ_ONLY=1); "
+                                  f"'{name}' is only available to ingestion.")
+        return getattr(self._collection, name)
+
+
+def _open_client():
+    # Imported here: chromadb adds noticeably to import time
+    import chromadb
+    return chromadb.PersistentClient(path=CHROMA_PATH)
+
+def _open_collection():
+    if VECTOR_SEARCH not in VECTOR_SEARCH_MODES:
+        raise ValueError(f"Unknown VECTOR_SEARCH '{VECTOR_SEARCH}'. Choose one of: {', '.join(VECTOR_SEARCH_MODES)}.")
+    if VECTOR_SEARCH == "snapshot":
+        from snapshot import Snapshot
+        return Snapshot(SNAPSHOT_PATH)
+    if PARTITION_BY != "none":
+        from partition import PartitionedCollection
+        return PartitionedCollection(get_client(), COLLECTION_NAME, PARTITION_BY,
+                                     wrap=ReadOnlyCollection if SERVING_READ_ONLY else None,
+                                     create=not SERVING_READ_ONLY)
+    if SERVING_READ_ONLY:
+        # Never creates the collection: ingestion has to have run first
+        return ReadOnlyCollection(get_client().get_collection(COLLECTION_NAME))
+    return get_client().get_or_create_collection(COLLECTION_NAME)
+
+def _load_model():
+    from encoder import load_encoder
+    return load_encoder(EMBEDDING_MODEL)
+
+def _open_lexical_index():
+    from lexical import LexicalIndex
+    get_client()  # makes sure CHROMA_PATH exists
+    return LexicalIndex(read_only=SERVING_READ_ONLY)
+
+def _open_parent_store():
+    from parents import ParentStore
+    get_client()  # makes sure CHROMA_PATH exists
+    return ParentStore(read_only=SERVING_READ_ONLY)
+
+def _load_reranker():
+    from rerank import Reranker
+    return Reranker()
+
+def _read_prompt_template():
+    from context import PromptTemplate
+    with open(PROMPT_TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        return PromptTemplate(f.read())
+
+_client = Lazy("chroma_client", _open_client)
+_collection = Lazy("collection", _open_collection)
+_model = Lazy("model", _load_model)
+_lexical_index = Lazy("lexical_index", _open_lexical_index)
+_parent_store = Lazy("parent_store", _open_parent_store)
+_prompt_template = Lazy("prompt_template", _read_prompt_template)
+_reranker = Lazy("reranker", _load_reranker)
+
+def get_client():
+    """
+    Returns the ChromaDB PersistentClient, opening it on first use.
+    """
+    return _client.get()
+
+def get_collection():
+    """
+    Returns the law_texts collection, creating it on first use
+    (read-only, and never created, when SERVING_READ_ONLY is set). With PARTITION_BY
+    set, returns a partition.PartitionedCollection over its partitions instead, and
+    with VECTOR_SEARCH=snapshot the snapshot.Snapshot at SNAPSHOT_PATH.
+    """
+    return _collection.get()
+
+def get_model():
+    """
+    Returns the SentenceTransformer for the configured EMBEDDING_BACKEND, loading it on first use.
+    """
+    return _model.get()
+
+def get_lexical_index():
+    """
+    Returns the lexical (BM25) index, opening it on first use.
+    """
+    return _lexical_index.get()
+
+def get_parent_store():
+    """
+    Returns the parents.ParentStore of hierarchical chunks, opening it on first use.
+    """
+    return _parent_store.get()
+
+def get_prompt_template():
+    """
+    Returns the parsed context.PromptTemplate, read from disk once.
+    """
+    return _prompt_template.get()
+
+def get_reranker():
+    """
+    Returns the cross-encoder rerank.Reranker, loading it on first use.
+    """
+    return _reranker.get()
+
+def model_loaded() -> bool:
+    return _model.loaded
+
+def collection_loaded() -> bool:
+    return _collection.loaded
@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from batcher import MicroBatcher
+
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return [len(text) for text in texts]
+
+    batcher = MicroBatcher(encode, max_batch_size=16, max_wait_ms=50)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(batcher.encode, ["a" * i for i in range(1, 9)]))
+    assert results == list(range(1, 9))
+    assert len(calls) < 8
+    stats = batcher.stats()
+    assert stats["items"] == 8
+    assert stats["batches"] == len(calls)
+
+
+def test_batch_size_is_capped():
+    sizes = []
+    release = threading.Event()
+
+    def encode(texts):
+        release.wait()
+        sizes.append(len(texts))
+        return texts
+
+    batcher = MicroBatcher(encode, max_batch_size=4, max_wait_ms=20)
+    futures = [batcher.submit(str(i)) for i in range(10)]
+    time.sleep(0.05)
+    release.set()
+    assert [future.result() for future in futures] == [str(i) for i in range(10)]
+    assert max(sizes) <= 4
+    assert batcher.stats()["max_queue_depth"] >= 4
+
+
+def test_errors_reach_every_caller():
+    def encode(texts):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(encode, max_batch_size=8, max_wait_ms=10)
+    futures = [batcher.submit("x"), batcher.submit("y")]
+    for future in futures:
+        try:
+            future.result()
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+
+
+def test_forked_child_gets_its_own_thread():
+    batcher = MicroBatcher(lambda texts: [len(text) for text in texts], max_batch_size=8, max_wait_ms=1)
+    assert batcher.encode("abc") == 3
+    pid = os.fork()
+    if pid == 0:
+        # The parent's batcher thread does not exist in the child
+        try:
+            ok = batcher.submit("abcd").result(timeout=2) == 4
+        except Exception:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert batcher.encode("ab") == 2
+
+
+if __name__ == "__main__":
+    test_concurrent_requests_share_a_batch()
+    test_batch_size_is_capped()
+    test_errors_reach_every_caller()
+    test_forked_child_gets_its_own_thread()
+    print("Micro-batcher tests passed.")
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+os.environ["WARMUP_ON_STARTUP"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from fastapi.testclient import TestClient
+import cache
+import query
+from cache import TTLCache
+from llm_client import LLMError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_ttl_expiry_and_lru_eviction(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    entries = TTLCache(max_size=2, ttl=10)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    assert entries.get("a") == 1
+    # "b" is now the least recently used
+    entries.set("c", 3)
+    assert entries.get("b") is None and entries.get("a") == 1 and entries.get("c") == 3
+    clock.now += 11
+    assert entries.get("a") is None and entries.get("c") is None
+    assert entries.stats() == {"hits": 3, "misses": 3, "hit_rate": 0.5, "size": 0, "max_size": 2}
+
+
+def test_disk_entries_survive_a_restart(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "answers.sqlite3")
+        TTLCache(ttl=10, sqlite_path=path, table="answers").set("q", "答")
+        restarted = TTLCache(ttl=10, sqlite_path=path, table="answers")
+        assert restarted.get("q") == "答"
+        clock.now += 11
+        assert TTLCache(ttl=10, sqlite_path=path, table="answers").get("q") is None
+
+
+class FakeModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=None):
+        self.encoded.extend(texts)
+        return np.array([[float(len(text))] for text in texts])
+
+
+class FakeLLM:
+    def __init__(self, failures=0):
+        self.prompts = []
+        self.failures = failures
+
+    async def chat(self, prompt):
+        self.prompts.append(prompt)
+        if self.failures:
+            self.failures -= 1
+            raise LLMError("upstream 503")
+        return f"answer to {prompt}"
+
+
+def fake_service(monkeypatch, llm, sqlite_path=None):
+    """
+    Serves query.app with a stub encoder, collection and LLM, and empty caches.
+    """
+    model = FakeModel()
+    collection = SimpleNamespace(query=lambda query_embeddings, n_results, where, include: {
+        "ids": [["c1"] for _ in query_embeddings],
+        "documents": [["征地补偿应当依照法定标准足额支付。"] for _ in query_embeddings],
+        "metadatas": [[{"source": "a.txt"}] for _ in query_embeddings]
+    })
+    monkeypatch.setattr(query, "get_model", lambda: model)
+    monkeypatch.setattr(query, "get_collection", lambda: collection)
+    monkeypatch.setattr(query, "HYBRID_SEARCH", False)
+    monkeypatch.setattr(query, "RERANK_ENABLED", False)
+    monkeypatch.setattr(query, "API_KEY", "test")
+    monkeypatch.setattr(query, "llm_client", llm)
+    monkeypatch.setattr(query, "build_prompt", lambda question, contexts: question)
+    monkeypatch.setattr(query, "embedding_cache", TTLCache(max_size=10, ttl=float("inf")))
+    monkeypatch.setattr(query, "ANSWER_CACHE_PATH", sqlite_path)
+    monkeypatch.setattr(query, "answer_cache", TTLCache(max_size=10, ttl=60, sqlite_path=sqlite_path, table="answers"))
+    return model, TestClient(query.app)
+
+
+def test_repeated_question_skips_encoder_and_llm(monkeypatch):
+    llm = FakeLLM()
+    model, client = fake_service(monkeypatch, llm)
+    first = client.post("/query", json={"question": "征地补偿标准"}).json()
+    # Surrounding whitespace does not make it a different question
+    second = client.post("/query", json={"question": "  征地补偿标准 "}).json()
+    assert first["answer"] == second["answer"] == "answer to 征地补偿标准"
+    assert model.encoded == ["征地补偿标准"] and llm.prompts == ["征地补偿标准"]
+    stats = client.get("/cache/stats").json()
+    assert stats["embedding"]["hits"] == 1 and stats["embedding"]["misses"] == 1
+    assert stats["answer"]["hits"] == 1 and stats["answer"]["misses"] == 1
+
+
+def test_errors_are_not_cached(monkeypatch):
+    llm = FakeLLM(failures=1)
+    _, client = fake_service(monkeypatch, llm)
+    assert client.post("/query", json={"question": "征地补偿"}).json()["answer"].startswith("Error")
+    assert client.post("/query", json={"question": "征地补偿"}).json()["answer"] == "answer to 征地补偿"
+    assert client.post("/query", json={"question": "征地补偿"}).json()["answer"] == "answer to 征地补偿"
+    assert len(llm.prompts) == 2
+
+
+def test_disk_cache_is_read_off_the_event_loop(monkeypatch):
+    def in_event_loop():
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    with tempfile.TemporaryDirectory() as folder:
+        llm = FakeLLM()
+        _, client = fake_service(monkeypatch, llm, os.path.join(folder, "answers.sqlite3"))
+        calls = []
+        get, set_ = query.answer_cache.get, query.answer_cache.set
+        monkeypatch.setattr(query.answer_cache, "get", lambda key: calls.append(in_event_loop()) or get(key))
+        monkeypatch.setattr(query.answer_cache, "set", lambda key, value: calls.append(in_event_loop()) or set_(key, value))
+        client.post("/query", json={"question": "征地补偿"})
+        client.post("/query", json={"question": "征地补偿"})
+        # get, set, then a hit
+        assert calls == [False, False, False] and len(llm.prompts) == 1
+
+
+if __name__ == "__main__":
+    # The tests need pytest's monkeypatch fixture
+    import pytest
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chunk import streamChunks
+
+
+def write_docs(folder):
+    with open(os.path.join(folder, "a.txt"), "w", encoding="utf-8") as f:
+        f.write("河南省高级人民法院\n行政判决书\n（2020）豫行终3143号\n" + "本院认为，征地补偿应当依法支付。" * 100)
+    with open(os.path.join(folder, "b.txt"), "wb") as f:
+        f.write(b"\xff\xfe not utf-8 \x80")
+    with open(os.path.join(folder, "c.txt"), "w", encoding="utf-8") as f:
+        f.write("郑州市中级人民法院\n民事判决书\n")
+
+
+def test_unreadable_files_are_reported():
+    with tempfile.TemporaryDirectory() as folder:
+        write_docs(folder)
+        for workers in (1, 2):
+            failed = set()
+            records = list(streamChunks(["a.txt", "b.txt", "c.txt"], folder, workers=workers, failed=failed))
+            assert failed == {"b.txt"}
+            sources = [source for source, _, _, _ in records]
+            assert sources == sorted(sources) and set(sources) == {"a.txt", "c.txt"}
+            assert [index for source, index, _, _ in records if source == "a.txt"] == list(range(sources.count("a.txt")))
+            assert all(metadata["source"] == source for source, _, _, metadata in records)
+
+
+if __name__ == "__main__":
+    test_unreadable_files_are_reported()
+    print("Chunk tests passed.")
@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from context import PromptTemplate, estimate_tokens, overlap_length, pack_contexts
+
+
+def test_overlapping_neighbours_are_merged():
+    first = "甲" * 30 + "。" + "乙" * 50 + "。"
+    second = "乙" * 50 + "。" + "丙" * 30 + "。"
+    metadatas = [{"source": "a.txt", "chunk_index": 0}, {"source": "a.txt", "chunk_index": 1}]
+    assert overlap_length(first, second) == 51
+    assert pack_contexts([first, second], metadatas) == ["甲" * 30 + "。" + "乙" * 50 + "。" + "丙" * 30 + "。"]
+
+
+def test_repeated_sentences_are_dropped_across_judgments():
+    shared = "本院认为，被诉决定认定事实清楚，适用法律正确。"
+    contexts = pack_contexts([shared + "甲方胜诉。", shared + "乙方败诉。"],
+                             [{"source": "a.txt", "chunk_index": 0}, {"source": "b.txt", "chunk_index": 4}])
+    assert contexts == [shared + "甲方胜诉。", "乙方败诉。"]
+
+
+def test_budget_keeps_best_ranked_contexts():
+    texts = ["一" * 50 + "。", "二" * 50 + "。", "三" * 50 + "。"]
+    contexts = pack_contexts(texts, budget=110)
+    assert contexts == texts[:2]
+    assert sum(estimate_tokens(context) for context in contexts) <= 110
+
+
+def test_template_is_rendered_once_without_nested_substitution():
+    template = PromptTemplate("已知信息:\n{contexts}\n用户问：\n{query}")
+    assert template.render(["包含{query}字样"], "问题") == "已知信息:\n包含{query}字样\n用户问：\n问题"
+
+
+if __name__ == "__main__":
+    test_overlapping_neighbours_are_merged()
+    test_repeated_sentences_are_dropped_across_judgments()
+    test_budget_keeps_best_ranked_contexts()
+    test_template_is_rendered_once_without_nested_substitution()
+    print("Context assembly tests passed.")
@@ -0,0 +1,64 @@
+import importlib.util
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sentence_transformers
+import encoder
+
+
+class FakeSentenceTransformer:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+        self.kwargs = kwargs
+
+
+def without_onnx(monkeypatch):
+    find_spec = importlib.util.find_spec
+
+    def fake_find_spec(name, *args):
+        if name.split(".")[0] in ("onnxruntime", "optimum"):
+            return None
+        return find_spec(name, *args)
+
+    monkeypatch.setattr(importlib.util, "find_spec", fake_find_spec)
+
+
+def test_backend_selection(monkeypatch):
+    monkeypatch.setattr(sentence_transformers, "SentenceTransformer", FakeSentenceTransformer)
+    monkeypatch.setattr(encoder, "missing_modules", lambda backend: [])
+    assert encoder.load_encoder("m", "torch").kwargs == {"device": "cpu"}
+    assert encoder.load_encoder("m", "onnx").kwargs == {"device": "cpu", "backend": "onnx"}
+    assert encoder.load_encoder("m", "onnx-int8").kwargs["model_kwargs"] == {"file_name": encoder.ONNX_INT8_FILE}
+    for backend, fallback in (("tensorflow", ""), ("onnx", "cuda")):
+        try:
+            encoder.load_encoder("m", backend, fallback)
+            raise AssertionError(f"accepted {backend}, {fallback}")
+        except ValueError:
+            pass
+
+
+def test_missing_onnx_packages_fail_or_fall_back(monkeypatch):
+    monkeypatch.setattr(sentence_transformers, "SentenceTransformer", FakeSentenceTransformer)
+    without_onnx(monkeypatch)
+    assert encoder.missing_modules("onnx") == ["onnxruntime", "optimum.onnxruntime"]
+    assert encoder.missing_modules("torch") == []
+    try:
+        encoder.load_encoder("m", "onnx-int8", fallback="")
+        raise AssertionError("loaded onnx-int8 without onnxruntime")
+    except ImportError as e:
+        assert "sentence-transformers[onnx]" in str(e)
+    assert encoder.select_backend("onnx", "torch") == "torch"
+    assert encoder.load_encoder("m", "onnx", fallback="torch").kwargs == {"device": "cpu"}
+    # A fallback that cannot be loaded either is no fallback
+    try:
+        encoder.select_backend("onnx", "onnx-int8")
+        raise AssertionError("fell back to onnx-int8 without onnxruntime")
+    except ImportError:
+        pass
+
+
+if __name__ == "__main__":
+    # Both tests need pytest's monkeypatch fixture
+    import pytest
+    sys.exit(pytest.main(["-q", __file__]))
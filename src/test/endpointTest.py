@@ -0,0 +1,100 @@
+import os
+import sys
+
+os.environ["WARMUP_ON_STARTUP"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fastapi.testclient import TestClient
+import query
+
+
+def fake_pipeline(monkeypatch):
+    """
+    Replaces retrieval and the LLM: each question gets one context naming it, and
+    the answer echoes the question. Returns the list of questions sent to the LLM.
+    """
+    asked = []
+
+    def prepare_contexts_batch(questions, filters=None):
+        return [([f"id-{question}"], [f"context of {question}"]) for question in questions]
+
+    async def answer_question(question, context_ids, contexts):
+        asked.append(question)
+        return f"answer to {question}"
+
+    monkeypatch.setattr(query, "prepare_contexts_batch", prepare_contexts_batch)
+    monkeypatch.setattr(query, "prepare_contexts", lambda question, filters=None: prepare_contexts_batch([question])[0])
+    monkeypatch.setattr(query, "answer_question", answer_question)
+    return asked
+
+
+def test_batch_answers_in_input_order(monkeypatch):
+    asked = fake_pipeline(monkeypatch)
+    questions = ["甲", "乙", "甲", "丙"]
+    response = TestClient(query.app).post("/query/batch", json={"questions": questions})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["question"] for result in results] == questions
+    assert [result["answer"] for result in results] == [f"answer to {question}" for question in questions]
+    assert results[1]["contexts"] == ["context of 乙"]
+    # Identical questions share one LLM call
+    assert sorted(asked) == ["丙", "乙", "甲"]
+
+
+class FakeCollection:
+    """
+    Returns, for each query embedding, two documents naming it; records every query call.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def query(self, query_embeddings, n_results, where, include):
+        self.calls.append(query_embeddings)
+        return {
+            "ids": [[f"{e[0]}-1", f"{e[0]}-2"] for e in query_embeddings],
+            "documents": [[f"doc {e[0]} 1", f"doc {e[0]} 2"] for e in query_embeddings],
+            "metadatas": [[{}, {}] for _ in query_embeddings]
+        }
+
+
+def test_query_db_batch_keeps_input_order_in_one_query(monkeypatch):
+    collection = FakeCollection()
+    questions = ["甲", "乙", "丙"]
+    monkeypatch.setattr(query, "HYBRID_SEARCH", False)
+    monkeypatch.setattr(query, "RERANK_ENABLED", False)
+    monkeypatch.setattr(query, "get_collection", lambda: collection)
+    monkeypatch.setattr(query, "encode_questions", lambda batch: [[questions.index(q)] for q in batch])
+    contexts = query.query_db_batch(["丙", "甲", "乙"])
+    assert contexts == [["doc 2 1", "doc 2 2"], ["doc 0 1", "doc 0 2"], ["doc 1 1", "doc 1 2"]]
+    assert collection.calls == [[[2], [0], [1]]]
+    assert query.query_db_batch([]) == []
+
+
+def test_bad_requests_get_400(monkeypatch):
+    fake_pipeline(monkeypatch)
+    client = TestClient(query.app)
+    for path, body in [
+        ("/query", {"question": 123}),
+        ("/query", {"question": ["征地补偿"]}),
+        ("/query", {"question": "   "}),
+        ("/query", ["征地补偿"]),
+        ("/query/batch", {"questions": ["征地补偿", 5]}),
+        ("/query/batch", {"questions": ["征地补偿", None]}),
+        ("/query/batch", {"questions": ["征地补偿", " "]}),
+        ("/query/batch", {"questions": "征地补偿"}),
+        ("/query/batch", {"questions": []}),
+        ("/query/batch", {"questions": ["征地补偿"] * (query.QUERY_BATCH_MAX_SIZE + 1)}),
+        ("/query/batch", {"questions": ["征地补偿"], "filters": {"year": []}}),
+    ]:
+        response = client.post(path, json=body)
+        assert response.status_code == 400, (path, body)
+        assert "error" in response.json()
+    response = client.post("/query", content=b"{not json", headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+    assert client.post("/query", json={"question": "征地补偿"}).json()["answer"] == "answer to 征地补偿"
+
+
+if __name__ == "__main__":
+    # The tests need pytest's monkeypatch fixture
+    import pytest
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+
+os.environ["WARMUP_ON_STARTUP"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import query
+from chunk import CHILD_MAX_CHARS, PARENT_TEXT_KEY, chunkHierarchical, splitSections
+from parents import ParentStore
+
+JUDGMENT = """河南省高级人民法院
+行 政 判 决 书
+（2020）豫行终3143号
+上诉人（原审原告）：南阳某某房地产开发有限公司。
+被上诉人（原审被告）：河南省南阳市人民政府。
+上诉人因征地补偿款纠纷一案，不服一审判决，向本院提起上诉。
+经审理查明，2015年3月，被上诉人作出征地补偿决定，补偿款为人民币3200000元。
+上诉人认为补偿标准过低，多次申请复议。
+本院认为，征地补偿应当依照法定标准足额支付。被上诉人按照省定标准核算补偿款，并无不当。上诉人的上诉理由缺乏事实和法律依据，本院不予支持。依照《中华人民共和国行政诉讼法》第八十九条第一款第一项之规定，判决如下：
+驳回上诉，维持原判。
+二审案件受理费50元，由上诉人负担。
+审判长　王某
+二〇二一年三月五日"""
+
+
+def test_judgment_sections():
+    sections = splitSections(JUDGMENT)
+    assert [name for name, _ in sections] == ["首部", "事实", "本院认为", "判决主文", "尾部"]
+    assert dict(sections)["判决主文"] == "驳回上诉，维持原判。\n二审案件受理费50元，由上诉人负担。"
+
+
+def test_children_are_small_and_do_not_overlap():
+    children, metadatas = chunkHierarchical(JUDGMENT, "a.txt")
+    assert all(len(child) <= CHILD_MAX_CHARS for child in children)
+    parents = {}
+    for child, metadata in zip(children, metadatas):
+        if PARENT_TEXT_KEY in metadata:
+            assert metadata["parent_id"] not in parents
+            parents[metadata["parent_id"]] = metadata[PARENT_TEXT_KEY]
+        # Every child belongs to a parent introduced at or before it
+        assert child in parents[metadata["parent_id"]].replace("\n", "")
+    # Children cover their parents exactly once
+    for parent_id, parent in parents.items():
+        joined = "".join(child for child, metadata in zip(children, metadatas) if metadata["parent_id"] == parent_id)
+        assert joined == parent.replace("\n", "")
+    sections = [metadata["section"] for metadata in metadatas]
+    assert sections.index("判决主文") > sections.index("本院认为")
+
+
+def test_children_expand_to_their_parents(monkeypatch):
+    with tempfile.TemporaryDirectory() as folder:
+        store = ParentStore(os.path.join(folder, "parents.sqlite3"))
+        children, metadatas = chunkHierarchical(JUDGMENT, "a.txt")
+        store.add([(m["parent_id"], "a.txt", m["section"], m["parent_index"], m.pop(PARENT_TEXT_KEY))
+                   for m in metadatas if PARENT_TEXT_KEY in m])
+        monkeypatch.setattr(query, "get_parent_store", lambda: store)
+
+        holding = [i for i, m in enumerate(metadatas) if m["section"] == "本院认为"]
+        hits = holding + [0, holding[0]]
+        contexts, expanded = query.expand_parents([children[i] for i in hits], [dict(metadatas[i], source="a.txt") for i in hits])
+        # One context per parent, in the order of their best child
+        assert len(contexts) == 2
+        assert contexts[0].startswith("本院认为") and contexts[0].endswith("判决如下：")
+        assert contexts[1].startswith("河南省高级人民法院")
+        assert [m["chunk_index"] for m in expanded] == [metadatas[holding[0]]["parent_index"], 0]
+
+        # Flat chunks pass through untouched
+        assert query.expand_parents(["flat"], [{"source": "b.txt"}]) == (["flat"], [{"source": "b.txt"}])
+
+        store.delete_source("a.txt")
+        assert store.count() == 0
+
+
+if __name__ == "__main__":
+    test_judgment_sections()
+    test_children_are_small_and_do_not_overlap()
+    print("Chunking tests passed; run the expansion test with pytest.")
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import chromadb
+import numpy as np
+import embedding
+from chunk import streamChunks
+from lexical import LexicalIndex
+from parents import ParentStore
+
+
+class FakeModel:
+    """
+    Deterministic 8-dimensional "embeddings"; records the texts it encodes and can fail
+    on a given encode call, like a run killed halfway.
+    """
+
+    def __init__(self, fail_on_call=None):
+        self.encoded = []
+        self.batches = []
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+
+    def encode(self, texts, batch_size=None):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("ingestion interrupted")
+        self.encoded.extend(texts)
+        self.batches.append(len(texts))
+        return np.array([np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:8], dtype=np.uint8) / 255.0
+                         for text in texts], dtype=np.float32)
+
+
+def judgment(case: int, subject: str, paragraphs: int = 40) -> str:
+    lines = ["河南省高级人民法院", "行政判决书", f"（2020）豫行终{case}号"]
+    lines += [f"{subject}第{i}段：本院经审理查明，上诉人就{subject}一事提出的第{i}项请求，有相应证据证明。" * 3
+              for i in range(paragraphs)]
+    return "\n".join(lines)
+
+
+def write(folder, filename, text):
+    with open(os.path.join(folder, filename), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+class Store:
+    """
+    A throwaway store: Chroma collection, lexical index, parent store and manifest in one folder.
+    """
+
+    def __init__(self, monkeypatch, folder, model):
+        self.docs = os.path.join(folder, "doc")
+        os.makedirs(self.docs)
+        self.collection = chromadb.PersistentClient(path=os.path.join(folder, "chroma")).get_or_create_collection("law_texts")
+        self.lexical = LexicalIndex(os.path.join(folder, "lexical.sqlite3"))
+        self.model = model
+        monkeypatch.setattr(embedding, "MANIFEST_PATH", os.path.join(folder, "manifest.json"))
+        monkeypatch.setattr(embedding, "get_collection", lambda: self.collection)
+        monkeypatch.setattr(embedding, "get_lexical_index", lambda: self.lexical)
+        monkeypatch.setattr(embedding, "get_parent_store", lambda: ParentStore(os.path.join(folder, "parents.sqlite3")))
+        monkeypatch.setattr(embedding, "get_model", lambda: self.model)
+
+    def ingest(self, **kwargs):
+        return embedding.embed_docs_incremental(self.docs, workers=1, **kwargs)
+
+    def ids_of(self, source):
+        return set(self.collection.get(where={"source": source}, include=[])["ids"])
+
+
+def distinct_chunks(folder, filename):
+    return len({chunk for _, _, chunk, _ in streamChunks([filename], folder, workers=1)})
+
+
+def test_chunks_are_encoded_and_upserted_in_batches(monkeypatch):
+    with tempfile.TemporaryDirectory() as folder:
+        store = Store(monkeypatch, folder, FakeModel())
+        for case, filename in enumerate(["a.txt", "b.txt", "c.txt"], 1):
+            write(store.docs, filename, judgment(case, filename[0] * 3))
+        total = sum(distinct_chunks(store.docs, filename) for filename in ("a.txt", "b.txt", "c.txt"))
+        assert store.ingest(batch_size=4) == total == store.collection.count() == store.lexical.count()
+        # Batches run across file boundaries; only the last one is short
+        assert store.model.batches == [4] * (total // 4) + ([total % 4] if total % 4 else [])
+        stored = store.collection.get(ids=[embedding.chunk_id(store.model.encoded[0], "a.txt")], include=["metadatas"])
+        assert stored["metadatas"][0]["case_number"] == "(2020)豫行终1号"
+
+
+def test_incremental_ingestion(monkeypatch):
+    with tempfile.TemporaryDirectory() as folder:
+        store = Store(monkeypatch, folder, FakeModel())
+        for case, filename in enumerate(["a.txt", "b.txt", "c.txt"], 1):
+            write(store.docs, filename, judgment(case, filename[0] * 3))
+        embedded = store.ingest(batch_size=4)
+        assert embedded == store.collection.count() == store.lexical.count() == len(store.model.encoded)
+        ids = {source: store.ids_of(source) for source in ("a.txt", "b.txt", "c.txt")}
+        assert all(ids.values())
+        manifest = embedding.load_manifest()
+        assert {filename: entry["chunks"] for filename, entry in manifest.items()} == \
+            {source: len(source_ids) for source, source_ids in ids.items()}
+
+        # Nothing changed: nothing is encoded
+        store.model.encoded.clear()
+        assert store.ingest(batch_size=4) == 0 and store.model.encoded == []
+
+        # b.txt changes, c.txt is deleted
+        write(store.docs, "b.txt", judgment(2, "乙乙乙"))
+        os.remove(os.path.join(store.docs, "c.txt"))
+        embedded = store.ingest(batch_size=4)
+        assert embedded == len(store.model.encoded) == distinct_chunks(store.docs, "b.txt")
+        assert all("乙乙乙" in text for text in store.model.encoded)
+        assert store.ids_of("a.txt") == ids["a.txt"]
+        assert store.ids_of("b.txt").isdisjoint(ids["b.txt"])
+        assert store.ids_of("c.txt") == set() and "c.txt" not in embedding.load_manifest()
+        assert store.lexical.count() == store.collection.count()
+        assert store.lexical.get(sorted(ids["b.txt"] | ids["c.txt"])) == {}
+
+        # Ids only depend on the file name and chunk text, so a rebuild reproduces them
+        before = set(store.collection.get(include=[])["ids"])
+        store.ingest(batch_size=7, full=True)
+        assert set(store.collection.get(include=[])["ids"]) == before
+
+
+def test_interrupted_run_resumes(monkeypatch):
+    with tempfile.TemporaryDirectory() as folder:
+        store = Store(monkeypatch, folder, FakeModel(fail_on_call=2))
+        for case, filename in enumerate(["a.txt", "b.txt", "c.txt"], 1):
+            write(store.docs, filename, judgment(case, filename[0] * 3))
+        # The first batch holds all of a.txt and the first chunk of b.txt, then the run dies
+        batch_size = distinct_chunks(store.docs, "a.txt") + 1
+        try:
+            store.ingest(batch_size=batch_size)
+            raise AssertionError("the run was not interrupted")
+        except RuntimeError:
+            pass
+        assert list(embedding.load_manifest()) == ["a.txt"]
+        committed = store.ids_of("a.txt")
+
+        store.model = FakeModel()
+        embedded = store.ingest(batch_size=batch_size)
+        assert embedded == distinct_chunks(store.docs, "b.txt") + distinct_chunks(store.docs, "c.txt")
+        assert not any("aaa" in text for text in store.model.encoded)
+        assert store.ids_of("a.txt") == committed
+        assert sorted(embedding.load_manifest()) == ["a.txt", "b.txt", "c.txt"]
+        # b.txt's partial batch was replaced, not duplicated
+        assert len(store.ids_of("b.txt")) == distinct_chunks(store.docs, "b.txt")
+        assert store.collection.count() == store.lexical.count()
+
+
+if __name__ == "__main__":
+    # The tests need pytest's monkeypatch fixture
+    import pytest
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lexical import LexicalIndex, ngrams, reciprocal_rank_fusion, term_tokens
+
+DOCS = {
+    "a": ("（2020）豫行终3143号 南阳某某房地产开发有限公司诉南阳市人民政府征地补偿", "a.txt"),
+    "b": ("（2019）豫01民初88号 郑州某某公司买卖合同纠纷", "b.txt"),
+    "c": ("南阳市中级人民法院审理的劳动争议案件", "c.txt"),
+}
+
+
+def make_index(folder):
+    index = LexicalIndex(os.path.join(folder, "lexical.sqlite3"))
+    index.add(list(DOCS), [text for text, _ in DOCS.values()], [source for _, source in DOCS.values()],
+              [{"source": source} for _, source in DOCS.values()])
+    return index
+
+
+def test_exact_identifiers_rank_first():
+    with tempfile.TemporaryDirectory() as folder:
+        index = make_index(folder)
+        # Full-width and half-width brackets and spaces index the same way
+        hits = index.search("(2020) 豫行终 3143 号", 3)
+        assert hits[0][0] == "a"
+        assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+        assert index.search("南阳", 3)[0][0] in ("a", "c")
+        assert index.search("买卖合同", 1) == index.search("买卖合同", 5)[:1]
+        assert index.search("", 3) == [] and index.search("ｘｙｚ无关", 3) == []
+        assert index.get(["b", "missing"])["b"]["metadata"] == {"source": "b.txt"}
+
+
+def test_reindexing_and_deleting_update_the_postings():
+    with tempfile.TemporaryDirectory() as folder:
+        index = make_index(folder)
+        index.add(["a"], ["上海市浦东新区人民法院"], ["a.txt"])
+        assert "a" not in [doc_id for doc_id, _ in index.search("豫行终3143号", 3)]
+        assert index.search("浦东新区", 1)[0][0] == "a"
+        assert index.count() == 3
+
+        index.delete_source("c.txt")
+        assert index.count() == 2
+        assert "c" not in [doc_id for doc_id, _ in index.search("劳动争议", 3)]
+        index.clear()
+        assert index.count() == 0 and index.search("郑州", 3) == []
+
+
+def test_readers_see_later_commits():
+    with tempfile.TemporaryDirectory() as folder:
+        writer = make_index(folder)
+        reader = LexicalIndex(writer.path, read_only=True)
+        assert reader.search("郑州", 1)[0][0] == "b"
+        writer.add(["d"], ["郑州铁路运输法院"], ["d.txt"])
+        assert reader.search("铁路运输", 1)[0][0] == "d"
+        writer.delete_source("b.txt")
+        assert "b" not in [doc_id for doc_id, _ in reader.search("郑州", 3)]
+
+
+def test_indexes_with_a_postings_table_are_migrated():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "lexical.sqlite3")
+        db = sqlite3.connect(path)
+        db.executescript("""
+            CREATE TABLE docs (id TEXT PRIMARY KEY, source TEXT, text TEXT, metadata TEXT, length INTEGER);
+            CREATE TABLE postings (term TEXT, doc_id TEXT, tf INTEGER);
+        """)
+        text, source = DOCS["a"]
+        db.execute("INSERT INTO docs VALUES (?, ?, ?, ?, ?)", ("a", source, text, json.dumps({}), len(ngrams(text))))
+        db.commit()
+        db.close()
+        # Query workers cannot convert it, and say how to
+        try:
+            LexicalIndex(path, read_only=True)
+            raise AssertionError("opened an old index read-only")
+        except ValueError as e:
+            assert "--rebuild-lexical" in str(e)
+        index = LexicalIndex(path)
+        assert index.search("豫行终3143号", 1)[0][0] == "a"
+        assert index.search("（2020）豫行终3143号", 1) == [("a", float("inf"))]
+        assert LexicalIndex(path, read_only=True).search("征地补偿", 1)[0][0] == "a"
+        tables = {row[0] for row in sqlite3.connect(path).execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert "postings" not in tables
+
+
+def test_case_number_lookups_are_fast():
+    with tempfile.TemporaryDirectory() as folder:
+        index = make_index(folder)
+        # Every chunk shares the court's and the case numbers' common bigrams
+        texts = [f"河南省高级人民法院（2021）豫行终{i}号 本院认为，上诉理由不能成立。" for i in range(5000)]
+        index.add([f"n{i}" for i in range(5000)], texts, ["n.txt"] * 5000)
+        reader = LexicalIndex(index.path, read_only=True)
+        assert reader.search("(2020)豫行终3143号", 3)[0] == ("a", float("inf"))
+        latencies = []
+        for _ in range(50):
+            started_at = time.perf_counter()
+            reader.search("(2020)豫行终3143号", 10)
+            latencies.append(time.perf_counter() - started_at)
+        assert statistics.median(latencies) < 0.001, latencies
+        # The rest of the question is still searched by n-grams
+        hits = reader.search("(2020)豫行终3143号 买卖合同", 2)
+        assert hits[0] == ("a", float("inf")) and hits[1][0] == "b"
+        tokens = term_tokens("河南省高级人民法院郑州")
+        assert term_tokens("郑州")[0] in reader._rare_terms(tokens)
+        assert term_tokens("法院")[0] not in reader._rare_terms(tokens)
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]]) == ["a", "c", "b"]
+
+
+if __name__ == "__main__":
+    test_exact_identifiers_rank_first()
+    test_reindexing_and_deleting_update_the_postings()
+    test_readers_see_later_commits()
+    test_indexes_with_a_postings_table_are_migrated()
+    test_case_number_lookups_are_fast()
+    test_reciprocal_rank_fusion()
+    print("Lexical tests passed.")
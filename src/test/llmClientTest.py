@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_client import DeepseekClient, LLMError
+
+
+class StubDeepseek(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the Deepseek chat completions API.
+    Fails the first `failures` requests with 503 and sleeps `delay` seconds per request.
+    A `reply` (bytes) replaces the body of successful responses.
+    """
+    failures = 0
+    delay = 0.0
+    reply = None
+    requests = 0
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        cls = type(self)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with cls.lock:
+            cls.requests += 1
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            fail = cls.requests <= cls.failures
+        try:
+            time.sleep(cls.delay)
+            if fail:
+                self.send_response(503)
+                self.end_headers()
+                self.wfile.write(b"busy")
+                return
+            content = "stub: " + body["messages"][0]["content"]
+            payload = cls.reply or json.dumps({"choices": [{"message": {"content": content}}]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(failures: int = 0, delay: float = 0.0, reply: bytes = None):
+    handler = type("Stub", (StubDeepseek,), {"failures": failures, "delay": delay, "reply": reply, "requests": 0,
+                                             "in_flight": 0, "max_in_flight": 0, "lock": threading.Lock()})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler, f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+
+def test_chat_returns_content():
+    server, _, url = start_stub()
+    client = DeepseekClient(api_key="test", api_url=url)
+
+    async def run():
+        try:
+            return await client.chat("你好")
+        finally:
+            await client.aclose()
+    try:
+        assert asyncio.run(run()) == "stub: 你好"
+    finally:
+        server.shutdown()
+
+
+def test_retries_transient_errors():
+    server, handler, url = start_stub(failures=2)
+    client = DeepseekClient(api_key="test", api_url=url, max_retries=3, backoff=0.01)
+
+    async def run():
+        try:
+            return await client.chat("q")
+        finally:
+            await client.aclose()
+    try:
+        assert asyncio.run(run()) == "stub: q"
+        assert handler.requests == 3
+    finally:
+        server.shutdown()
+
+
+def test_gives_up_after_max_retries():
+    server, handler, url = start_stub(failures=10)
+    client = DeepseekClient(api_key="test", api_url=url, max_retries=1, backoff=0.01)
+
+    async def run():
+        try:
+            return await client.chat("q")
+        finally:
+            await client.aclose()
+    try:
+        try:
+            asyncio.run(run())
+            assert False, "expected LLMError"
+        except LLMError as e:
+            assert "503" in str(e)
+        assert handler.requests == 2
+    finally:
+        server.shutdown()
+
+
+def test_timeout_is_retried_then_raised():
+    server, handler, url = start_stub(delay=0.5)
+    client = DeepseekClient(api_key="test", api_url=url, timeout=0.1, max_retries=1, backoff=0.01)
+
+    async def run():
+        try:
+            return await client.chat("q")
+        finally:
+            await client.aclose()
+    try:
+        try:
+            asyncio.run(run())
+            assert False, "expected LLMError"
+        except LLMError as e:
+            assert "Timeout" in str(e)
+    finally:
+        server.shutdown()
+
+
+def test_concurrency_is_bounded():
+    server, handler, url = start_stub(delay=0.1)
+    client = DeepseekClient(api_key="test", api_url=url, max_concurrency=3)
+
+    async def run():
+        try:
+            return await asyncio.gather(*(client.chat(str(i)) for i in range(12)))
+        finally:
+            await client.aclose()
+    try:
+        answers = asyncio.run(run())
+        assert answers == [f"stub: {i}" for i in range(12)]
+        assert handler.max_in_flight <= 3
+    finally:
+        server.shutdown()
+
+
+def test_malformed_replies_raise_llm_error():
+    for reply in (b"not json", b"{}", b'{"choices": []}', b'{"choices": [{"message": {"content": null}}]}', b"[1]"):
+        server, handler, url = start_stub(reply=reply)
+        client = DeepseekClient(api_key="test", api_url=url, max_retries=2, backoff=0.01)
+
+        async def run():
+            try:
+                return await client.chat("q")
+            finally:
+                await client.aclose()
+        try:
+            try:
+                asyncio.run(run())
+                assert False, f"expected LLMError for {reply}"
+            except LLMError as e:
+                assert "Malformed" in str(e)
+            assert handler.requests == 1
+        finally:
+            server.shutdown()
+
+
+def test_client_of_a_finished_loop_is_closed():
+    server, _, url = start_stub()
+    client = DeepseekClient(api_key="test", api_url=url)
+    try:
+        assert asyncio.run(client.chat("a")) == "stub: a"
+        first = client._client
+        assert asyncio.run(client.chat("b")) == "stub: b"
+        assert first.is_closed and client._client is not first
+        asyncio.run(client.aclose())
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_chat_returns_content()
+    test_retries_transient_errors()
+    test_gives_up_after_max_retries()
+    test_timeout_is_retried_then_raised()
+    test_concurrency_is_bounded()
+    test_malformed_replies_raise_llm_error()
+    test_client_of_a_finished_loop_is_closed()
+    print("LLM client tests passed.")
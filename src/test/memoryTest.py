@@ -0,0 +1,79 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agent"))
+from memory import ConversationMemory, as_dict, estimate_tokens, shorten_to_tokens
+
+
+def add_turn(memory, question, tool_result, answer, call_id):
+    memory.add({"role": "user", "content": question})
+    memory.add({"role": "assistant", "content": None, "tool_calls": [
+        {"id": call_id, "type": "function", "function": {"name": "query_database", "arguments": "{}"}}]})
+    memory.add({"role": "tool", "tool_call_id": call_id, "content": tool_result})
+    memory.add({"role": "assistant", "content": answer})
+
+
+def test_history_within_budget_is_untouched():
+    memory = ConversationMemory("系统提示", token_budget=1000)
+    add_turn(memory, "有多少任务？", "x" * 100, "两个任务。", "c1")
+    assert [m["role"] for m in memory.window()] == ["system", "user", "assistant", "tool", "assistant"]
+    assert memory.window()[3]["content"] == "x" * 100
+
+
+def test_old_tool_results_are_compacted_first():
+    memory = ConversationMemory("系统提示", token_budget=300, old_tool_result_chars=20)
+    add_turn(memory, "第一问", "a" * 800, "第一答", "c1")
+    add_turn(memory, "第二问", "b" * 400, "第二答", "c2")
+    messages = memory.window()
+    assert memory.tokens() <= 300
+    assert len(messages) == 9
+    assert messages[3]["content"].startswith("a" * 20 + "...")
+    # The current turn keeps its full tool result
+    assert messages[7]["content"] == "b" * 400
+
+
+def test_oldest_turns_are_summarized_and_system_prompt_kept():
+    memory = ConversationMemory("系统提示", token_budget=120, old_tool_result_chars=10)
+    for i in range(6):
+        add_turn(memory, f"问题{i}" * 5, "r" * 50, f"答案{i}" * 5, f"c{i}")
+    messages = memory.window()
+    assert memory.tokens() <= 120 and len(memory.turns) == 1
+    assert messages[0] == {"role": "system", "content": "系统提示"}
+    # The summary holds the most recent dropped turn
+    assert messages[1]["content"].startswith("Summary of the earlier conversation:\nQ: 问题4")
+    # Whole turns are dropped, so every tool result still follows its call
+    roles = [m["role"] for m in messages[2:]]
+    assert roles[0] == "user" and roles[-1] == "assistant"
+    assert messages[-1]["content"] == "答案5" * 5
+
+
+def test_summary_is_capped_in_tokens():
+    memory = ConversationMemory("system", token_budget=600, old_tool_result_chars=10)
+    for i in range(12):
+        add_turn(memory, f"question {i} " + "about the schedule " * 6, "r" * 50, f"answer {i} " + "it is fine " * 6, f"c{i}")
+    memory.window()
+    # Each summary line is about 50 tokens but 200 characters: a quarter of the budget
+    # holds two whole lines, where a cap of 150 characters would cut the first one
+    assert estimate_tokens(memory.summary) <= 150
+    assert memory.summary.count("Q: ") == 2 and "dropped" not in memory.summary
+    assert memory.tokens() <= 600
+
+    text = "判决" * 100
+    assert estimate_tokens(shorten_to_tokens(text, 50).split("...")[0]) == 50
+    assert shorten_to_tokens("short", 50) == "short"
+
+
+def test_openai_messages_become_plain_dicts():
+    message = SimpleNamespace(role="assistant", content=None, refusal=None, tool_calls=[
+        SimpleNamespace(id="c1", function=SimpleNamespace(name="search_wikipedia", arguments='{"query": "法院"}'))])
+    assert as_dict(message) == {"role": "assistant", "content": None, "tool_calls": [
+        {"id": "c1", "type": "function", "function": {"name": "search_wikipedia", "arguments": '{"query": "法院"}'}}]}
+
+
+if __name__ == "__main__":
+    test_history_within_budget_is_untouched()
+    test_old_tool_results_are_compacted_first()
+    test_oldest_turns_are_summarized_and_system_prompt_kept()
+    test_openai_messages_become_plain_dicts()
+    print("Conversation memory tests passed.")
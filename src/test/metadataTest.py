@@ -0,0 +1,65 @@
+import os
+import sys
+
+os.environ["WARMUP_ON_STARTUP"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fastapi.testclient import TestClient
+import query
+from chunk import extractMetadata
+
+JUDGMENT = """河南省高级人民法院
+行 政 判 决 书
+（2020）豫行终3143号
+上诉人（原审原告）：南阳某某房地产开发有限公司。
+本院认为，上诉理由不能成立。判决如下：
+驳回上诉，维持原判。
+审判长　王某
+二〇二一年三月五日"""
+
+
+def test_extract_metadata():
+    metadata = extractMetadata(JUDGMENT, "a.txt")
+    assert metadata == {
+        "source": "a.txt",
+        "court": "河南省高级人民法院",
+        "case_number": "(2020)豫行终3143号",
+        "judgment_date": "2021-03-05",
+        "year": 2021,
+        "case_type": "行政"
+    }
+    # Without a date the year comes from the case number; missing fields are left out
+    metadata = extractMetadata("民事裁定书\n（2019）豫01民初88号\n原告张某。", "b.txt")
+    assert metadata["year"] == 2019 and "court" not in metadata and "judgment_date" not in metadata
+    assert extractMetadata("", "c.txt") == {"source": "c.txt"}
+
+
+def test_build_where():
+    assert query.build_where(None) is None
+    assert query.build_where({"court": "河南省高级人民法院"}) == {"court": "河南省高级人民法院"}
+    assert query.build_where({"year": ["2020", 2021], "case_type": "行政"}) == \
+        {"$and": [{"year": {"$in": [2020, 2021]}}, {"case_type": "行政"}]}
+    for filters in ({"court": []}, {"court": {"$ne": "x"}}, {"year": [[2020]]}, {"judge": "王某"},
+                    {"year": "二〇二〇"}, {"case_type": True}, ["court"]):
+        try:
+            query.build_where(filters)
+            raise AssertionError(f"accepted {filters}")
+        except ValueError:
+            pass
+    # Lexical hits are filtered the same way
+    assert query.matches_filters({"year": 2020, "court": "a"}, {"year": ["2020", 2021], "court": "a"})
+    assert not query.matches_filters({"year": 2020}, {"court": "a"})
+
+
+def test_invalid_filters_are_rejected_with_400():
+    client = TestClient(query.app)
+    for filters in ({"court": []}, {"court": {"$ne": "x"}}, {"year": "abc"}):
+        response = client.post("/query", json={"question": "征地补偿", "filters": filters})
+        assert response.status_code == 400, filters
+        assert "error" in response.json()
+
+
+if __name__ == "__main__":
+    test_extract_metadata()
+    test_build_where()
+    test_invalid_filters_are_rejected_with_400()
+    print("Metadata and filter tests passed.")
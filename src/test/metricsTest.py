@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+
+os.environ["WARMUP_ON_STARTUP"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fastapi.testclient import TestClient
+import query
+from timing import current_timings, server_timing, stage, start_request, timed_iter
+
+
+def test_stages_add_up_per_request():
+    timings = start_request()
+    with stage("encode"):
+        time.sleep(0.01)
+    with stage("encode"):
+        time.sleep(0.01)
+    assert list(timings) == ["encode_ms"]
+    assert timings["encode_ms"] >= 20
+    assert list(timed_iter("chunk", [1, 2])) == [1, 2]
+    assert "chunk_ms" in current_timings()
+    assert server_timing({"encode_ms": 1.5, "llm_ms": 20}) == "encode;dur=1.5, llm;dur=20"
+
+
+def test_query_is_timed_and_exported(monkeypatch):
+    def prepare_contexts(question, filters=None):
+        # Runs in the threadpool: the stage must still land in the request's timings
+        with stage("vector_search"):
+            time.sleep(0.005)
+        return ["id-1"], ["context"]
+
+    async def answer_question(question, context_ids, contexts):
+        return "answer"
+
+    monkeypatch.setattr(query, "prepare_contexts", prepare_contexts)
+    monkeypatch.setattr(query, "answer_question", answer_question)
+    monkeypatch.setattr(query, "SERVER_TIMING_HEADER", True)
+    with TestClient(query.app) as client:
+        response = client.post("/query", json={"question": "问题"})
+        assert response.status_code == 200
+        assert response.json()["timings"]["vector_search_ms"] >= 5
+        assert response.headers["Server-Timing"].startswith("vector_search;dur=")
+        assert "Server-Timing" not in client.get("/health").headers
+
+        body = client.get("/metrics").text
+    assert 'rag_requests_total{endpoint="/query",status="200"}' in body
+    assert 'rag_stage_seconds_count{stage="vector_search"}' in body
+    assert "rag_request_seconds_bucket" in body
+
+
+if __name__ == "__main__":
+    test_stages_add_up_per_request()
+    print("Timing tests passed; run the endpoint test with pytest.")
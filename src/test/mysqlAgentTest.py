@@ -0,0 +1,355 @@
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agent"))
+import db
+import mysql_agent
+from db import SCHEMA_QUERY, ConnectionPool, PoolTimeout, SchemaCache, json_value, stream_select
+
+
+class StandInCursor:
+    """
+    sqlite3 cursor speaking the bits of MySQL the agent uses.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.cursor = server.db.cursor()
+
+    def execute(self, sql):
+        with self.server.lock:
+            self.server.statements.append(sql)
+        if sql == SCHEMA_QUERY:
+            sql = ("SELECT m.name, p.name FROM sqlite_master m JOIN pragma_table_info(m.name) p "
+                   "WHERE m.type = 'table' ORDER BY m.name, p.cid")
+        self.cursor.execute(sql)
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    def close(self):
+        self.cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class StandInConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self):
+        return StandInCursor(self.server)
+
+    def commit(self):
+        self.server.db.commit()
+
+    def close(self):
+        pass
+
+
+class StandInServer:
+    """
+    In-memory MySQL-compatible stand-in backed by sqlite; counts connections and statements.
+    """
+
+    def __init__(self):
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE task (id INTEGER, title TEXT, priority INTEGER);
+            CREATE TABLE employee (id INTEGER, name TEXT);
+            INSERT INTO task VALUES (1, '写报告', 2), (2, '开会', 1);
+            INSERT INTO employee VALUES (1, '张三');
+            CREATE TABLE log (id INTEGER, message TEXT);
+        """)
+        self.db.executemany("INSERT INTO log VALUES (?, ?)", [(i, f"entry {i}") for i in range(1, 251)])
+        self.lock = threading.Lock()
+        self.statements = []
+        self.connections = 0
+
+    def connect(self):
+        with self.lock:
+            self.connections += 1
+        return StandInConnection(self)
+
+
+def use_stand_in(monkeypatch, server, ttl=300):
+    pool = ConnectionPool(connect=server.connect, size=2, timeout=1)
+    cache = SchemaCache(pool, ttl=ttl)
+    monkeypatch.setattr(mysql_agent, "get_pool", lambda: pool)
+    monkeypatch.setattr(mysql_agent, "schema_cache", cache)
+    return pool, cache
+
+
+def test_queries_share_pooled_connections_and_cached_schema(monkeypatch):
+    server = StandInServer()
+    pool, cache = use_stand_in(monkeypatch, server)
+    for _ in range(3):
+        result = json.loads(mysql_agent.query_database("SELECT title FROM tasks ORDER BY id"))
+        assert result["success"] and result["row_count"] == 2
+    # One schema query, then only the real queries; tasks was matched to task
+    assert server.statements.count(SCHEMA_QUERY) == 1
+    assert server.statements[1:] == ["SELECT /*+ MAX_EXECUTION_TIME(30000) */ title FROM task ORDER BY id"] * 3
+    assert server.connections == 1
+    assert mysql_agent.get_table_schema() == ("表 employee 字段: id, name\n表 log 字段: id, message\n"
+                                              "表 task 字段: id, title, priority")
+
+
+def test_schema_cache_expires_and_invalidates(monkeypatch):
+    server = StandInServer()
+    pool, cache = use_stand_in(monkeypatch, server, ttl=0.05)
+    cache.table_names()
+    cache.table_names()
+    assert cache.loads == 1
+    time.sleep(0.06)
+    cache.table_names()
+    assert cache.loads == 2
+    mysql_agent.execute_sql("CREATE TABLE project (id INTEGER)")
+    assert "project" in cache.table_names()
+    assert cache.loads == 3
+
+
+def test_pool_is_bounded():
+    server = StandInServer()
+    pool = ConnectionPool(connect=server.connect, size=2, timeout=0.05)
+    release = threading.Event()
+
+    def hold():
+        with pool.connection():
+            release.wait(1)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(hold) for _ in range(2)]
+        time.sleep(0.02)
+        try:
+            with pool.connection():
+                raise AssertionError("a third connection was handed out")
+        except PoolTimeout:
+            pass
+        release.set()
+        for future in futures:
+            future.result()
+    assert server.connections == 2
+    assert pool.stats()["idle"] == 2
+
+
+def test_broken_connections_are_not_reused():
+    server = StandInServer()
+    pool = ConnectionPool(connect=server.connect, size=1, broken_errors=(ConnectionError,))
+    try:
+        with pool.connection():
+            raise ConnectionError("server has gone away")
+    except ConnectionError:
+        pass
+    with pool.connection():
+        pass
+    assert server.connections == 2
+
+
+def test_connections_failing_the_ping_are_replaced_and_counted():
+    server = StandInServer()
+    pool = ConnectionPool(connect=server.connect, size=1, ping_after=0, broken_errors=(ConnectionError,))
+    with pool.connection() as conn:
+        pass
+
+    def ping(reconnect, attempts):
+        raise ConnectionError("server has gone away")
+
+    conn.ping = ping
+    with pool.connection() as replacement:
+        assert replacement is not conn
+    assert server.connections == 2
+    assert pool.stats() == {"size": 1, "created": 2, "idle": 1}
+
+
+def test_large_results_are_truncated_and_paged(monkeypatch):
+    server = StandInServer()
+    pool, cache = use_stand_in(monkeypatch, server)
+    first = json.loads(mysql_agent.query_database("SELECT id, message FROM logs ORDER BY id"))
+    assert first["columns"] == ["id", "message"]
+    assert first["rows"][0] == [1, "entry 1"]
+    assert first["row_count"] == db.DB_RESULT_MAX_ROWS
+    assert first["truncated"] and first["total_rows"] == 250
+
+    second = json.loads(mysql_agent.fetch_more_rows(first["next_page"]))
+    assert second["offset"] == db.DB_RESULT_MAX_ROWS
+    assert second["rows"][0] == [db.DB_RESULT_MAX_ROWS + 1, f"entry {db.DB_RESULT_MAX_ROWS + 1}"]
+    third = json.loads(mysql_agent.fetch_more_rows(second["next_page"]))
+    assert not third["truncated"] and "next_page" not in third
+    assert third["rows"][-1] == [250, "entry 250"]
+    assert "error" in json.loads(mysql_agent.fetch_more_rows("unknown"))
+
+
+def test_byte_limit_and_count_limit(monkeypatch):
+    server = StandInServer()
+    pool = ConnectionPool(connect=server.connect, size=1)
+    page = stream_select("SELECT message FROM log", max_rows=1000, max_bytes=50, pool=pool)
+    assert 1 <= len(page["rows"]) < 10 and page["truncated"]
+
+    # Past DB_COUNT_MAX_ROWS extra rows the count stops and the half-read connection is dropped
+    monkeypatch.setattr(db, "DB_COUNT_MAX_ROWS", 10)
+    monkeypatch.setattr(db, "DB_FETCH_SIZE", 5)
+    page = stream_select("SELECT id FROM log", max_rows=5, pool=pool)
+    assert page["truncated"] and "total_rows" not in page
+    assert 15 < page["total_rows_at_least"] < 250
+    assert pool.stats()["idle"] == 0
+
+
+def test_values_keep_their_json_types():
+    assert json_value(Decimal("12.30")) == 12.3
+    assert json_value(Decimal("5.00")) == 5
+    assert json_value(Decimal("12345678901234567.89")) == "12345678901234567.89"
+    assert json_value(datetime.date(2024, 3, 5)) == "2024-03-05"
+    assert json_value(datetime.timedelta(hours=26, minutes=3)) == "26:03:00"
+    assert json_value(b"\xff\x00") == "0xff00"
+    assert json_value("文本".encode("utf-8")) == "文本"
+    assert json_value({"b", "a"}) == ["a", "b"]
+
+
+def tool_call(call_id, name, **arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+def test_tool_calls_run_concurrently_in_order(monkeypatch):
+    def slow(label, seconds):
+        def tool(*args):
+            time.sleep(seconds)
+            return json.dumps({"label": label})
+        return tool
+
+    monkeypatch.setattr(mysql_agent, "query_database", slow("db", 0.3))
+    monkeypatch.setattr(mysql_agent, "search_wikipedia", slow("wiki", 0.1))
+    agent = mysql_agent.Agent.__new__(mysql_agent.Agent)
+    started_at = time.perf_counter()
+    results = agent.execute_tools([tool_call("a", "query_database", query="SELECT 1"),
+                                   tool_call("b", "search_wikipedia", query="法院")])
+    assert time.perf_counter() - started_at < 0.38
+    assert [(call.id, json.loads(result)["label"]) for call, result, _ in results] == [("a", "db"), ("b", "wiki")]
+
+
+def test_slow_tool_times_out_without_blocking_others(monkeypatch):
+    monkeypatch.setenv("SEARCH_WIKIPEDIA_TIMEOUT", "0.1")
+    monkeypatch.setattr(mysql_agent, "search_wikipedia", lambda query: time.sleep(0.5) or "{}")
+    monkeypatch.setattr(mysql_agent, "query_database", lambda query: json.dumps({"success": True}))
+    agent = mysql_agent.Agent.__new__(mysql_agent.Agent)
+    started_at = time.perf_counter()
+    results = agent.execute_tools([tool_call("a", "search_wikipedia", query="法院"),
+                                   tool_call("b", "query_database", query="SELECT 1")])
+    assert time.perf_counter() - started_at < 0.4
+    assert "timed out" in json.loads(results[0][1])["error"]
+    assert json.loads(results[1][1]) == {"success": True}
+
+
+def test_stuck_tools_do_not_starve_later_turns(monkeypatch):
+    released = threading.Event()
+    monkeypatch.setenv("SEARCH_WIKIPEDIA_TIMEOUT", "0.05")
+    monkeypatch.setattr(mysql_agent, "search_wikipedia", lambda query: released.wait(5) and "{}")
+    monkeypatch.setattr(mysql_agent, "query_database", lambda query: json.dumps({"success": True}))
+    agent = mysql_agent.Agent.__new__(mysql_agent.Agent)
+    try:
+        # More stuck calls than a turn may run at once are still running afterwards
+        for _ in range(mysql_agent.TOOL_MAX_WORKERS + 1):
+            results = agent.execute_tools([tool_call("a", "search_wikipedia", query="法院")])
+            assert "timed out" in json.loads(results[0][1])["error"]
+        started_at = time.perf_counter()
+        results = agent.execute_tools([tool_call("b", "query_database", query="SELECT 1")])
+        assert json.loads(results[0][1]) == {"success": True}
+        assert time.perf_counter() - started_at < 0.5
+    finally:
+        released.set()
+
+
+def test_connections_have_a_read_timeout(monkeypatch):
+    options = {}
+    monkeypatch.setattr(db.mysql.connector, "connect", lambda **kwargs: options.update(kwargs))
+    db.connect_mysql()
+    assert options["read_timeout"] == db.DB_READ_TIMEOUT and options["autocommit"]
+
+
+class FakeCompletions:
+    """
+    Answers with one query_database call, then with the number of messages it was sent.
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def create(self, model, messages, tools, tool_choice):
+        self.sent.append(messages)
+        if messages[-1]["role"] == "user":
+            message = SimpleNamespace(role="assistant", content=None,
+                                      tool_calls=[tool_call("c1", "query_database", query="SELECT 1")])
+        else:
+            message = SimpleNamespace(role="assistant", content=f"{len(messages)} messages", tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_sessions_have_separate_histories(monkeypatch):
+    completions = FakeCompletions()
+    monkeypatch.setattr(mysql_agent, "get_openai_client", lambda: SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(mysql_agent, "default_system_prompt", lambda: "系统提示")
+    monkeypatch.setattr(mysql_agent, "query_database", lambda query: json.dumps({"rows": [[1]]}))
+    monkeypatch.setattr(mysql_agent, "sessions", mysql_agent.TTLCache(max_size=10, ttl=60))
+
+    # system, user, assistant tool call, tool result
+    assert mysql_agent.chat_with_agent("第一问", session_id="alice") == "4 messages"
+    assert mysql_agent.chat_with_agent("第二问", session_id="alice") == "8 messages"
+    assert mysql_agent.chat_with_agent("第一问", session_id="bob") == "4 messages"
+    history = mysql_agent.get_agent("alice").get_conversation_history()
+    assert [m["role"] for m in history] == ["system"] + ["user", "assistant", "tool", "assistant"] * 2
+    assert all(isinstance(message, dict) for sent in completions.sent for message in sent)
+
+
+def test_new_sessions_do_not_wait_for_each_other(monkeypatch):
+    monkeypatch.setattr(mysql_agent, "sessions", mysql_agent.TTLCache(max_size=10, ttl=60))
+    reading_schema, release = threading.Event(), threading.Event()
+
+    class SlowAgent:
+        def __init__(self):
+            # The first Agent is stuck reading the schema until released
+            if not reading_schema.is_set():
+                reading_schema.set()
+                release.wait(5)
+
+    monkeypatch.setattr(mysql_agent, "Agent", SlowAgent)
+    agents = []
+    alice = threading.Thread(target=lambda: agents.append(mysql_agent.get_agent("alice")))
+    alice.start()
+    assert reading_schema.wait(5)
+    bob = mysql_agent.get_agent("bob")
+    assert not release.is_set() and alice.is_alive()
+    release.set()
+    alice.join(5)
+    assert mysql_agent.get_agent("alice") is agents[0] and mysql_agent.get_agent("bob") is bob
+
+
+def test_max_execution_time_hint():
+    assert db.with_max_execution_time(" select * from t", 500) == " select /*+ MAX_EXECUTION_TIME(500) */ * from t"
+    assert db.with_max_execution_time("SELECT 1", 0) == "SELECT 1"
+
+
+if __name__ == "__main__":
+    test_max_execution_time_hint()
+    test_values_keep_their_json_types()
+    test_pool_is_bounded()
+    test_broken_connections_are_not_reused()
+    test_connections_failing_the_ping_are_replaced_and_counted()
+    print("Pool tests passed; run the agent tests with pytest.")
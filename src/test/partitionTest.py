@@ -0,0 +1,122 @@
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import chromadb
+from partition import PartitionedCollection, parse_scheme, partition_key, where_values
+from store import ReadOnlyCollection
+
+YEARS = [2019, 2020, 2021]
+
+
+def make_chunks(count=60, seed=0):
+    rng = random.Random(seed)
+    ids = [f"chunk-{i}" for i in range(count)]
+    embeddings = [[rng.random() for _ in range(8)] for _ in range(count)]
+    documents = [f"判决 {i}" for i in range(count)]
+    metadatas = [{"source": f"{i % 12}.txt", "year": YEARS[i % 12 % 3], "court": f"法院{i % 12 % 2}"}
+                 for i in range(count)]
+    return ids, embeddings, documents, metadatas
+
+
+class CountingCollection:
+    def __init__(self, collection, queried):
+        self.collection = collection
+        self.queried = queried
+
+    def query(self, **kwargs):
+        self.queried.append(self.collection.name)
+        return self.collection.query(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_fan_out_matches_a_single_collection():
+    with tempfile.TemporaryDirectory() as folder:
+        client = chromadb.PersistentClient(path=folder)
+        ids, embeddings, documents, metadatas = make_chunks()
+        single = client.get_or_create_collection("law_texts", metadata={"hnsw:space": "l2"})
+        single.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        partitioned = PartitionedCollection(client, "law_texts", "year")
+        partitioned.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        assert sorted(partitioned.partitions()) == ["2019", "2020", "2021"]
+        assert partitioned.count() == 60
+
+        queries = [embeddings[3], [0.5] * 8]
+        expected = single.query(query_embeddings=queries, n_results=5, include=["documents", "metadatas"])
+        merged = partitioned.query(query_embeddings=queries, n_results=5, include=["documents", "metadatas"])
+        assert merged["ids"] == expected["ids"]
+        assert merged["documents"] == expected["documents"]
+        assert merged["distances"][0] == sorted(merged["distances"][0])
+
+
+def test_filters_limit_the_partitions_searched():
+    with tempfile.TemporaryDirectory() as folder:
+        client = chromadb.PersistentClient(path=folder)
+        ids, embeddings, documents, metadatas = make_chunks()
+        PartitionedCollection(client, "law_texts", "year").upsert(ids=ids, embeddings=embeddings,
+                                                                   documents=documents, metadatas=metadatas)
+        queried = []
+        # A serving process: existing partitions only, wrapped read-only
+        reader = PartitionedCollection(client, "law_texts", "year", create=False,
+                                       wrap=lambda c: CountingCollection(ReadOnlyCollection(c), queried))
+        where = {"$and": [{"year": 2020}, {"case_type": "行政"}]}
+        assert where_values(where, "year") == {2020}
+        reader.query(query_embeddings=[[0.5] * 8], n_results=3, where={"year": 2020})
+        assert queried == ["law_texts__year_2020"]
+        try:
+            reader.upsert(ids=["x"], embeddings=[[0.0] * 8], documents=["x"], metadatas=[{"year": 1999}])
+            raise AssertionError("a read-only reader created a partition")
+        except PermissionError:
+            pass
+
+
+def test_paging_and_dropping_partitions():
+    with tempfile.TemporaryDirectory() as folder:
+        client = chromadb.PersistentClient(path=folder)
+        ids, embeddings, documents, metadatas = make_chunks()
+        collection = PartitionedCollection(client, "law_texts", "shard:4")
+        collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        # All chunks of a source file are in the same shard
+        for source in {metadata["source"] for metadata in metadatas}:
+            found = collection.get(where={"source": source}, include=["metadatas"])
+            assert {partition_key("shard", 4, m["source"]) for m in found["metadatas"]} == {partition_key("shard", 4, source)}
+
+        paged, offset = [], 0
+        while True:
+            page = collection.get(limit=7, offset=offset, include=[])
+            if not page["ids"]:
+                break
+            paged.extend(page["ids"])
+            offset += len(page["ids"])
+        assert sorted(paged) == sorted(ids)
+
+        sizes = {key: partition.count() for key, partition in collection.partitions().items()}
+        dropped = sorted(sizes)[0]
+        assert collection.drop(dropped)
+        assert collection.count() == 60 - sizes[dropped]
+        assert dropped not in PartitionedCollection(client, "law_texts", "shard:4").partitions()
+
+
+def test_schemes():
+    assert parse_scheme("shard:8") == ("shard", 8)
+    assert partition_key("year", 0, 2020) == "2020"
+    assert partition_key("court", 0, None) == "unknown"
+    assert len(partition_key("court", 0, "河南省高级人民法院")) == 12
+    for scheme in ("shard:0", "month"):
+        try:
+            parse_scheme(scheme)
+            raise AssertionError(f"accepted {scheme}")
+        except ValueError:
+            pass
+
+
+if __name__ == "__main__":
+    test_schemes()
+    test_fan_out_matches_a_single_collection()
+    test_filters_limit_the_partitions_searched()
+    test_paging_and_dropping_partitions()
+    print("Partition tests passed.")
@@ -0,0 +1,78 @@
+import os
+import sys
+from types import SimpleNamespace
+
+os.environ["WARMUP_ON_STARTUP"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sentence_transformers
+import query
+from rerank import Reranker
+from timing import start_request
+
+
+class FakeCrossEncoder:
+    """
+    Scores a pair by how many of the question's characters occur in the text; records every predict.
+    """
+
+    def __init__(self, model_name, device):
+        self.calls = []
+
+    def predict(self, pairs, batch_size):
+        self.calls.append(list(pairs))
+        return [float(sum(char in text for char in question)) for question, text in pairs]
+
+
+def candidates(*texts):
+    return ([f"id-{text}" for text in texts], list(texts), [{"source": f"{text}.txt"} for text in texts])
+
+
+def make_reranker(monkeypatch):
+    monkeypatch.setattr(sentence_transformers, "CrossEncoder", FakeCrossEncoder)
+    return Reranker("fake", batch_size=8, cache_size=100)
+
+
+def test_candidates_are_reordered_and_cut(monkeypatch):
+    reranker = make_reranker(monkeypatch)
+    (ranked,), elapsed_ms = reranker.rerank_batch(["征地补偿"], [candidates("买卖合同", "征地补偿款", "补偿")], top_k=2)
+    assert ranked == (["id-征地补偿款", "id-补偿"], ["征地补偿款", "补偿"], [{"source": "征地补偿款.txt"}, {"source": "补偿.txt"}])
+    assert elapsed_ms >= 0
+
+
+def test_one_predict_per_call_and_cached_scores(monkeypatch):
+    reranker = make_reranker(monkeypatch)
+    reranker.rerank_batch(["征地", "合同"], [candidates("征地补偿", "劳动"), candidates("买卖合同", "征地")], top_k=1)
+    assert reranker.model.calls == [[("征地", "征地补偿"), ("征地", "劳动"), ("合同", "买卖合同"), ("合同", "征地")]]
+    # Only the new (question, chunk id) pair is scored
+    (ranked,), _ = reranker.rerank_batch(["征地"], [candidates("劳动", "征地补偿", "征地拆迁")], top_k=3)
+    assert reranker.model.calls[1:] == [[("征地", "征地拆迁")]]
+    assert ranked[0] == ["id-征地补偿", "id-征地拆迁", "id-劳动"]
+    reranker.rerank_batch(["征地"], [candidates("征地补偿", "劳动")], top_k=1)
+    assert len(reranker.model.calls) == 2
+
+
+def test_rerank_time_is_in_the_request_timings(monkeypatch):
+    reranker = make_reranker(monkeypatch)
+    collection_calls = []
+
+    def collection_query(query_embeddings, n_results, where, include):
+        collection_calls.append(n_results)
+        return {"ids": [["id-劳动", "id-征地补偿"]], "documents": [["劳动", "征地补偿"]], "metadatas": [[{}, {}]]}
+
+    monkeypatch.setattr(query, "RERANK_ENABLED", True)
+    monkeypatch.setattr(query, "RERANK_TOP_K", 1)
+    monkeypatch.setattr(query, "HYBRID_SEARCH", False)
+    monkeypatch.setattr(query, "encode_questions", lambda questions: [[0.0] for _ in questions])
+    monkeypatch.setattr(query, "get_collection", lambda: SimpleNamespace(query=collection_query))
+    monkeypatch.setattr(query, "get_reranker", lambda: reranker)
+    timings = start_request()
+    assert query.retrieve("征地补偿") == (["id-征地补偿"], ["征地补偿"], [{}])
+    # Candidates are over-fetched for the reranker
+    assert collection_calls == [query.RERANK_CANDIDATES]
+    assert "rerank_ms" in timings and "vector_search_ms" in timings
+
+
+if __name__ == "__main__":
+    # The tests need pytest's monkeypatch fixture
+    import pytest
+    sys.exit(pytest.main(["-q", __file__]))
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache import TTLCache
+from embedding import ingestion_lock
+from lexical import LexicalIndex
+from store import ReadOnlyCollection
+
+
+def test_read_only_collection_rejects_writes():
+    collection = ReadOnlyCollection(SimpleNamespace(count=lambda: 3, upsert=lambda **kwargs: None))
+    assert collection.count() == 3
+    try:
+        collection.upsert(ids=["a"], documents=["text"])
+        raise AssertionError("upsert went through")
+    except PermissionError:
+        pass
+
+
+def test_read_only_lexical_index_sees_ingested_documents():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "lexical.sqlite3")
+        try:
+            LexicalIndex(path, read_only=True)
+            raise AssertionError("opened an index that does not exist")
+        except sqlite3.OperationalError:
+            pass
+        writer = LexicalIndex(path)
+        writer.add(["a"], ["（2020）豫行终3143号"], ["a.txt"])
+        reader = LexicalIndex(path, read_only=True)
+        assert reader.search("豫行终3143号", 1)[0][0] == "a"
+        writer.add(["b"], ["南阳市人民政府"], ["b.txt"])
+        assert reader.search("南阳", 1)[0][0] == "b"
+        try:
+            reader.clear()
+            raise AssertionError("read-only index was cleared")
+        except sqlite3.OperationalError:
+            pass
+        assert reader.count() == 2
+
+
+def test_only_one_ingestion_at_a_time():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "ingest.lock")
+        with ingestion_lock(path):
+            try:
+                with ingestion_lock(path):
+                    raise AssertionError("lock was taken twice")
+            except RuntimeError:
+                pass
+        with ingestion_lock(path):
+            pass
+
+
+def test_disk_cache_reconnects_after_fork():
+    with tempfile.TemporaryDirectory() as folder:
+        cache = TTLCache(max_size=10, ttl=60, sqlite_path=os.path.join(folder, "cache.sqlite3"))
+        cache.set("parent", 1)
+        pid = os.fork()
+        if pid == 0:
+            # The child must not share the parent's SQLite connection
+            cache._entries.clear()
+            ok = cache.get("parent") == 1 and cache._pid == os.getpid()
+            cache.set("child", 2)
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        cache._entries.clear()
+        assert cache.get("child") == 2
+
+
+if __name__ == "__main__":
+    test_read_only_collection_rejects_writes()
+    test_read_only_lexical_index_sees_ingested_documents()
+    test_only_one_ingestion_at_a_time()
+    test_disk_cache_reconnects_after_fork()
+    print("Serving tests passed.")
@@ -0,0 +1,131 @@
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import chromadb
+import numpy as np
+import embedding
+from lexical import LexicalIndex
+from parents import ParentStore
+from snapshot import Snapshot, SnapshotWriter, matches_where
+
+
+def make_collection(client, count=300, dimension=16, seed=0):
+    rng = np.random.default_rng(seed)
+    collection = client.get_or_create_collection("law_texts")
+    collection.upsert(
+        ids=[f"chunk-{i}" for i in range(count)],
+        embeddings=rng.random((count, dimension), dtype=np.float32),
+        documents=[f"判决 {i}" for i in range(count)],
+        metadatas=[{"source": f"{i % 7}.txt", "year": 2019 + i % 3, "court": f"法院{i % 2}"} for i in range(count)]
+    )
+    return collection
+
+
+def write_snapshot(collection, path, dtype="float32"):
+    writer = SnapshotWriter(path, collection.count(), dtype)
+    while True:
+        page = collection.get(limit=64, offset=writer.rows, include=["documents", "metadatas", "embeddings"])
+        if not page["ids"]:
+            break
+        writer.add(page["ids"], page["documents"], page["metadatas"], page["embeddings"])
+    writer.close({"model": "test"})
+    return Snapshot(path)
+
+
+def test_exact_search_matches_chroma():
+    with tempfile.TemporaryDirectory() as folder:
+        collection = make_collection(chromadb.PersistentClient(path=folder))
+        snapshot = write_snapshot(collection, os.path.join(folder, "snapshot"))
+        assert snapshot.count() == 300
+        assert snapshot.embeddings.dtype == np.float32 and isinstance(snapshot.embeddings, np.memmap)
+
+        queries = np.random.default_rng(1).random((4, 16)).tolist()
+        for where in (None, {"year": 2020}, {"$and": [{"court": "法院1"}, {"source": {"$in": ["1.txt", "3.txt"]}}]}):
+            expected = collection.query(query_embeddings=queries, n_results=5, where=where)
+            found = snapshot.query(queries, n_results=5, where=where)
+            assert found["ids"] == expected["ids"]
+            assert np.allclose(found["distances"], expected["distances"], rtol=1e-4)
+            assert found["metadatas"] == expected["metadatas"]
+
+        # Fewer matching rows than n_results
+        assert len(snapshot.query(queries[:1], n_results=5, where={"source": "missing.txt"})["ids"][0]) == 0
+        assert snapshot.get(ids=["chunk-3", "nope"], include=["documents"])["documents"] == ["判决 3"]
+
+
+def test_float16_snapshot_is_close():
+    with tempfile.TemporaryDirectory() as folder:
+        collection = make_collection(chromadb.PersistentClient(path=folder))
+        full = write_snapshot(collection, os.path.join(folder, "full"))
+        half = write_snapshot(collection, os.path.join(folder, "half"), "float16")
+        assert half.embeddings.dtype == np.float16
+        assert os.path.getsize(os.path.join(folder, "half", "embeddings.npy")) < \
+            os.path.getsize(os.path.join(folder, "full", "embeddings.npy")) * 0.6
+        queries = np.random.default_rng(2).random((20, 16)).tolist()
+        exact, approximate = full.query(queries, n_results=10), half.query(queries, n_results=10)
+        overlap = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(exact["ids"], approximate["ids"])])
+        assert overlap >= 0.9
+
+
+def test_export_import_round_trip(monkeypatch):
+    with tempfile.TemporaryDirectory() as folder:
+        source_client = chromadb.PersistentClient(path=os.path.join(folder, "source"))
+        target_client = chromadb.PersistentClient(path=os.path.join(folder, "target"))
+        collection = make_collection(source_client)
+        parents = ParentStore(os.path.join(folder, "parents.sqlite3"))
+        parents.add([("p1", "1.txt", "本院认为", 0, "本院认为，上诉理由不能成立。")])
+        manifest_path = os.path.join(folder, "manifest.json")
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"1.txt": {"sha256": "abc", "chunks": 43}}, f)
+        monkeypatch.setattr(embedding, "MANIFEST_PATH", manifest_path)
+        monkeypatch.setattr(embedding, "EMBEDDING_MODEL", "test-model")
+        monkeypatch.setattr(embedding, "get_collection", lambda: collection)
+        monkeypatch.setattr(embedding, "get_parent_store", lambda: parents)
+        assert embedding.export_snapshot(os.path.join(folder, "snapshot")) == 300
+        assert not os.path.exists(os.path.join(folder, "snapshot.tmp"))
+
+        # Restore into an empty store on "another machine"
+        os.remove(manifest_path)
+        target = target_client.get_or_create_collection("law_texts")
+        lexical = LexicalIndex(os.path.join(folder, "lexical.sqlite3"))
+        restored_parents = ParentStore(os.path.join(folder, "restored.sqlite3"))
+        monkeypatch.setattr(embedding, "get_client", lambda: target_client)
+        monkeypatch.setattr(embedding, "get_collection", lambda: target)
+        monkeypatch.setattr(embedding, "get_lexical_index", lambda: lexical)
+        monkeypatch.setattr(embedding, "get_parent_store", lambda: restored_parents)
+        assert embedding.import_snapshot(os.path.join(folder, "snapshot"), batch_size=128) == 300
+        assert target.count() == 300 and lexical.count() == 300
+        assert restored_parents.rows() == parents.rows()
+        assert embedding.load_manifest() == {"1.txt": {"sha256": "abc", "chunks": 43}}
+        before = collection.get(ids=["chunk-7"], include=["embeddings", "metadatas"])
+        after = target.get(ids=["chunk-7"], include=["embeddings", "metadatas"])
+        assert np.array_equal(before["embeddings"], after["embeddings"])
+        assert after["metadatas"] == before["metadatas"]
+
+        monkeypatch.setattr(embedding, "EMBEDDING_MODEL", "another-model")
+        try:
+            embedding.import_snapshot(os.path.join(folder, "snapshot"))
+            raise AssertionError("imported embeddings of another model")
+        except ValueError:
+            pass
+
+
+def test_where_clauses():
+    metadata = {"court": "法院1", "year": 2020}
+    assert matches_where(metadata, {"$and": [{"year": {"$in": [2020, 2021]}}, {"court": "法院1"}]})
+    assert matches_where(metadata, {"$or": [{"year": 2019}, {"court": {"$ne": "法院2"}}]})
+    assert not matches_where(metadata, {"year": {"$nin": [2020]}})
+    try:
+        matches_where(metadata, {"year": {"$gt": 2019}})
+        raise AssertionError("accepted an unsupported operator")
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    test_exact_search_matches_chroma()
+    test_float16_snapshot_is_close()
+    test_where_clauses()
+    print("Snapshot tests passed; run the round-trip test with pytest.")
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+
+os.environ["WARMUP_ON_STARTUP"] = "0"
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC)
+import numpy as np
+from fastapi.testclient import TestClient
+import query
+
+
+def test_imports_load_nothing():
+    # In a fresh interpreter, since other tests may have loaded resources in this one
+    with tempfile.TemporaryDirectory() as folder:
+        env = dict(os.environ, WARMUP_ON_STARTUP="0", PRELOAD_MODEL="0", CHROMA_PATH=folder)
+        output = subprocess.run(
+            [sys.executable, "-c", "import query, embedding, store, sys; "
+                                   "print(store.model_loaded(), store.collection_loaded(), 'torch' in sys.modules)"],
+            cwd=SRC, env=env, capture_output=True, text=True, check=True
+        ).stdout.split()
+        assert output == ["False", "False", "False"]
+        # Nothing was created on disk either
+        assert os.listdir(folder) == []
+
+
+def test_ready_only_after_warmup(monkeypatch):
+    searched = []
+    model = SimpleNamespace(encode=lambda texts: np.zeros((len(texts), 4)))
+    collection = SimpleNamespace(query=lambda **kwargs: searched.append(kwargs) or {"ids": [[]]})
+    monkeypatch.setattr(query, "_ready", threading.Event())
+    monkeypatch.setattr(query, "startup_timings", {"import_s": 0.1})
+    monkeypatch.setattr(query, "get_model", lambda: model)
+    monkeypatch.setattr(query, "get_collection", lambda: collection)
+    monkeypatch.setattr(query, "get_lexical_index", lambda: None)
+    monkeypatch.setattr(query, "get_prompt_template", lambda: None)
+    client = TestClient(query.app)
+    assert client.get("/health/live").status_code == 200
+    response = client.get("/health/ready")
+    assert response.status_code == 503 and response.json()["status"] == "warming up"
+
+    timings = query.warmup()
+    assert "first_inference_s" in timings and "first_search_s" in timings and len(searched) == 1
+    response = client.get("/health/ready")
+    assert response.status_code == 200 and response.json()["startup"]["import_s"] == 0.1
+    # A second warm-up does nothing
+    query.warmup()
+    assert len(searched) == 1
+
+
+if __name__ == "__main__":
+    # The readiness test needs pytest's monkeypatch fixture
+    import pytest
+    sys.exit(pytest.main(["-q", __file__]))
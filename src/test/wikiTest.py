@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agent"))
+import wiki
+from cache import TTLCache
+from wiki import OnlineBackend, SnapshotBackend, WikipediaTool
+
+PAGES = [
+    {"title": "Supreme People's Court", "aliases": ["最高人民法院", "SPC"],
+     "summary": "The Supreme People's Court is the highest court of China. It is in Beijing. "
+                "It was founded in 1949. It hears appeals.",
+     "url": "https://en.wikipedia.org/wiki/Supreme_People%27s_Court"},
+    {"title": "Mercury", "options": ["Mercury (planet)", "Mercury (element)", "Freddie Mercury"]}
+]
+
+
+def write_snapshot(folder):
+    path = os.path.join(folder, "snapshot.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for page in PAGES:
+            f.write(json.dumps(page, ensure_ascii=False) + "\n")
+    return path
+
+
+def test_snapshot_lookups_are_cached():
+    with tempfile.TemporaryDirectory() as folder:
+        tool = WikipediaTool(SnapshotBackend(write_snapshot(folder)), TTLCache(max_size=10, ttl=60))
+        result = json.loads(tool.search("最高人民法院"))
+        assert result["success"]
+        assert result["summary"] == ("The Supreme People's Court is the highest court of China. "
+                                     "It is in Beijing. It was founded in 1949.")
+        assert result["url"].endswith("Supreme_People%27s_Court")
+        assert json.loads(tool.search("  supreme_people's   court ")) == result
+        assert tool.lookups == 2
+        # Normalizes to the previous topic, so it is served from the cache
+        assert json.loads(tool.search("Supreme People's Court")) == result
+        assert tool.lookups == 2
+
+        ambiguous = json.loads(tool.search("mercury"))
+        assert ambiguous["error"] == "Disambiguation error" and len(ambiguous["options"]) == 3
+        assert json.loads(tool.search("无此条目"))["error"] == "Page not found"
+        tool.search("无此条目")
+        assert tool.lookups == 4
+
+
+def test_cache_survives_restarts():
+    with tempfile.TemporaryDirectory() as folder:
+        backend = SnapshotBackend(write_snapshot(folder))
+        cache_path = os.path.join(folder, "wikipedia.sqlite3")
+        WikipediaTool(backend, TTLCache(max_size=10, ttl=60, sqlite_path=cache_path, table="wikipedia")).search("SPC")
+        restarted = WikipediaTool(backend, TTLCache(max_size=10, ttl=60, sqlite_path=cache_path, table="wikipedia"))
+        assert json.loads(restarted.search("SPC"))["success"]
+        assert restarted.lookups == 0
+
+
+def test_online_backend_resolves_the_page_once(monkeypatch):
+    calls = []
+
+    def page(title, auto_suggest=True, redirect=True):
+        calls.append(title)
+        return SimpleNamespace(title="Beijing", url="https://en.wikipedia.org/wiki/Beijing",
+                               summary="Beijing is the capital of China. It is a megacity. It has 21 million people. More.")
+
+    monkeypatch.setattr(wiki.wikipedia, "page", page)
+    monkeypatch.setattr(wiki.wikipedia, "summary", lambda *args, **kwargs: 1 / 0)
+    tool = WikipediaTool(OnlineBackend(), TTLCache(max_size=10, ttl=60))
+    result = json.loads(tool.search("Peking"))
+    assert result["summary"] == "Beijing is the capital of China. It is a megacity. It has 21 million people."
+    tool.search("peking")
+    assert calls == ["Peking"]
+
+
+def test_failures_are_not_cached(monkeypatch):
+    def page(title, auto_suggest=True, redirect=True):
+        raise ConnectionError("offline")
+
+    monkeypatch.setattr(wiki.wikipedia, "page", page)
+    tool = WikipediaTool(OnlineBackend(), TTLCache(max_size=10, ttl=60))
+    assert json.loads(tool.search("Beijing"))["error"] == "Unexpected error"
+    tool.search("Beijing")
+    assert tool.lookups == 2
+
+
+if __name__ == "__main__":
+    test_snapshot_lookups_are_cached()
+    test_cache_survives_restarts()
+    print("Wikipedia tool tests passed.")
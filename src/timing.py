@@ -0,0 +1,63 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+from metrics import STAGE_SECONDS
+
+# Stage timings (milliseconds) of the request being served; None outside a request
+_request_timings: contextvars.ContextVar = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request() -> Dict[str, float]:
+    """
+    Starts collecting stage timings for the current request and returns the dict they
+    are written to. Threads started through run_in_threadpool inherit it.
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+def current_timings() -> Optional[Dict[str, float]]:
+    return _request_timings.get()
+
+def record(name: str, seconds: float):
+    """
+    Observes seconds in the rag_stage_seconds histogram and adds them to the
+    "<name>_ms" timing of the current request, if any.
+    """
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        key = f"{name}_ms"
+        timings[key] = round(timings.get(key, 0.0) + seconds * 1000, 3)
+
+@contextmanager
+def stage(name: str):
+    """
+    Times the enclosed block as pipeline stage name.
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started_at)
+
+def timed_iter(name: str, iterable: Iterable) -> Iterator:
+    """
+    Yields the items of iterable, timing the wait for each one as stage name.
+    """
+    iterator = iter(iterable)
+    while True:
+        started_at = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record(name, time.perf_counter() - started_at)
+        yield item
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """
+    Formats timings as a Server-Timing header value, e.g. "encode;dur=5.9, llm;dur=812.4".
+    """
+    return ", ".join(f"{key.removesuffix('_ms')};dur={ms}" for key, ms in timings.items())